@@ -0,0 +1,137 @@
+"""
+Benchmark the logging cost per request on the event loop.
+
+Each simulated request makes the router's log calls for a signup and a
+lookup, formatting the request payload and a full row, with --concurrency
+requests interleaved on one event loop. Output goes to a temporary file so
+synchronous modes pay for real writes. For queued modes the time the
+listener thread needed to drain the backlog is reported separately; it is
+off the event loop. --write-latency-us stalls every write, as a slow disk
+or a log shipper that stops reading stderr would.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 20000 --concurrency 100 --write-latency-us 50
+"""
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+from datetime import datetime
+
+import common  # noqa: F401  (puts src/ on the path)
+from waitlist_service import logs
+from waitlist_service.logs import SAMPLED
+from waitlist_service.schemas import WaitlistCreate
+
+logger = logging.getLogger("waitlist_service.router")
+
+ROW = {
+    "id": 42,
+    "name": "Bench User",
+    "email": "bench@example.com",
+    "comments": "Looking forward to it",
+    "referral_source": "newsletter",
+    "ip_address": "203.0.113.7",
+    "is_active": True,
+    "referred_by": None,
+    "referral_count": 0,
+    "created_at": datetime(2026, 1, 1),
+    "updated_at": datetime(2026, 1, 1),
+}
+
+
+class SlowStream:
+    """File wrapper whose writes block for a fixed time."""
+
+    def __init__(self, file, latency: float):
+        self.file = file
+        self.latency = latency
+
+    def write(self, text: str) -> int:
+        time.sleep(self.latency)
+        return self.file.write(text)
+
+    def flush(self) -> None:
+        self.file.flush()
+
+
+async def eager_request(entry: WaitlistCreate) -> None:
+    """The log calls as the router made them before: f-strings formatted even when filtered."""
+    logger.info(f"Creating entry: {entry.model_dump()}")
+    logger.info(f"Client IP address: {ROW['ip_address']}")
+    await asyncio.sleep(0)
+    logger.info(f"Inserted entry with ID: {ROW['id']}")
+    logger.info(f"Retrieving entry with ID: {ROW['id']}")
+    await asyncio.sleep(0)
+    logger.info(f"Entry found: {ROW}")
+
+
+async def lazy_request(entry: WaitlistCreate) -> None:
+    """The router's current log calls: %-style arguments, success logs marked as sampled."""
+    logger.info("Creating entry: %s", entry, extra=SAMPLED)
+    logger.debug("Client IP address: %s", ROW["ip_address"])
+    await asyncio.sleep(0)
+    logger.info("Inserted entry with ID: %s", ROW["id"], extra={**SAMPLED, "entry_id": ROW["id"]})
+    logger.info("Retrieving entry with ID: %s", ROW["id"], extra=SAMPLED)
+    await asyncio.sleep(0)
+    logger.info("Entry found: %s", ROW, extra={**SAMPLED, "entry_id": ROW["id"]})
+
+
+async def run(request, requests: int, concurrency: int) -> float:
+    entry = WaitlistCreate(name="Bench User", email="bench@example.com", comments="Looking forward to it")
+    remaining = iter(range(requests))
+
+    async def worker():
+        token = logs.request_id.set("bench")
+        for _ in remaining:
+            await request(entry)
+        logs.request_id.reset(token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+
+async def baseline(requests: int, concurrency: int) -> float:
+    async def request(entry):
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    return await run(request, requests, concurrency)
+
+
+async def main(args):
+    modes = [
+        ("f-string, text", eager_request, dict(level="INFO", format="text", use_queue=False, sample_rate=1)),
+        ("lazy, text", lazy_request, dict(level="INFO", format="text", use_queue=False, sample_rate=1)),
+        ("lazy, json", lazy_request, dict(level="INFO", format="json", use_queue=False, sample_rate=1)),
+        ("lazy, json + queue", lazy_request, dict(level="INFO", format="json", use_queue=True, sample_rate=1)),
+        ("lazy, json + queue, 10%", lazy_request, dict(level="INFO", format="json", use_queue=True, sample_rate=0.1)),
+        ("f-string, WARNING level", eager_request, dict(level="WARNING", format="text", use_queue=False, sample_rate=1)),
+        ("lazy, WARNING level", lazy_request, dict(level="WARNING", format="text", use_queue=False, sample_rate=1)),
+    ]
+    empty = await baseline(args.requests, args.concurrency)
+
+    print(f"{'mode':<28}{'loop us/request':>17}{'drain ms':>10}{'lines':>9}")
+    for label, request, config in modes:
+        with tempfile.TemporaryFile("w+") as output:
+            stream = SlowStream(output, args.write_latency_us / 1e6) if args.write_latency_us else output
+            logs.configure_logging(stream=stream, **config)
+            elapsed = await run(request, args.requests, args.concurrency)
+            drained = time.perf_counter()
+            logs.stop_listener()
+            drain = time.perf_counter() - drained
+            output.flush()
+            output.seek(0)
+            lines = sum(1 for _ in output)
+        us = (elapsed - empty) / args.requests * 1e6
+        print(f"{label:<28}{us:>17.2f}{drain * 1000:>10.1f}{lines:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--write-latency-us", type=float, default=0)
+    asyncio.run(main(parser.parse_args()))
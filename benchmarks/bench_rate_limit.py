@@ -0,0 +1,86 @@
+"""
+Benchmark the per-request overhead of the rate limiting middleware.
+
+Requests go straight through the ASGI middleware to a no-op app, so the
+numbers are the middleware's own cost. Each signup comes from a new IP and
+domain, the worst case for the in-memory store.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --requests 100000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import common  # noqa: F401  (puts src/ on the path)
+from waitlist_service.ratelimit import Limit, MemoryLimitStore, RateLimiter, RateLimitMiddleware
+
+SIGNUP_PATH = "/waitlist/waitlist/"
+
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 201, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def send(message):
+    pass
+
+
+def make_requests(requests: int, method: str):
+    scopes = []
+    for i in range(requests):
+        body = json.dumps({"name": "Bench User", "email": f"user{i}@domain{i}.example"}).encode()
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": SIGNUP_PATH,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"x-forwarded-for", f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}".encode()),
+            ],
+            "client": ("172.16.0.1", 50000),
+        }
+        scopes.append((scope, body))
+    return scopes
+
+
+async def run(label: str, app, scopes) -> dict:
+    started = time.perf_counter()
+    for scope, body in scopes:
+        async def receive(body=body):
+            return {"type": "http.request", "body": body, "more_body": False}
+        await app(scope, receive, send)
+    elapsed = time.perf_counter() - started
+    return {"label": label, "us": elapsed / len(scopes) * 1e6}
+
+
+async def main(args):
+    limiter = RateLimiter(
+        MemoryLimitStore(),
+        ip_limit=Limit(60, 5),
+        domain_limit=Limit(60, 5),
+        allowlist="127.0.0.1",
+        domain_allowlist="",
+    )
+    middleware = RateLimitMiddleware(noop_app, limiter, SIGNUP_PATH)
+    signups = make_requests(args.requests, "POST")
+    reads = make_requests(args.requests, "GET")
+
+    results = [
+        await run("no middleware", noop_app, signups),
+        await run("GET through middleware", middleware, reads),
+        await run("signup (IP + domain)", middleware, signups),
+    ]
+    baseline = results[0]["us"]
+    print(f"{'run':<28}{'us/request':>12}{'overhead us':>14}")
+    for result in results:
+        print(f"{result['label']:<28}{result['us']:>12.2f}{result['us'] - baseline:>14.2f}")
+    print(f"\n{len(limiter.store)} buckets held, {limiter.rejected} requests rejected")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+Benchmark signup throughput with and without referral crediting.
+
+Referred signups increment their referrer's counter in the signup's
+transaction. With few --referrers every signup updates the same hot rows.
+
+Usage:
+    python benchmarks/bench_referral_signups.py --rows 2000 --concurrency 20
+    python benchmarks/bench_referral_signups.py --referrers 1 --boost-seconds 60
+"""
+import argparse
+import asyncio
+import time
+
+from databases import Database
+from sqlalchemy import func, select
+
+from common import prepare_database, print_results, summarize
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.queries import insert_returning, waitlist_table
+from waitlist_service.referrals import credit_referrals
+
+
+async def run(label: str, write, rows: int, concurrency: int, referrers) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def signup(i: int):
+        values = {
+            "name": f"Bench User {i}",
+            "email": f"{label}-{i}@bench.example.com",
+            "ip_address": "127.0.0.1",
+            "referral_source": "benchmark",
+        }
+        if referrers:
+            values["referred_by"] = referrers[i % len(referrers)]
+        async with semaphore:
+            start = time.perf_counter()
+            await write(values)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(signup(i) for i in range(rows)))
+    return summarize(label, latencies, time.perf_counter() - started)
+
+
+async def main(args):
+    database_url = prepare_database(args.database_url)
+    async with Database(database_url) as database:
+        referrers = [
+            (await insert_returning(database, {"name": "Referrer", "email": f"referrer-{i}@bench.example.com"}))["id"]
+            for i in range(args.referrers)
+        ]
+
+        async def per_request(values):
+            async with database.transaction():
+                row = await insert_returning(database, values)
+                await credit_referrals(database, [row], boost_seconds=args.boost_seconds)
+
+        batcher = SignupBatcher(database, window_ms=args.window_ms, max_rows=args.max_rows)
+        results = [
+            await run("per-request", per_request, args.rows, args.concurrency, []),
+            await run("per-request referred", per_request, args.rows, args.concurrency, referrers),
+            await run("batched", batcher.submit, args.rows, args.concurrency, []),
+            await run("batched referred", batcher.submit, args.rows, args.concurrency, referrers),
+        ]
+        await batcher.close()
+
+        credited = await database.fetch_val(
+            select(func.sum(waitlist_table.c.referral_count)).where(waitlist_table.c.id.in_(referrers))
+        )
+    print_results(results)
+    print(f"\n{credited} referrals credited to {args.referrers} referrers (expected {2 * args.rows})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Async database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--referrers", type=int, default=10, help="Distinct referrers the referred signups cycle through")
+    parser.add_argument("--boost-seconds", type=float, default=0)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-rows", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""
+Benchmark response serialization: response-model validation versus writing rows directly.
+
+Two FastAPI routes return the same pre-fetched rows, one through
+`response_model=WaitlistEntry` as the router does by default and one
+through the FAST_SERIALIZATION path. Requests go straight to the ASGI app,
+so the numbers cover routing and serialization only, not the database.
+
+Usage:
+    python benchmarks/bench_serialization.py --sizes 1,100,10000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import common  # noqa: F401  (puts src/ on the path)
+from fastapi import FastAPI
+from waitlist_service import serialization
+from waitlist_service.schemas.waitlist import WaitlistEntry
+from waitlist_service.serialization import entries_response, entry_response
+
+
+def make_rows(count: int) -> List[dict]:
+    started = datetime(2026, 1, 1)
+    return [
+        {
+            "id": i + 1,
+            "waitlist": "default",
+            "name": f"Bench User {i}",
+            "email": f"user{i}@bench.example.com",
+            "ip_address": "203.0.113.7",
+            "comment": "Looking forward to it" if i % 2 else None,
+            "referral_source": "newsletter",
+            "created_at": started + timedelta(seconds=i, microseconds=i),
+            "is_active": True,
+            "queue_at": None,
+            "referred_by": None,
+            "referral_count": i % 5,
+        }
+        for i in range(count)
+    ]
+
+
+def make_app(rows: List[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/model/list", response_model=List[WaitlistEntry])
+    async def model_list():
+        return rows
+
+    @app.get("/fast/list", response_model=List[WaitlistEntry])
+    async def fast_list():
+        return entries_response(rows)
+
+    @app.get("/model/one", response_model=WaitlistEntry)
+    async def model_one():
+        return rows[0]
+
+    @app.get("/fast/one", response_model=WaitlistEntry)
+    async def fast_one():
+        return entry_response(rows[0])
+
+    return app
+
+
+async def request(app: FastAPI, path: str) -> int:
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "path": path, "raw_path": path.encode(),
+        "root_path": "", "scheme": "http", "query_string": b"", "headers": [], "server": ("bench", 80),
+        "client": ("127.0.0.1", 1),
+    }
+    await app(scope, receive, send)
+    return size
+
+
+async def measure(app: FastAPI, path: str, repeat: int) -> tuple:
+    size = await request(app, path)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await request(app, path)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), size
+
+
+async def main(args):
+    encoder = "orjson" if serialization.orjson is not None else "json (orjson not installed)"
+    print(f"encoder: {encoder}")
+    print(f"{'response':<20}{'model ms':>12}{'fast ms':>12}{'speedup':>10}{'bytes':>12}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        app = make_app(make_rows(size))
+        kind = "one" if size == 1 else "list"
+        repeat = max(5, min(2000, 200000 // size))
+        model, body = await measure(app, f"/model/{kind}", repeat)
+        fast, fast_body = await measure(app, f"/fast/{kind}", repeat)
+        assert body == fast_body, "responses differ in size"
+        label = "single entry" if size == 1 else f"list of {size}"
+        print(f"{label:<20}{model:>12.3f}{fast:>12.3f}{model / fast:>9.1f}x{body:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,100,10000", help="Comma-separated response sizes; 1 is a single entry")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,65 @@
+"""
+Benchmark signup throughput with and without the micro-batched writer.
+
+Usage:
+    python benchmarks/bench_signup_batching.py --rows 5000 --concurrency 200
+    python benchmarks/bench_signup_batching.py --window-ms 2 --max-rows 50
+"""
+import argparse
+import asyncio
+import time
+
+from databases import Database
+
+from common import prepare_database, print_results, summarize
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.queries import insert_returning
+
+
+async def run(database: Database, label: str, write, rows: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def signup(i: int):
+        values = {
+            "name": f"Bench User {i}",
+            "email": f"{label}-{i}@bench.example.com",
+            "ip_address": "127.0.0.1",
+            "referral_source": "benchmark",
+        }
+        async with semaphore:
+            start = time.perf_counter()
+            await write(values)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(signup(i) for i in range(rows)))
+    return summarize(label, latencies, time.perf_counter() - started)
+
+
+async def main(args):
+    database_url = prepare_database(args.database_url)
+    async with Database(database_url) as database:
+        batcher = SignupBatcher(database, window_ms=args.window_ms, max_rows=args.max_rows)
+        results = [
+            await run(
+                database, "per-request", lambda values: insert_returning(database, values),
+                args.rows, args.concurrency,
+            ),
+            await run(
+                database, f"batched ({args.window_ms}ms/{args.max_rows})", batcher.submit,
+                args.rows, args.concurrency,
+            ),
+        ]
+        await batcher.close()
+    print_results(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Async database URL (defaults to a temporary SQLite file)")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--window-ms", type=float, default=5)
+    parser.add_argument("--max-rows", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""
+Shared setup for the benchmark scripts.
+"""
+import os
+import statistics
+import sys
+import tempfile
+from typing import List, Optional
+
+from sqlalchemy import create_engine, select
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from waitlist_service.database import Base  # noqa: E402
+
+
+def prepare_database(database_url: Optional[str] = None) -> str:
+    """Recreate the waitlist tables and return the async URL to benchmark against.
+
+    Defaults to a fresh SQLite file in a temporary directory.
+    """
+    if not database_url:
+        path = os.path.join(tempfile.mkdtemp(), "bench.db")
+        database_url = f"sqlite+aiosqlite:///{path}"
+
+    sync_url = database_url.replace("+aiosqlite", "").replace("+asyncpg", "")
+    engine = create_engine(sync_url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return database_url
+
+
+def seed_entries(database_url: str, count: int, prefix: str = "seed", waitlist: str = "default") -> List[int]:
+    """Insert ``count`` entries on ``waitlist`` directly and return the IDs of every entry on it."""
+    from waitlist_service.queries import waitlist_table
+
+    sync_url = database_url.replace("+aiosqlite", "").replace("+asyncpg", "")
+    engine = create_engine(sync_url)
+    rows = [
+        {
+            "waitlist": waitlist,
+            "name": f"Seed User {i}",
+            "email": f"{prefix}-{i}@bench.example.com",
+            "ip_address": "127.0.0.1",
+            "referral_source": "seed",
+            "is_active": True,
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as connection:
+        if rows:
+            connection.execute(waitlist_table.insert(), rows)
+        query = select(waitlist_table.c.id).where(waitlist_table.c.waitlist == waitlist).order_by(waitlist_table.c.id)
+        ids = [row.id for row in connection.execute(query)]
+    engine.dispose()
+    return ids
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(label: str, latencies_ms: List[float], elapsed: float) -> dict:
+    """Throughput and latency percentiles for one benchmark run."""
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "label": label,
+        "requests": len(latencies_ms),
+        "throughput": len(latencies_ms) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies_ms) if latencies_ms else 0.0,
+        "p95_ms": percentile(latencies_ms, 95),
+        "p99_ms": percentile(latencies_ms, 99),
+    }
+
+
+def print_results(results: List[dict]) -> None:
+    """Print benchmark summaries as a table."""
+    print(f"{'run':<24}{'requests':>10}{'req/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(
+            f"{result['label']:<24}{result['requests']:>10}{result['throughput']:>12.1f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+        )
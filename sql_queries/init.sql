@@ -10,8 +10,46 @@ CREATE TABLE IF NOT EXISTS waitlist (
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
--- Create index on email for faster lookups
-CREATE INDEX IF NOT EXISTS idx_waitlist_email ON waitlist(email);
+-- Place in line when moved ahead by a referral; NULL means created_at
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS queue_at TIMESTAMP WITH TIME ZONE;
+
+-- Referrals: who referred each entry and how many signups each entry has referred
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS referred_by INTEGER;
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS referral_count INTEGER NOT NULL DEFAULT 0;
+CREATE INDEX IF NOT EXISTS idx_waitlist_referred_by ON waitlist(referred_by);
+CREATE INDEX IF NOT EXISTS idx_waitlist_referral_count ON waitlist(referral_count);
+
+-- Create index backing keyset pagination of the list endpoint
+CREATE INDEX IF NOT EXISTS idx_waitlist_created_at_id ON waitlist(created_at, id);
+
+-- Waitlists served by this table
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS waitlist VARCHAR(64) NOT NULL DEFAULT 'default';
+
+-- Canonical form of each email that duplicates are detected on; NULL until the backfill
+-- (python -m waitlist_service.email_backfill) keys rows written before it existed
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS email_key VARCHAR(255);
+
+-- Soft delete: deleted entries stay, inactive, until the archival job moves them out
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE waitlist ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
+
+-- An email, and its canonical key, may join each list once among active entries, so a deleted
+-- entry's email can sign up again; the hot indexes cover each list's active entries only.
+-- Drop the full constraints and indexes earlier versions of this script built in their place:
+-- once an email has signed up again they cannot be rebuilt.
+ALTER TABLE waitlist DROP CONSTRAINT IF EXISTS waitlist_email_key;
+DROP INDEX IF EXISTS idx_waitlist_email;
+ALTER TABLE waitlist DROP CONSTRAINT IF EXISTS uq_waitlist_waitlist_email;
+DROP INDEX IF EXISTS uq_waitlist_waitlist_email_key;
+DROP INDEX IF EXISTS idx_waitlist_waitlist_created_at_id;
+DROP INDEX IF EXISTS idx_waitlist_waitlist_referral_count;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_waitlist_active_waitlist_email ON waitlist(waitlist, email) WHERE is_active IS true;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_waitlist_active_waitlist_email_key ON waitlist(waitlist, email_key) WHERE is_active IS true;
+CREATE INDEX IF NOT EXISTS idx_waitlist_active_waitlist_created_at_id ON waitlist(waitlist, created_at, id) WHERE is_active IS true;
+CREATE INDEX IF NOT EXISTS idx_waitlist_active_waitlist_referral_count ON waitlist(waitlist, referral_count) WHERE is_active IS true;
+
+-- Create index backing the archival job's scan for entries deleted long enough ago
+CREATE INDEX IF NOT EXISTS idx_waitlist_deleted_at ON waitlist(deleted_at) WHERE is_active IS false;
 
 -- Create function to update timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -28,3 +66,71 @@ CREATE TRIGGER update_waitlist_updated_at
     BEFORE UPDATE ON waitlist
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
+
+-- Notifications written in the same transaction as the signup they announce
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id SERIAL PRIMARY KEY,
+    topic VARCHAR(64) NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+    available_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+    claimed_until TIMESTAMP,
+    attempts INTEGER DEFAULT 0,
+    last_error VARCHAR,
+    delivered_at TIMESTAMP
+);
+
+-- Create index backing the dispatcher's scan for undelivered rows
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox(delivered_at, available_at);
+
+-- Signup counters per list, hour, day and referral source ('' for none); "total" rows use the epoch
+CREATE TABLE IF NOT EXISTS signup_rollups (
+    waitlist VARCHAR(64) NOT NULL DEFAULT 'default',
+    granularity VARCHAR(8) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    referral_source VARCHAR(255) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (waitlist, granularity, bucket, referral_source)
+);
+
+-- Key existing counters by list too
+ALTER TABLE signup_rollups ADD COLUMN IF NOT EXISTS waitlist VARCHAR(64) NOT NULL DEFAULT 'default';
+ALTER TABLE signup_rollups DROP CONSTRAINT IF EXISTS signup_rollups_pkey;
+ALTER TABLE signup_rollups ADD PRIMARY KEY (waitlist, granularity, bucket, referral_source);
+
+-- Entries moved out of the waitlist table by the archival job, keeping their IDs for restores
+CREATE TABLE IF NOT EXISTS waitlist_archive (
+    id INTEGER PRIMARY KEY,
+    waitlist VARCHAR(64) NOT NULL DEFAULT 'default',
+    email VARCHAR(255) NOT NULL,
+    email_key VARCHAR(255),
+    name VARCHAR(255),
+    ip_address VARCHAR(45),
+    comment TEXT,
+    referral_source VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    is_active BOOLEAN NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE,
+    queue_at TIMESTAMP WITH TIME ZONE,
+    referred_by INTEGER,
+    referral_count INTEGER NOT NULL DEFAULT 0,
+    archived_at TIMESTAMP NOT NULL DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+);
+
+-- Create index backing the archival job's lookup of the batch it just copied
+CREATE INDEX IF NOT EXISTS idx_waitlist_archive_archived_at ON waitlist_archive(archived_at);
+
+-- Responses to signups sent with an Idempotency-Key, replayed to their retries;
+-- a row without status_code is a request still running, holding the key until expires_at
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(320) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    body TEXT,
+    created_at TIMESTAMP DEFAULT (CURRENT_TIMESTAMP AT TIME ZONE 'UTC'),
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- Create index backing the purge of expired keys
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
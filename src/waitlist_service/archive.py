@@ -0,0 +1,224 @@
+"""
+Archival of deleted and old waitlist entries, and restoring them
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table, and_, bindparam, or_, select
+from .emails import email_key
+from .models import ArchivedEntry
+from .positions import is_active
+from .prepared import statements
+from .queries import DEFAULT_WAITLIST, insert_returning, supports_returning, update_returning, waitlist_table
+from .stats import SIGNUP_STATS, record_removals, record_signups
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Archival configuration
+ARCHIVE_DELETED_AFTER_DAYS = float(os.getenv("ARCHIVE_DELETED_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+ARCHIVE_PAUSE_MS = float(os.getenv("ARCHIVE_PAUSE_MS", "0"))
+
+archive_table: Table = ArchivedEntry.__table__
+
+
+@dataclass
+class ArchiveReport:
+    """Totals for one archival run; ``active`` counts archived entries that were still in line."""
+    archived: int = 0
+    active: int = 0
+    batches: int = 0
+    elapsed_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _eligible(table: Table, deleted: bool, created: bool, scoped: bool) -> Any:
+    """Rows to archive, with ``deleted_before``, ``created_before`` and ``waitlist`` bound per run."""
+    conditions = []
+    if deleted:
+        # Entries deactivated before deleted_at existed have no time; they are old enough
+        conditions.append(
+            and_(
+                table.c.is_active.is_(False),
+                or_(table.c.deleted_at < bindparam("deleted_before"), table.c.deleted_at.is_(None)),
+            )
+        )
+    if created:
+        conditions.append(table.c.created_at < bindparam("created_before"))
+    eligible = or_(*conditions)
+    return and_(table.c.waitlist == bindparam("waitlist"), eligible) if scoped else eligible
+
+
+def _move_statements(table: Table, archive: Table, eligible: Any) -> Tuple[Any, Any]:
+    """INSERT ... SELECT copying one batch into the archive, and the DELETE removing the copied rows."""
+    # Locked until the batch commits, so a restore waits for it rather than racing it;
+    # concurrent runs skip each other's rows (PostgreSQL)
+    batch = (
+        select(table.c.id)
+        .where(eligible)
+        .order_by(table.c.id)
+        .limit(bindparam("batch_size"))
+        .with_for_update(skip_locked=True)
+    )
+    names = [column.name for column in table.c]
+    copy = archive.insert().from_select(
+        names + ["archived_at"],
+        select(*table.c, bindparam("archived_at", type_=archive.c.archived_at.type)).where(table.c.id.in_(batch)),
+    )
+    # An ID is only in both tables between these two statements
+    copied = select(archive.c.id).where(archive.c.archived_at == bindparam("archived_at"))
+    remove = table.delete().where(table.c.id.in_(copied))
+    return copy, remove
+
+
+async def archive_entries(
+    database: Database,
+    deleted_before: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    waitlist: Optional[str] = None,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    pause_ms: float = ARCHIVE_PAUSE_MS,
+    stats: bool = SIGNUP_STATS,
+    on_archived: Optional[Callable[[List[Mapping[str, Any]]], Awaitable[None]]] = None,
+    table: Table = waitlist_table,
+    archive: Table = archive_table,
+) -> ArchiveReport:
+    """Move entries deleted before ``deleted_before``, or created before ``created_before``, to the archive.
+
+    Rows move ``batch_size`` at a time, each batch copied by the database
+    with INSERT ... SELECT and deleted in its own short transaction, so
+    the waitlist table is never locked for long and signups carry on
+    between batches (``pause_ms`` apart). Only ``waitlist``'s entries move
+    when it is given. Archived entries that were still active leave the
+    line and, with ``stats``, the signup counters. ``on_archived`` gets
+    each batch once it has committed.
+    """
+    if deleted_before is None and created_before is None:
+        raise ValueError("Nothing to archive: give deleted_before, created_before or both")
+
+    shape = (deleted_before is not None, created_before is not None, waitlist is not None)
+    copy, remove = _move_statements(table, archive, _eligible(table, *shape))
+    copy = statements.get(("archive_copy", table.name, archive.name, *shape), lambda: copy)
+    returning = supports_returning(database)
+    remove = statements.get(
+        ("archive_remove", table.name, archive.name, returning),
+        lambda: remove.returning(*table.c) if returning else remove,
+    )
+    moved = archive.select().where(archive.c.archived_at == bindparam("archived_at"))
+    moved = statements.get(("archive_moved", archive.name), lambda: moved)
+    values = {"batch_size": batch_size}
+    for name, value in (("deleted_before", deleted_before), ("created_before", created_before), ("waitlist", waitlist)):
+        if value is not None:
+            values[name] = value
+
+    report = ArchiveReport()
+    started = time.perf_counter()
+    while True:
+        archived_at = datetime.utcnow()
+        async with database.transaction():
+            await copy.execute(database, **values, archived_at=archived_at)
+            if returning:
+                rows = await remove.fetch_all(database, archived_at=archived_at)
+            else:
+                rows = await moved.fetch_all(database, archived_at=archived_at)
+                await remove.execute(database, archived_at=archived_at)
+            in_line = [row for row in rows if is_active(row)]
+            if stats and in_line:
+                await record_removals(database, in_line)
+        if not rows:
+            break
+        report.archived += len(rows)
+        report.active += len(in_line)
+        report.batches += 1
+        if on_archived is not None:
+            await on_archived(rows)
+        if pause_ms > 0:
+            await asyncio.sleep(pause_ms / 1000)
+
+    report.elapsed_seconds = time.perf_counter() - started
+    logger.info(
+        f"Archived {report.archived} entries ({report.active} active) in {report.batches} batches "
+        f"in {report.elapsed_seconds:.1f}s"
+    )
+    return report
+
+
+async def restore_entry(
+    database: Database,
+    entry_id: int,
+    waitlist: str = DEFAULT_WAITLIST,
+    stats: bool = SIGNUP_STATS,
+    table: Table = waitlist_table,
+    archive: Table = archive_table,
+) -> Optional[Mapping[str, Any]]:
+    """Bring a deleted or archived entry of ``waitlist`` back into line and return it.
+
+    Returns None if no such entry is deleted or archived. An entry whose
+    email has signed up again since raises the driver's integrity error
+    and stays where it was. The entry keeps its ID, signup time and place
+    in line.
+    """
+    async with database.transaction():
+        row = await update_returning(
+            database, entry_id, {"is_active": True, "deleted_at": None}, table, waitlist, is_active=False
+        )
+        if row is None:
+            archived = await database.fetch_one(
+                archive.select().where(archive.c.id == entry_id, archive.c.waitlist == waitlist)
+            )
+            if archived is None:
+                return None
+            await database.execute(archive.delete().where(archive.c.id == entry_id))
+            values = {column.name: archived[column.name] for column in table.c}
+            values.update(is_active=True, deleted_at=None, email_key=archived["email_key"] or email_key(archived["email"]))
+            row = await insert_returning(database, values, table)
+        if stats:
+            await record_signups(database, [row])
+    return row
+
+
+async def main(args):
+    now = datetime.utcnow()
+    async with Database(args.database_url) as database:
+        report = await archive_entries(
+            database,
+            deleted_before=now - timedelta(days=args.deleted_days) if args.deleted_days is not None else None,
+            created_before=args.created_before,
+            waitlist=args.waitlist,
+            batch_size=args.batch_size,
+            pause_ms=args.pause_ms,
+        )
+    for key, value in report.as_dict().items():
+        print(f"{key:<20}{value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Move deleted and old waitlist entries to the archive table in batches"
+    )
+    parser.add_argument(
+        "--deleted-days",
+        type=float,
+        default=ARCHIVE_DELETED_AFTER_DAYS,
+        help="Archive entries deleted at least this many days ago",
+    )
+    parser.add_argument(
+        "--created-before",
+        type=datetime.fromisoformat,
+        help="Also archive entries, active or not, that signed up before this time (UTC)",
+    )
+    parser.add_argument("--waitlist", help="Only archive this list's entries")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=float, default=ARCHIVE_PAUSE_MS, help="Pause between batches")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    asyncio.run(main(parser.parse_args()))
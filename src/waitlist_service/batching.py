@@ -0,0 +1,194 @@
+"""
+Micro-batched signup writer with group commit
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from databases import Database
+from databases.interfaces import Record
+from sqlalchemy import Table
+from sqlalchemy.dialects import postgresql, sqlite
+from .queries import (
+    waitlist_table,
+    insert_returning,
+    supports_returning,
+    with_defaults,
+    DuplicateEmailError,
+    INTEGRITY_ERRORS,
+)
+from .outbox import enqueue_signups
+from .stats import record_signups
+from .referrals import credit_referrals
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Batching configuration
+SIGNUP_BATCHING = os.getenv("SIGNUP_BATCHING", "false").lower() == "true"
+SIGNUP_BATCH_WINDOW_MS = float(os.getenv("SIGNUP_BATCH_WINDOW_MS", "5"))
+SIGNUP_BATCH_MAX_ROWS = int(os.getenv("SIGNUP_BATCH_MAX_ROWS", "100"))
+
+# Dialects with INSERT ... ON CONFLICT DO NOTHING
+_UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Queue marker telling the worker to flush and exit
+_STOP = object()
+
+PendingSignup = Tuple[Dict[str, Any], asyncio.Future]
+
+
+class SignupBatcher:
+    """Collects concurrent signups and writes them with one multi-row INSERT.
+
+    A batch is flushed when ``max_rows`` signups are waiting or ``window_ms``
+    has passed since the first one arrived, whichever comes first. Each
+    caller gets its own row back, or ``DuplicateEmailError`` if the email, or
+    another with the same canonical key, is already on its list (or earlier
+    in the same batch). With ``outbox``
+    set, signup notifications are written in the same transaction, and with
+    ``stats`` set so are the signup counters. Referrers of the new rows are
+    credited in the same transaction and passed to ``on_credited`` once it
+    commits.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        window_ms: float = SIGNUP_BATCH_WINDOW_MS,
+        max_rows: int = SIGNUP_BATCH_MAX_ROWS,
+        table: Table = waitlist_table,
+        outbox: bool = False,
+        stats: bool = False,
+        on_credited: Optional[Callable[[List[Tuple[Dict[str, Any], Dict[str, Any]]]], Awaitable[None]]] = None,
+    ):
+        self.database = database
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.table = table
+        self.outbox = outbox
+        self.stats = stats
+        self.on_credited = on_credited
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, values: Dict[str, Any]) -> Record:
+        """Queue a signup and wait for its row."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((values, future))
+        return await future
+
+    async def close(self) -> None:
+        """Flush queued signups and stop the worker."""
+        if self._worker is None:
+            return
+        await self._queue.put(_STOP)
+        await self._worker
+        self._worker = None
+
+        # Signups submitted while the worker was stopping
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            await self._flush(leftover)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[PendingSignup]) -> None:
+        try:
+            if self.database.url.dialect in _UPSERT_INSERTS and supports_returning(self.database):
+                await self._write_batch(batch)
+            else:
+                await self._write_each(batch)
+        except Exception as e:
+            logger.error("Batched signup write of %s rows failed: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _write_batch(self, batch: List[PendingSignup]) -> None:
+        rows = [with_defaults(values, self.table) for values, _ in batch]
+        columns = set().union(*rows)
+        rows = [{column: row.get(column) for column in columns} for row in rows]
+        keys = [(row["waitlist"], row["email_key"]) for row in rows]
+
+        # No conflict target: a row may clash on its canonical key, or on the exact email
+        # of an older row whose key has not been backfilled yet
+        insert = _UPSERT_INSERTS[self.database.url.dialect]
+        query = insert(self.table).values(rows).on_conflict_do_nothing().returning(*self.table.c)
+        async with self.database.transaction():
+            rows = await self.database.fetch_all(query)
+            if self.outbox:
+                await enqueue_signups(self.database, rows)
+            if self.stats:
+                await record_signups(self.database, rows)
+            credited = await credit_referrals(self.database, rows)
+        inserted = {(row["waitlist"], row["email_key"]): row for row in rows}
+        logger.debug("Batched signup write: %s/%s rows inserted", len(inserted), len(batch))
+
+        for (values, future), key in zip(batch, keys):
+            row = inserted.pop(key, None)
+            if future.done():
+                continue
+            if row is None:
+                future.set_exception(DuplicateEmailError(values["email"]))
+            else:
+                future.set_result(row)
+        await self._credited(credited)
+
+    async def _credited(self, credited: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+        if credited and self.on_credited is not None:
+            try:
+                await self.on_credited(credited)
+            except Exception as e:
+                logger.error("Error handling credited referrers: %s", e)
+
+    async def _write_each(self, batch: List[PendingSignup]) -> None:
+        credited = []
+        async with self.database.transaction():
+            for values, future in batch:
+                try:
+                    # Savepoint per row so one duplicate doesn't abort the batch
+                    async with self.database.transaction():
+                        row = await insert_returning(self.database, values, self.table)
+                        if self.outbox:
+                            await enqueue_signups(self.database, [row])
+                        if self.stats:
+                            await record_signups(self.database, [row])
+                        credited += await credit_referrals(self.database, [row])
+                except INTEGRITY_ERRORS:
+                    if not future.done():
+                        future.set_exception(DuplicateEmailError(values["email"]))
+                    continue
+                if not future.done():
+                    future.set_result(row)
+        await self._credited(credited)
@@ -0,0 +1,207 @@
+"""
+Read-through cache for waitlist entry lookups
+"""
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table
+from .queries import waitlist_table, fetch_entry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache configuration: ENTRY_CACHE is "memory", "redis" or unset (no cache)
+ENTRY_CACHE = os.getenv("ENTRY_CACHE", "").lower()
+ENTRY_CACHE_TTL = float(os.getenv("ENTRY_CACHE_TTL", "60"))
+ENTRY_CACHE_NEGATIVE_TTL = float(os.getenv("ENTRY_CACHE_NEGATIVE_TTL", "10"))
+ENTRY_CACHE_MAX_SIZE = int(os.getenv("ENTRY_CACHE_MAX_SIZE", "10000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Returned by backends when the key is absent (None is a cached 404)
+MISS = object()
+
+
+class MemoryCache:
+    """In-process LRU cache with a TTL per key."""
+
+    def __init__(self, max_size: int = ENTRY_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self.evictions = 0
+        self._items: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            return MISS
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return MISS
+        self._items.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._items[key] = (time.monotonic() + ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        self._items.pop(key, None)
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RedisCache:
+    """Cache backed by any client with redis-py's asyncio ``get``/``set``/``delete``.
+
+    Values are stored as JSON, so datetimes come back as ISO strings; the
+    response models parse them again.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+        # Redis evicts on its own; see its evicted_keys stat
+        self.evictions = 0
+
+    async def get(self, key: str) -> Any:
+        raw = await self.client.get(key)
+        if raw is None:
+            return MISS
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.client.set(key, json.dumps(value, default=_json_default), px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    negative_hits: int = 0
+    stale_loads: int = 0
+    evictions: int = 0
+
+
+class EntryCache:
+    """Read-through cache of waitlist rows keyed by ID.
+
+    Missing IDs are cached as None for ``negative_ttl`` so ID scans don't
+    reach the database. Writers call ``put`` or ``invalidate`` after
+    changing a row. Each of them bumps the key's generation, and a miss
+    that read the row before the bump does not cache it, so an older row
+    never overwrites a newer one. Generations are only kept for keys
+    with a miss in flight.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        ttl: float = ENTRY_CACHE_TTL,
+        negative_ttl: float = ENTRY_CACHE_NEGATIVE_TTL,
+        table: Table = waitlist_table,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.table = table
+        self._stats = CacheStats()
+        self._loading: Dict[str, int] = {}
+        self._generations: Dict[str, int] = {}
+
+    def _key(self, entry_id: int) -> str:
+        return f"waitlist:entry:{entry_id}"
+
+    def _to_dict(self, row: Any) -> Dict[str, Any]:
+        return {column.name: row[column.name] for column in self.table.c}
+
+    async def get_entry(self, database: Database, entry_id: int) -> Optional[Dict[str, Any]]:
+        """Return the entry from the cache, loading it from the database on a miss."""
+        key = self._key(entry_id)
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Entry cache read failed: {e}")
+            cached = MISS
+        if cached is not MISS:
+            if cached is None:
+                self._stats.negative_hits += 1
+            else:
+                self._stats.hits += 1
+            return cached
+
+        self._stats.misses += 1
+        self._loading[key] = self._loading.get(key, 0) + 1
+        generation = self._generations.get(key, 0)
+        try:
+            row = await fetch_entry(database, entry_id, self.table)
+            entry = self._to_dict(row) if row is not None else None
+            # A put or invalidate while the row was read may have left something newer
+            if self._generations.get(key, 0) == generation:
+                await self._set(key, entry, self.ttl if entry is not None else self.negative_ttl)
+            else:
+                self._stats.stale_loads += 1
+        finally:
+            self._loading[key] -= 1
+            if not self._loading[key]:
+                del self._loading[key]
+                self._generations.pop(key, None)
+        return entry
+
+    def _bump(self, key: str) -> None:
+        if key in self._loading:
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    async def put(self, row: Any) -> None:
+        """Write a freshly inserted or updated row through to the cache."""
+        key = self._key(row["id"])
+        self._bump(key)
+        await self._set(key, self._to_dict(row), self.ttl)
+
+    async def invalidate(self, entry_id: int) -> None:
+        key = self._key(entry_id)
+        self._bump(key)
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            logger.error(f"Entry cache delete failed: {e}")
+
+    async def _set(self, key: str, value: Any, ttl: float) -> None:
+        try:
+            await self.backend.set(key, value, ttl)
+        except Exception as e:
+            logger.error(f"Entry cache write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        self._stats.evictions = self.backend.evictions
+        return asdict(self._stats)
+
+
+def create_entry_cache(kind: str = ENTRY_CACHE) -> Optional[EntryCache]:
+    """Build the configured entry cache, or None when caching is off."""
+    if not kind:
+        return None
+    if kind == "memory":
+        return EntryCache(MemoryCache())
+    if kind == "redis":
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise ImportError("ENTRY_CACHE=redis requires the redis package (pip install redis)") from e
+        return EntryCache(RedisCache(redis.from_url(REDIS_URL)))
+    raise ValueError(f"Unknown ENTRY_CACHE backend: {kind}")
@@ -0,0 +1,202 @@
+"""
+Chunked backfill of canonical email keys, reporting entries that collapse into one
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table, case, func, select
+from .emails import email_keys
+from .queries import INTEGRITY_ERRORS, active, waitlist_table
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Backfill configuration
+EMAIL_BACKFILL_CHUNK_SIZE = int(os.getenv("EMAIL_BACKFILL_CHUNK_SIZE", "1000"))
+EMAIL_BACKFILL_PAUSE_MS = float(os.getenv("EMAIL_BACKFILL_PAUSE_MS", "0"))
+
+# Times a chunk is re-read after a concurrent signup took one of its keys
+MAX_CHUNK_ATTEMPTS = 3
+
+
+@dataclass
+class MergeCandidate:
+    """An entry whose canonical key already belongs to another entry on its list."""
+    waitlist: str
+    email_key: str
+    entry_id: int
+    email: str
+    duplicate_of: int
+    duplicate_of_email: str
+
+
+@dataclass
+class BackfillReport:
+    """Running totals for a backfill; ``candidates`` lists every entry left without a key."""
+    scanned: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    chunks: int = 0
+    retries: int = 0
+    elapsed_seconds: float = 0.0
+    candidates: List[MergeCandidate] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class _Chunk:
+    """Assigns keys to one chunk of rows against the rows already holding them."""
+
+    def __init__(self, rows: List[Any], table: Table):
+        self.table = table
+        self.changed: List[Tuple[Any, str]] = [
+            (row, key) for row, key in zip(rows, email_keys(row["email"] for row in rows)) if row["email_key"] != key
+        ]
+
+    async def owners(self, database: Database) -> Dict[Tuple[str, str], Any]:
+        """Active rows holding any of the chunk's new keys on the same lists.
+
+        Keys are unique among active entries only, so a deleted entry holding
+        one does not stop an active entry from taking it.
+        """
+        table = self.table
+        lists = {row["waitlist"] for row, _ in self.changed}
+        keys = {key for _, key in self.changed}
+        query = select(table.c.id, table.c.waitlist, table.c.email, table.c.email_key).where(
+            table.c.waitlist.in_(lists), table.c.email_key.in_(keys), active(table)
+        )
+        return {(row["waitlist"], row["email_key"]): row for row in await database.fetch_all(query)}
+
+    async def write(self, database: Database) -> Tuple[int, List[MergeCandidate]]:
+        """Set every key that is free and report the rest; returns the rows written and the candidates."""
+        updates: Dict[int, Optional[str]] = {}
+        candidates: List[MergeCandidate] = []
+        owners = await self.owners(database)
+        for row, key in self.changed:
+            if not row["is_active"]:
+                # Clashes only once restored, which checks its key then
+                updates[row["id"]] = key
+                continue
+            owner = owners.get((row["waitlist"], key))
+            if owner is None or owner["id"] == row["id"]:
+                owners[(row["waitlist"], key)] = row
+                updates[row["id"]] = key
+                continue
+            candidates.append(
+                MergeCandidate(row["waitlist"], key, row["id"], row["email"], owner["id"], owner["email"])
+            )
+            # A key computed under older rules must not keep claiming its old slot
+            if row["email_key"] is not None:
+                updates[row["id"]] = None
+        if updates:
+            # One UPDATE ... SET email_key = CASE id ... END for the whole chunk: atomic on
+            # its own, and holding its locks only while it runs. A key taken by a signup
+            # since ``owners`` was read fails the statement and the chunk is read again.
+            table = self.table
+            query = (
+                table.update()
+                .where(table.c.id.in_(list(updates)))
+                .values(email_key=case(updates, value=table.c.id))
+            )
+            await database.execute(query)
+        return len(updates), candidates
+
+
+async def backfill_email_keys(
+    database: Database,
+    chunk_size: int = EMAIL_BACKFILL_CHUNK_SIZE,
+    pause_ms: float = EMAIL_BACKFILL_PAUSE_MS,
+    progress: Optional[Callable[[BackfillReport], None]] = None,
+    table: Table = waitlist_table,
+) -> BackfillReport:
+    """Recompute every row's ``email_key`` in ID order, ``chunk_size`` rows at a time.
+
+    Only rows whose key is missing or out of date are written, with one
+    UPDATE by primary key per chunk, so locks are held on at most one
+    chunk's rows at a time and signups carry on between chunks
+    (``pause_ms`` apart). A row whose key already belongs to another
+    entry on its list is left without one and reported as a merge
+    candidate; the first active entry to claim a key keeps it, and
+    deleted entries never hold one against the rest. Safe to re-run,
+    e.g. after changing the normalization rules.
+    """
+    report = BackfillReport()
+    started = time.perf_counter()
+    after = 0
+    # Rows inserted from here on get their key on the way in; stop at the last one before
+    # them rather than chasing new signups
+    last = await database.fetch_val(select(func.max(table.c.id))) or 0
+    columns = (table.c.id, table.c.waitlist, table.c.email, table.c.email_key, table.c.is_active)
+    while True:
+        query = select(*columns).where(table.c.id > after, table.c.id <= last).order_by(table.c.id).limit(chunk_size)
+        rows = await database.fetch_all(query)
+        if not rows:
+            break
+        after = rows[-1]["id"]
+        chunk = _Chunk(rows, table)
+        if chunk.changed:
+            for attempt in range(1, MAX_CHUNK_ATTEMPTS + 1):
+                try:
+                    updated, candidates = await chunk.write(database)
+                    break
+                except INTEGRITY_ERRORS:
+                    # A signup took one of the keys after they were read; read them again
+                    if attempt == MAX_CHUNK_ATTEMPTS:
+                        raise
+                    report.retries += 1
+            report.updated += updated
+            report.candidates += candidates
+        report.scanned += len(rows)
+        report.unchanged += len(rows) - len(chunk.changed)
+        report.chunks += 1
+        report.elapsed_seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(report)
+        if pause_ms > 0:
+            await asyncio.sleep(pause_ms / 1000)
+
+    report.elapsed_seconds = time.perf_counter() - started
+    logger.info(
+        "Backfilled email keys of %s rows in %.1fs: %s updated, %s unchanged, %s merge candidates",
+        report.scanned, report.elapsed_seconds, report.updated, report.unchanged, len(report.candidates),
+    )
+    return report
+
+
+async def main(args):
+    def progress(report: BackfillReport) -> None:
+        rate = report.scanned / report.elapsed_seconds if report.elapsed_seconds else 0.0
+        print(
+            f"{report.scanned} rows: {report.updated} updated, {len(report.candidates)} merge candidates "
+            f"({rate:.0f} rows/s)",
+            file=sys.stderr,
+        )
+
+    async with Database(args.database_url) as database:
+        report = await backfill_email_keys(database, args.chunk_size, args.pause_ms, progress)
+    if args.candidates:
+        with open(args.candidates, "w") as candidates_file:
+            for candidate in report.candidates:
+                candidates_file.write(json.dumps(asdict(candidate)) + "\n")
+    for key, value in report.as_dict().items():
+        print(f"{key:<20}{len(value) if key == 'candidates' else value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fill in canonical email keys of existing entries and report entries that share one"
+    )
+    parser.add_argument("--candidates", help="Write one JSON line per merge candidate to this file")
+    parser.add_argument("--chunk-size", type=int, default=EMAIL_BACKFILL_CHUNK_SIZE)
+    parser.add_argument("--pause-ms", type=float, default=EMAIL_BACKFILL_PAUSE_MS, help="Pause between chunks")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,216 @@
+"""
+In-memory Bloom filter of signup emails for short-circuiting duplicate checks
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import math
+import os
+from typing import Any, Dict, Iterable, Optional
+
+from databases import Database
+from sqlalchemy import Table, select
+from .emails import email_key
+from .queries import active, waitlist_table
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Filter configuration
+EMAIL_FILTER = os.getenv("EMAIL_FILTER", "false").lower() == "true"
+EMAIL_FILTER_CAPACITY = int(os.getenv("EMAIL_FILTER_CAPACITY", "1000000"))
+EMAIL_FILTER_ERROR_RATE = float(os.getenv("EMAIL_FILTER_ERROR_RATE", "0.01"))
+EMAIL_FILTER_REBUILD_STALE = int(os.getenv("EMAIL_FILTER_REBUILD_STALE", "0"))
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for ``capacity`` items at ``error_rate``.
+
+    Memory is ``-capacity * ln(error_rate) / ln(2)**2`` bits regardless of how
+    many items are added; past ``capacity`` the false-positive rate climbs.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def estimated_error_rate(self) -> float:
+        """False-positive rate implied by the current fill."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+class EmailFilter:
+    """Per-process answer to "could this email already be on the waitlist?"
+
+    ``might_contain`` returning False means the email is definitely new and
+    the duplicate check can skip the database. True means "maybe" and the
+    caller should ask the database, reporting back with
+    ``record_false_positive`` when the email turned out to be new.
+
+    Until the first ``rebuild`` completes every email is a "maybe". Bloom
+    filters cannot forget, so deleted or changed emails stay in the filter
+    (costing only an extra lookup) until the next rebuild, which starts on
+    its own once ``rebuild_stale`` of them have piled up (0 never).
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        capacity: int = EMAIL_FILTER_CAPACITY,
+        error_rate: float = EMAIL_FILTER_ERROR_RATE,
+        rebuild_stale: int = EMAIL_FILTER_REBUILD_STALE,
+        table: Table = waitlist_table,
+    ):
+        self.database = database
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_stale = rebuild_stale
+        self.table = table
+        self._warmup: Optional[asyncio.Task] = None
+        self._bloom: Optional[BloomFilter] = None
+        self._rebuilding: Optional[BloomFilter] = None
+        self.checks = 0
+        self.maybes = 0
+        self.false_positives = 0
+        self.stale = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def might_contain(self, email: str) -> bool:
+        if self._bloom is None:
+            return True
+        self.checks += 1
+        if email_key(email) in self._bloom:
+            self.maybes += 1
+            return True
+        return False
+
+    def record_false_positive(self) -> None:
+        """The database said a "maybe" email was actually new."""
+        if self._bloom is not None:
+            self.false_positives += 1
+
+    def add(self, email: str) -> None:
+        key = email_key(email)
+        if self._bloom is not None:
+            self._bloom.add(key)
+        # Rows inserted after the rebuild's scan started may not be in it
+        if self._rebuilding is not None:
+            self._rebuilding.add(key)
+
+    def add_many(self, emails: Iterable[str]) -> None:
+        for email in emails:
+            self.add(email)
+
+    def discard(self, email: str) -> None:
+        """Note that an email left the table; it stays in the filter until a rebuild."""
+        self.stale += 1
+        if self.rebuild_stale and self.stale >= self.rebuild_stale and self.ready:
+            self.start()
+
+    def start(self) -> "asyncio.Task[None]":
+        """Rebuild the filter in the background, unless a rebuild is already running, and return its task.
+
+        Until the first rebuild, signups go to the database; afterwards the
+        current filter keeps answering until the new one is swapped in.
+        """
+        if self._warmup is None or self._warmup.done():
+            self._warmup = asyncio.create_task(self._warm_up())
+        return self._warmup
+
+    async def close(self) -> None:
+        if self._warmup is not None and not self._warmup.done():
+            self._warmup.cancel()
+            try:
+                await self._warmup
+            except asyncio.CancelledError:
+                pass
+        self._warmup = None
+
+    async def _warm_up(self) -> None:
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.error(f"Error warming up the email filter: {e}")
+
+    async def rebuild(self) -> None:
+        """Scan the active entries' emails into a fresh filter and swap it in."""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        self._rebuilding = bloom
+        try:
+            # Keys are computed from the email so rows not yet backfilled are covered too
+            async for row in self.database.iterate(select(self.table.c.email).where(active(self.table))):
+                bloom.add(email_key(row["email"]))
+        finally:
+            self._rebuilding = None
+        self._bloom = bloom
+        self.stale = 0
+        if bloom.count > self.capacity:
+            logger.warning(
+                f"Email filter holds {bloom.count} emails, over its capacity of {self.capacity}; "
+                "raise EMAIL_FILTER_CAPACITY to keep the false-positive rate down"
+            )
+        logger.info(f"Email filter rebuilt: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Sizing and effectiveness counters."""
+        bloom = self._bloom
+        # Checks of emails that turned out to be new: "definitely new" answers plus false positives
+        new_emails = self.checks - self.maybes + self.false_positives
+        return {
+            "ready": bloom is not None,
+            "emails": bloom.count if bloom else 0,
+            "capacity": self.capacity,
+            "memory_bytes": len(bloom.bits) if bloom else 0,
+            "hashes": bloom.hashes if bloom else 0,
+            "stale": self.stale,
+            "checks": self.checks,
+            "maybes": self.maybes,
+            "false_positives": self.false_positives,
+            "false_positive_rate": self.false_positives / new_emails if new_emails else 0.0,
+            "estimated_false_positive_rate": bloom.estimated_error_rate() if bloom else 1.0,
+        }
+
+
+async def main(args):
+    async with Database(args.database_url) as database:
+        email_filter = EmailFilter(database, capacity=args.capacity, error_rate=args.error_rate)
+        await email_filter.rebuild()
+    for key, value in email_filter.stats().items():
+        print(f"{key:<32}{value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=(
+            "Build an email filter from the waitlist table and report the size and error rate it would have; "
+            "this does not touch a running service's filter (POST /waitlist/email-filter/rebuild does)"
+        )
+    )
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--capacity", type=int, default=EMAIL_FILTER_CAPACITY)
+    parser.add_argument("--error-rate", type=float, default=EMAIL_FILTER_ERROR_RATE)
+    asyncio.run(main(parser.parse_args()))
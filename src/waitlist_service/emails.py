@@ -0,0 +1,58 @@
+"""
+Canonical email keys for telling repeat signups apart from new ones
+"""
+import os
+from typing import Dict, Iterable, List
+
+
+def _domains(value: str) -> frozenset:
+    return frozenset(domain.strip().lower() for domain in value.split(",") if domain.strip())
+
+
+def _aliases(value: str) -> Dict[str, str]:
+    pairs = (pair.split("=", 1) for pair in value.split(",") if "=" in pair)
+    return {alias.strip().lower(): domain.strip().lower() for alias, domain in pairs}
+
+
+# Normalization configuration
+# Domains that ignore dots in the local part, e.g. f.oo@gmail.com is foo@gmail.com
+EMAIL_DOTLESS_DOMAINS = _domains(os.getenv("EMAIL_DOTLESS_DOMAINS", "gmail.com,googlemail.com"))
+# Domains that deliver to another domain's mailboxes, as alias=domain pairs
+EMAIL_DOMAIN_ALIASES = _aliases(os.getenv("EMAIL_DOMAIN_ALIASES", "googlemail.com=gmail.com"))
+# Characters starting a subaddress tag, e.g. the "+x" in foo+x@gmail.com; empty keeps tags
+EMAIL_TAG_SEPARATORS = os.getenv("EMAIL_TAG_SEPARATORS", "+")
+
+
+def email_key(email: str) -> str:
+    """The canonical form of ``email`` that signups are deduplicated on.
+
+    Case and surrounding whitespace are ignored, subaddress tags are
+    dropped, dots are dropped for EMAIL_DOTLESS_DOMAINS and aliased
+    domains are replaced, so "F.oo+x@GoogleMail.com" keys as
+    "foo@gmail.com". The stored email keeps the address as it was given.
+    """
+    return email_keys([email])[0]
+
+
+def email_keys(emails: Iterable[str]) -> List[str]:
+    """``email_key`` of every email, with the rules looked up once for the whole batch."""
+    dotless = EMAIL_DOTLESS_DOMAINS
+    aliases = EMAIL_DOMAIN_ALIASES
+    separators = EMAIL_TAG_SEPARATORS
+    keys = []
+    for email in emails:
+        local, at, domain = email.strip().lower().rpartition("@")
+        if not at:
+            keys.append(domain)
+            continue
+        domain = domain.rstrip(".")
+        domain = aliases.get(domain, domain)
+        for separator in separators:
+            tag = local.find(separator)
+            # A local part that is all tag is kept as it is
+            if tag > 0:
+                local = local[:tag]
+        if domain in dotless:
+            local = local.replace(".", "") or local
+        keys.append(f"{local}@{domain}")
+    return keys
@@ -1,7 +1,8 @@
 from fastapi import FastAPI
 import logging
-from .db import database
+from .state import database
 from .notifications import notifier
+from .router import signup_batcher, outbox_dispatcher, email_filter, export_jobs, position_index
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,18 @@ def register_db_events(app: FastAPI):
             logger.error(f"Error connecting to database: {e}")
             raise
 
+        if email_filter is not None:
+            email_filter.start()
+            logger.info("Email filter warm-up started")
+
+        if outbox_dispatcher is not None:
+            outbox_dispatcher.start()
+            logger.info("Notification outbox dispatcher started")
+
+        if position_index is not None:
+            position_index.start()
+            logger.info("Position index build started")
+
         # Initialize Telegram notifications
         try:
             # The notifier is already initialized at import, just log its status
@@ -34,7 +47,17 @@ def register_db_events(app: FastAPI):
     async def shutdown():
         logger.info("Shutting down services")
         try:
+            if signup_batcher is not None:
+                await signup_batcher.close()
+            if outbox_dispatcher is not None:
+                await outbox_dispatcher.close()
+            if email_filter is not None:
+                await email_filter.close()
+            if position_index is not None:
+                await position_index.close()
+            await export_jobs.close()
             await database.disconnect()
+            # Sends any queued signup notifications before closing the bot session
             await notifier.close()
             logger.info("Successfully shut down all services")
         except Exception as e:
@@ -0,0 +1,63 @@
+"""
+Streaming exports of waitlist entries
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List
+
+from databases import Database
+from databases.interfaces import Record
+from sqlalchemy.sql import Select
+
+# Export format -> response media type
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _row_dict(row: Record, columns: List[str]) -> Dict[str, Any]:
+    return {column: row[column] for column in columns}
+
+
+async def iter_ndjson(database: Database, query: Select) -> AsyncIterator[str]:
+    """Yield one JSON object per row, reading rows from the cursor as they are sent."""
+    columns = [column.name for column in query.selected_columns]
+    async for row in database.iterate(query):
+        yield json.dumps(_row_dict(row, columns), default=_json_default) + "\n"
+
+
+async def iter_csv(database: Database, query: Select) -> AsyncIterator[str]:
+    """Yield a CSV header followed by one line per row."""
+    columns = [column.name for column in query.selected_columns]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+
+    def flush() -> str:
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writeheader()
+    yield flush()
+    async for row in database.iterate(query):
+        writer.writerow({
+            column: value.isoformat() if isinstance(value, datetime) else value
+            for column, value in _row_dict(row, columns).items()
+        })
+        yield flush()
+
+
+EXPORTERS = {
+    "ndjson": iter_ndjson,
+    "csv": iter_csv,
+}
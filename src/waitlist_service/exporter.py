@@ -0,0 +1,373 @@
+"""
+Bulk export of the waitlist table to compressed CSV, Parquet or Arrow files
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from databases import Database
+from sqlalchemy import Table, and_, or_
+from sqlalchemy.sql import Select
+from .queries import waitlist_table, encode_cursor, decode_cursor
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Export configuration
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "10000"))
+
+FORMATS = ("csv", "parquet", "arrow")
+COMPRESSIONS = ("gzip", "zstd", "none")
+
+# File extension per format and, for CSV, per compression
+_EXTENSIONS = {
+    ("csv", "gzip"): "csv.gz",
+    ("csv", "zstd"): "csv.zst",
+    ("csv", "none"): "csv",
+    "parquet": "parquet",
+    "arrow": "arrow",
+}
+
+
+def select_since(
+    watermark: Optional[str] = None, table: Table = waitlist_table, waitlist: Optional[str] = None
+) -> Select:
+    """Select entries oldest first, after ``watermark`` when one is given, of one list or all of them.
+
+    Rows are keyed by (created_at, id). Rows committed later with an
+    earlier ``created_at`` (e.g. imports that keep the source's signup
+    time) fall behind the watermark and need a full export.
+    """
+    query = table.select().order_by(table.c.created_at, table.c.id)
+    if waitlist is not None:
+        query = query.where(table.c.waitlist == waitlist)
+    if watermark is not None:
+        created_at, entry_id = decode_cursor(watermark)
+        query = query.where(
+            or_(
+                table.c.created_at > created_at,
+                and_(table.c.created_at == created_at, table.c.id > entry_id),
+            )
+        )
+    return query
+
+
+def _require(module: str, feature: str) -> Any:
+    try:
+        return __import__(module, fromlist=["_"])
+    except ImportError as e:
+        package = module.split(".")[0]
+        raise ImportError(f"{feature} requires the {package} package (pip install {package})") from e
+
+
+class CSVWriter:
+    """CSV with a header row, gzip- or zstd-compressed; gzip needs only the standard library."""
+
+    def __init__(self, path: str, columns: List[str], compression: str):
+        if compression == "gzip":
+            self._file = gzip.open(path, "wt", newline="", encoding="utf-8")
+        elif compression == "zstd":
+            zstandard = _require("zstandard", "zstd compression")
+            self._file = zstandard.open(path, "wt", newline="", encoding="utf-8")
+        else:
+            self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+        self.columns = columns
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.writerows(
+            [
+                [value.isoformat() if isinstance(value, datetime) else value for value in row.values()]
+                for row in rows
+            ]
+        )
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file written one record batch per chunk."""
+
+    def __init__(self, path: str, table: Table, format: str, compression: str):
+        pa = _require("pyarrow", f"{format} export")
+        types = {"INTEGER": pa.int64(), "DATETIME": pa.timestamp("us"), "BOOLEAN": pa.bool_()}
+        self._pa = pa
+        self.schema = pa.schema(
+            [(column.name, types.get(str(column.type), pa.string())) for column in table.c]
+        )
+        codec = None if compression == "none" else compression
+        if format == "parquet":
+            parquet = _require("pyarrow.parquet", "parquet export")
+            self._writer = parquet.ParquetWriter(path, self.schema, compression=codec or "none")
+        else:
+            if codec == "gzip":
+                raise ValueError("Arrow IPC files support zstd or no compression, not gzip")
+            ipc = _require("pyarrow.ipc", "arrow export")
+            options = ipc.IpcWriteOptions(compression=codec)
+            self._writer = ipc.new_file(path, self.schema, options=options)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        self._writer.write_batch(self._pa.RecordBatch.from_pylist(rows, schema=self.schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+@dataclass
+class ExportResult:
+    path: str
+    format: str
+    compression: str
+    rows: int
+    since: Optional[str]
+    watermark: Optional[str]
+    elapsed_seconds: float
+
+
+def export_path(export_dir: str, format: str, compression: str, incremental: bool = False) -> str:
+    """A new file name in ``export_dir`` for an export started now."""
+    extension = _EXTENSIONS.get((format, compression)) or _EXTENSIONS[format]
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    kind = "incremental" if incremental else "full"
+    return os.path.join(export_dir, f"waitlist-{kind}-{stamp}-{uuid.uuid4().hex[:6]}.{extension}")
+
+
+async def export_table(
+    database: Database,
+    path: str,
+    format: str = "csv",
+    compression: str = "gzip",
+    since: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+    table: Table = waitlist_table,
+    waitlist: Optional[str] = None,
+) -> ExportResult:
+    """Stream the table, or only ``waitlist``'s entries, into ``path`` ``chunk_size`` rows at a time.
+
+    Rows come from a server-side cursor on PostgreSQL, so memory holds one
+    chunk whatever the table size. The result's ``watermark`` is passed as
+    ``since`` to the next run to export only newer rows; with no new rows
+    it is ``since`` again. The file is written under a temporary name and
+    renamed once complete.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown export compression: {compression}")
+
+    started = time.perf_counter()
+    query = select_since(since, table, waitlist)
+    columns = [column.name for column in table.c]
+    partial = path + ".partial"
+    if format == "csv":
+        writer: Any = CSVWriter(partial, columns, compression)
+    else:
+        writer = ArrowWriter(partial, table, format, compression)
+
+    rows = 0
+    watermark = since
+    chunk: List[Dict[str, Any]] = []
+    try:
+        async for row in database.iterate(query):
+            chunk.append({column: row[column] for column in columns})
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                rows += len(chunk)
+                watermark = encode_cursor(chunk[-1])
+                chunk = []
+        if chunk:
+            writer.write(chunk)
+            rows += len(chunk)
+            watermark = encode_cursor(chunk[-1])
+    finally:
+        writer.close()
+    os.replace(partial, path)
+
+    result = ExportResult(
+        path=path,
+        format=format,
+        compression=compression,
+        rows=rows,
+        since=since,
+        watermark=watermark,
+        elapsed_seconds=time.perf_counter() - started,
+    )
+    logger.info(f"Exported {rows} rows to {path} in {result.elapsed_seconds:.1f}s")
+    return result
+
+
+@dataclass
+class ExportJob:
+    id: str
+    format: str
+    compression: str
+    since: Optional[str]
+    waitlist: Optional[str] = None
+    status: str = "running"
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class ExportJobs:
+    """Runs exports as ``python -m waitlist_service.exporter`` child processes.
+
+    Reading, encoding and compressing happen outside the API worker, which
+    only waits on the child. Jobs are tracked in this process's memory, so
+    poll the same worker that started one; the files themselves land in
+    ``export_dir``.
+    """
+
+    def __init__(self, database_url: Optional[str], export_dir: str = EXPORT_DIR, max_running: int = 1):
+        self.database_url = database_url
+        self.export_dir = export_dir
+        self.max_running = max_running
+        self.jobs: Dict[str, ExportJob] = {}
+        self._processes: Dict[str, asyncio.subprocess.Process] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def running(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "running")
+
+    async def start(
+        self, format: str, compression: str, since: Optional[str] = None, waitlist: Optional[str] = None
+    ) -> ExportJob:
+        """Launch an export of ``waitlist``, or of every list without one.
+
+        Raises RuntimeError when ``max_running`` jobs are already running.
+        """
+        if self.running >= self.max_running:
+            raise RuntimeError("An export is already running")
+        job = ExportJob(
+            id=uuid.uuid4().hex,
+            format=format,
+            compression=compression,
+            since=since,
+            waitlist=waitlist,
+            started_at=datetime.utcnow(),
+        )
+        args = [
+            sys.executable, "-m", "waitlist_service.exporter",
+            "--format", format,
+            "--compression", compression,
+            "--export-dir", self.export_dir,
+            "--json",
+        ]
+        if since is not None:
+            args += ["--since", since]
+        if waitlist is not None:
+            args += ["--waitlist", waitlist]
+        env = dict(os.environ)
+        if self.database_url:
+            env["DATABASE_URL"] = self.database_url
+        self._processes[job.id] = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+        )
+        self.jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._wait(job))
+        logger.info(f"Started export job {job.id}")
+        return job
+
+    async def _wait(self, job: ExportJob) -> None:
+        process = self._processes[job.id]
+        try:
+            stdout, stderr = await process.communicate()
+            if process.returncode == 0:
+                job.result = json.loads(stdout.decode().strip().splitlines()[-1])
+                job.status = "succeeded"
+            else:
+                lines = stderr.decode().strip().splitlines()
+                job.error = lines[-1] if lines else f"exited with status {process.returncode}"
+                job.status = "failed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._processes.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+        log = logger.info if job.status == "succeeded" else logger.error
+        log(f"Export job {job.id} {job.status}: {job.result or job.error}")
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str) -> ExportJob:
+        """Wait for a job to finish."""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+        return self.jobs[job_id]
+
+    async def close(self) -> None:
+        """Stop running exports; their partial files are left behind."""
+        for process in list(self._processes.values()):
+            if process.returncode is None:
+                process.terminate()
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main(args):
+    since = args.since
+    if since is None and args.watermark_file and os.path.exists(args.watermark_file):
+        with open(args.watermark_file) as source:
+            since = source.read().strip() or None
+
+    os.makedirs(args.export_dir, exist_ok=True)
+    path = args.output or export_path(args.export_dir, args.format, args.compression, since is not None)
+    async with Database(args.database_url) as database:
+        result = await export_table(
+            database,
+            path,
+            format=args.format,
+            compression=args.compression,
+            since=since,
+            chunk_size=args.chunk_size,
+            waitlist=args.waitlist,
+        )
+
+    if args.watermark_file and result.watermark is not None:
+        with open(args.watermark_file, "w") as target:
+            target.write(result.watermark + "\n")
+    if args.json:
+        print(json.dumps(asdict(result)))
+    else:
+        for key, value in asdict(result).items():
+            print(f"{key:<20}{value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the waitlist table to a compressed CSV, Parquet or Arrow file"
+    )
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default="gzip")
+    parser.add_argument("--since", help="Only export rows after this watermark from a previous export")
+    parser.add_argument(
+        "--watermark-file",
+        help="Read --since from this file when it exists and store the new watermark in it afterwards",
+    )
+    parser.add_argument("--waitlist", help="Only export this list's entries; every list by default")
+    parser.add_argument("--output", help="File to write; defaults to a new name in --export-dir")
+    parser.add_argument("--export-dir", default=EXPORT_DIR)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--json", action="store_true", help="Print the result as one JSON line")
+    asyncio.run(main(parser.parse_args()))
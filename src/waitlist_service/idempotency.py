@@ -0,0 +1,324 @@
+"""
+Idempotency keys: replay a stored response to a retried request instead of running it again
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table
+from .models import IdempotencyKey
+from .queries import INTEGRITY_ERRORS
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Idempotency configuration: IDEMPOTENCY_KEYS is "memory", "database" or unset (header ignored)
+IDEMPOTENCY_KEYS = os.getenv("IDEMPOTENCY_KEYS", "").lower()
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "30"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+
+# Longest key accepted; clients usually send a UUID
+MAX_KEY_LENGTH = 255
+
+# How often a request waiting on another replica's in-flight key checks it again
+POLL_SECONDS = 0.05
+
+# Expired rows are purged from the database every this many claims
+PURGE_EVERY = 1000
+
+idempotency_table: Table = IdempotencyKey.__table__
+
+
+class IdempotencyKeyMismatch(Exception):
+    """The key was used before with a different request body."""
+
+
+class IdempotencyKeyInProgress(Exception):
+    """The key's first request is still running elsewhere and did not finish in time."""
+
+
+@dataclass(frozen=True)
+class StoredResponse:
+    """A response to replay: its status code and JSON body."""
+    status_code: int
+    body: bytes
+
+
+@dataclass
+class Claim:
+    """What a store holds for a key: its request's fingerprint and, once finished, its response."""
+    fingerprint: str
+    response: Optional[StoredResponse] = None
+
+
+def fingerprint(content: Any) -> str:
+    """Digest of a request body, to tell a retry from a different request reusing its key."""
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class MemoryStore:
+    """Per-process LRU of claims, each kept for its TTL."""
+
+    def __init__(self, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._items: "OrderedDict[str, Tuple[float, Claim]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[Claim]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, claim = item
+        if expires_at <= time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return claim
+
+    def _set(self, key: str, claim: Claim, ttl: float) -> None:
+        self._items[key] = (time.monotonic() + ttl, claim)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_keys:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    async def claim(self, key: str, fingerprint: str, lease: float) -> Optional[Claim]:
+        """Claim ``key`` for a new request and return None, or return the claim already held."""
+        existing = self._get(key)
+        if existing is not None:
+            return existing
+        self._set(key, Claim(fingerprint), lease)
+        return None
+
+    async def get(self, key: str) -> Optional[Claim]:
+        return self._get(key)
+
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse, ttl: float) -> None:
+        self._set(key, Claim(fingerprint, response), ttl)
+
+    async def release(self, key: str) -> None:
+        self._items.pop(key, None)
+
+
+class DatabaseStore:
+    """Claims kept in the ``idempotency_keys`` table, shared by every replica.
+
+    A claim is a row without a status code; its lease expires, so a key
+    held by a crashed worker frees up. Expired rows are purged every
+    ``PURGE_EVERY`` claims.
+    """
+
+    def __init__(self, database: Database, table: Table = idempotency_table):
+        self.database = database
+        self.table = table
+        self.evictions = 0
+        self._claims = 0
+
+    def _claim(self, row: Any) -> Optional[Claim]:
+        if row is None or row["expires_at"] <= datetime.utcnow():
+            return None
+        if row["status_code"] is None:
+            return Claim(row["fingerprint"])
+        return Claim(row["fingerprint"], StoredResponse(row["status_code"], row["body"].encode()))
+
+    async def _fetch(self, key: str) -> Any:
+        table = self.table
+        return await self.database.fetch_one(table.select().where(table.c.key == key))
+
+    async def get(self, key: str) -> Optional[Claim]:
+        return self._claim(await self._fetch(key))
+
+    async def claim(self, key: str, fingerprint: str, lease: float) -> Optional[Claim]:
+        """Claim ``key`` for a new request and return None, or return the claim already held."""
+        table = self.table
+        # Replays only read
+        row = await self._fetch(key)
+        existing = self._claim(row)
+        if existing is not None:
+            return existing
+        now = datetime.utcnow()
+        if row is not None:
+            # Expired; free the key
+            await self.database.execute(table.delete().where(table.c.key == key, table.c.expires_at <= now))
+        try:
+            await self.database.execute(
+                table.insert().values(
+                    key=key, fingerprint=fingerprint, created_at=now, expires_at=now + timedelta(seconds=lease)
+                )
+            )
+        except INTEGRITY_ERRORS:
+            # Another replica claimed it since the read
+            return await self.get(key) or Claim(fingerprint)
+        self._claims += 1
+        if self._claims % PURGE_EVERY == 0:
+            await self.purge()
+        return None
+
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse, ttl: float) -> None:
+        table = self.table
+        await self.database.execute(
+            table.update()
+            .where(table.c.key == key)
+            .values(
+                status_code=response.status_code,
+                body=response.body.decode(),
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl),
+            )
+        )
+
+    async def release(self, key: str) -> None:
+        table = self.table
+        await self.database.execute(table.delete().where(table.c.key == key, table.c.status_code.is_(None)))
+
+    async def purge(self) -> None:
+        table = self.table
+        await self.database.execute(table.delete().where(table.c.expires_at <= datetime.utcnow()))
+
+
+@dataclass
+class IdempotencyStats:
+    stored: int = 0
+    replayed: int = 0
+    coalesced: int = 0
+    mismatched: int = 0
+    evictions: int = 0
+
+
+class _Abandoned(Exception):
+    """The request that was running a key went away before it finished."""
+
+
+class IdempotencyKeys:
+    """Runs each (scope, key) once and replays its response to every retry.
+
+    Concurrent requests with the same key in this process wait for the
+    first one's response rather than running too; in another replica
+    (``DatabaseStore``) they poll the store for up to ``wait_seconds``.
+    Responses below 500 are stored for ``ttl`` seconds; on a 5xx or an
+    error the key is released so the client's next retry runs afresh.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        ttl: float = IDEMPOTENCY_TTL_SECONDS,
+        lease: float = IDEMPOTENCY_LEASE_SECONDS,
+        wait_seconds: float = IDEMPOTENCY_WAIT_SECONDS,
+    ):
+        self.store = store
+        self.ttl = ttl
+        self.lease = lease
+        self.wait_seconds = wait_seconds
+        self._running: Dict[str, Tuple[str, "asyncio.Future[StoredResponse]"]] = {}
+        self._stats = IdempotencyStats()
+
+    async def run(
+        self, scope: str, key: str, request_fingerprint: str, handler: Callable[[], Awaitable[StoredResponse]]
+    ) -> Tuple[StoredResponse, bool]:
+        """The response to the request, and whether it was replayed rather than produced by ``handler``.
+
+        Raises IdempotencyKeyMismatch if the key was used for a different
+        request, and IdempotencyKeyInProgress if its first request is
+        still running in another replica.
+        """
+        full_key = f"{scope}:{key}"
+        while full_key in self._running:
+            running_fingerprint, future = self._running[full_key]
+            if running_fingerprint != request_fingerprint:
+                self._stats.mismatched += 1
+                raise IdempotencyKeyMismatch(key)
+            try:
+                # Shielded: a cancelled waiter must not cancel the request it waits for
+                response = await asyncio.shield(future)
+            except _Abandoned:
+                continue
+            self._stats.coalesced += 1
+            return response, True
+
+        future: "asyncio.Future[StoredResponse]" = asyncio.get_running_loop().create_future()
+        self._running[full_key] = (request_fingerprint, future)
+        try:
+            response, replayed = await self._run(full_key, key, request_fingerprint, handler)
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else _Abandoned())
+            # Waiters re-raise it; nobody else may
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response, replayed
+        finally:
+            del self._running[full_key]
+
+    async def _run(
+        self, full_key: str, key: str, request_fingerprint: str, handler: Callable[[], Awaitable[StoredResponse]]
+    ) -> Tuple[StoredResponse, bool]:
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            existing = await self.store.claim(full_key, request_fingerprint, self.lease)
+            if existing is None:
+                break
+            if existing.fingerprint != request_fingerprint:
+                self._stats.mismatched += 1
+                raise IdempotencyKeyMismatch(key)
+            response = await self._wait(full_key, existing, deadline)
+            if response is not None:
+                self._stats.replayed += 1
+                return response, True
+            # Released after an error in another replica: claim it again
+
+        try:
+            response = await handler()
+        except BaseException:
+            await self._release(full_key)
+            raise
+        if response.status_code >= 500:
+            await self._release(full_key)
+            return response, False
+        try:
+            await self.store.complete(full_key, request_fingerprint, response, self.ttl)
+            self._stats.stored += 1
+        except Exception as e:
+            # The request succeeded; only a later retry loses its replay
+            logger.error(f"Idempotency store write failed: {e}")
+        return response, False
+
+    async def _wait(self, full_key: str, claim: Optional[Claim], deadline: float) -> Optional[StoredResponse]:
+        """The response of a claim held elsewhere, polling until it is stored; None if it is released."""
+        while claim is not None and claim.response is None:
+            if time.monotonic() >= deadline:
+                raise IdempotencyKeyInProgress(full_key)
+            await asyncio.sleep(POLL_SECONDS)
+            claim = await self.store.get(full_key)
+        return claim.response if claim is not None else None
+
+    async def _release(self, full_key: str) -> None:
+        try:
+            await asyncio.shield(self.store.release(full_key))
+        except Exception as e:
+            logger.error(f"Idempotency store release failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        self._stats.evictions = self.store.evictions
+        return asdict(self._stats)
+
+
+def create_idempotency_keys(database: Database, kind: str = IDEMPOTENCY_KEYS) -> Optional[IdempotencyKeys]:
+    """Build the configured idempotency key store, or None when keys are ignored."""
+    if not kind:
+        return None
+    if kind == "memory":
+        return IdempotencyKeys(MemoryStore())
+    if kind == "database":
+        return IdempotencyKeys(DatabaseStore(database))
+    raise ValueError(f"Unknown IDEMPOTENCY_KEYS store: {kind}")
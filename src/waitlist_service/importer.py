@@ -0,0 +1,458 @@
+"""
+Bulk import of waitlist entries from CSV or NDJSON
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from databases import Database
+from databases.core import Connection
+from pydantic import ValidationError
+from sqlalchemy import Table, and_, bindparam, column, literal_column, or_, select, table as lightweight_table
+from sqlalchemy.dialects import postgresql, sqlite
+from .prepared import PreparedQuery
+from .queries import DEFAULT_WAITLIST, active, waitlist_table, with_defaults
+from .schemas.waitlist import WaitlistImport
+from .stats import SIGNUP_STATS, apply_deltas, rollup_deltas
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Import configuration
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+
+# Columns written by an import, and the ones an "update" import overwrites.
+# An existing entry keeps its original IP address and signup time.
+IMPORT_COLUMNS = (
+    "waitlist", "name", "email", "email_key", "ip_address", "comment", "referral_source", "created_at", "is_active"
+)
+UPDATE_COLUMNS = ("name", "comment", "referral_source")
+CONFLICT_POLICIES = ("skip", "update")
+
+# Temporary table COPY writes into on PostgreSQL before merging
+STAGING_TABLE = "waitlist_import"
+
+
+@dataclass
+class RowError:
+    row: int
+    error: str
+    record: Any = None
+
+
+@dataclass
+class ImportReport:
+    """Running totals for an import; ``errors`` keeps the first ``max_errors`` failures."""
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    errors: List[RowError] = field(default_factory=list)
+    max_errors: int = IMPORT_MAX_ERRORS
+
+    def add_error(self, error: RowError) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(error)
+
+    def as_dict(self) -> Dict[str, Any]:
+        report = asdict(self)
+        report["errors_truncated"] = self.failed > len(self.errors)
+        del report["max_errors"]
+        return report
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a UTF-8 byte stream into lines, whatever the chunk boundaries."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def iter_csv_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield ``(row, record)`` for each CSV row after the header; quoted fields may span lines."""
+    header: Optional[List[str]] = None
+    row = 0
+    text = ""
+    async for line in iter_lines(chunks):
+        text += line
+        # An odd number of quotes means a quoted field continues on the next line
+        if text.count('"') % 2:
+            continue
+        fields = next(csv.reader([text]), [])
+        text = ""
+        if not any(value.strip() for value in fields):
+            continue
+        if header is None:
+            header = [name.strip() for name in fields]
+            continue
+        row += 1
+        if len(fields) > len(header):
+            yield row, ValueError(f"expected {len(header)} fields, got {len(fields)}")
+            continue
+        yield row, {name: value if value != "" else None for name, value in zip(header, fields)}
+    if text.strip():
+        yield row + 1, ValueError("unterminated quoted field")
+
+
+async def iter_ndjson_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield ``(row, record)`` for each non-blank line holding a JSON object."""
+    row = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, ValueError(f"invalid JSON: {e}")
+            continue
+        if not isinstance(record, dict):
+            yield row, ValueError("expected a JSON object")
+            continue
+        yield row, record
+
+
+PARSERS = {
+    "csv": iter_csv_records,
+    "ndjson": iter_ndjson_records,
+}
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}"
+        for item in error.errors()
+    )
+
+
+def validate_chunk(
+    records: Iterable[Tuple[int, Any]],
+    report: ImportReport,
+    on_error: Optional[Callable[[RowError], None]] = None,
+) -> List[Dict[str, Any]]:
+    """Validate raw records with the signup schema, recording failures in ``report``."""
+    rows = []
+    for row, record in records:
+        report.processed += 1
+        if isinstance(record, Exception):
+            error = RowError(row, str(record))
+        else:
+            try:
+                entry = WaitlistImport.model_validate(record)
+            except ValidationError as e:
+                error = RowError(row, _validation_message(e), record)
+            else:
+                values = entry.model_dump()
+                if values["created_at"] is None:
+                    del values["created_at"]
+                rows.append(with_defaults(values))
+                continue
+        report.add_error(error)
+        if on_error is not None:
+            on_error(error)
+    return rows
+
+
+def _dedupe(rows: List[Dict[str, Any]], on_conflict: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Collapse emails with the same key within a chunk; the first wins when skipping, the last when updating.
+
+    Returns the rows to load and how many repeats were collapsed.
+    """
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        if on_conflict == "update" or row["email_key"] not in by_key:
+            by_key[row["email_key"]] = row
+    return list(by_key.values()), len(rows) - len(by_key)
+
+
+def _stats_deltas(
+    rows: List[Dict[str, Any]], existing: Dict[str, Dict[str, Any]], on_conflict: str
+) -> "Counter":
+    """Signup counter changes for loading ``rows`` over the ``existing`` entries."""
+    added = [row for row in rows if row["email_key"] not in existing]
+    deltas = rollup_deltas(added)
+    if on_conflict == "update":
+        # Updated entries keep their signup time but may change referral source
+        for row in rows:
+            before = existing.get(row["email_key"])
+            if before is not None:
+                deltas.update(rollup_deltas([before], -1))
+                deltas.update(rollup_deltas([{**before, "referral_source": row["referral_source"]}]))
+    return deltas
+
+
+class _Loader:
+    """Writes validated chunks on one connection inside the import's transaction."""
+
+    def __init__(self, connection: Connection, dialect: str, on_conflict: str, table: Table, waitlist: str):
+        self.connection = connection
+        self.dialect = dialect
+        self.on_conflict = on_conflict
+        self.table = table
+        self.waitlist = waitlist
+        self.staged = False
+        if dialect == "postgresql":
+            self.sql = self._merge_sql()
+        elif dialect == "sqlite":
+            self.compiled = PreparedQuery(self._upsert()).compiled("sqlite")
+        else:
+            raise ValueError(f"Bulk import supports PostgreSQL and SQLite, not {dialect}")
+
+    def _on_conflict(self, statement: Any) -> Any:
+        # Rows clashing with an older row's exact email while its key has not been
+        # backfilled never get here; see ``existing_entries``
+        if self.on_conflict == "skip":
+            return statement.on_conflict_do_nothing()
+        return statement.on_conflict_do_update(
+            index_elements=[self.table.c.waitlist, self.table.c.email_key],
+            index_where=active(self.table),
+            set_={name: statement.excluded[name] for name in UPDATE_COLUMNS},
+        )
+
+    def _upsert(self) -> Any:
+        statement = sqlite.insert(self.table).values({name: bindparam(name) for name in IMPORT_COLUMNS})
+        return self._on_conflict(statement)
+
+    def _merge_sql(self) -> str:
+        staging = lightweight_table(STAGING_TABLE, *(column(name) for name in IMPORT_COLUMNS))
+        # Columns left out take their server defaults; Python-side ones would need bound parameters
+        statement = postgresql.insert(self.table).from_select(
+            list(IMPORT_COLUMNS), select(*staging.c), include_defaults=False
+        )
+        # xmax is 0 on a freshly inserted row version and set on an updated one
+        statement = self._on_conflict(statement).returning(literal_column("xmax = 0"))
+        return str(statement.compile(dialect=postgresql.dialect()))
+
+    async def existing_entries(self, rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """The active entries of the list already holding ``rows``' email keys, keyed by the import row's key.
+
+        Entries written before email keys existed have none until the backfill
+        reaches them, so they are matched by exact email instead and marked
+        ``legacy``: the INSERT would clash with them on ``(waitlist, email)``
+        rather than on the key.
+        """
+        table = self.table
+        query = select(
+            table.c.id, table.c.email, table.c.email_key, table.c.referral_source, table.c.created_at
+        ).where(
+            table.c.waitlist == self.waitlist,
+            active(table),
+            or_(
+                table.c.email_key.in_([row["email_key"] for row in rows]),
+                and_(table.c.email_key.is_(None), table.c.email.in_([row["email"] for row in rows])),
+            ),
+        )
+        by_key, by_email = {}, {}
+        for entry in await self.connection.fetch_all(query):
+            found = {
+                "id": entry["id"],
+                "legacy": entry["email_key"] is None,
+                "waitlist": self.waitlist,
+                "referral_source": entry["referral_source"],
+                "created_at": entry["created_at"],
+            }
+            if found["legacy"]:
+                by_email[entry["email"]] = found
+            else:
+                by_key[entry["email_key"]] = found
+        existing = {}
+        for row in rows:
+            found = by_email.get(row["email"]) or by_key.get(row["email_key"])
+            if found is not None:
+                existing[row["email_key"]] = found
+        return existing
+
+    async def update_legacy(self, rows: List[Dict[str, Any]], existing: Dict[str, Dict[str, Any]]) -> None:
+        """Overwrite the entries without an email key that ``rows`` match by exact email."""
+        table = self.table
+        for row in rows:
+            await self.connection.execute(
+                table.update()
+                .where(table.c.id == existing[row["email_key"]]["id"])
+                .values({name: row[name] for name in UPDATE_COLUMNS})
+            )
+
+    async def load(self, rows: List[Dict[str, Any]], updated: int) -> int:
+        """Write ``rows`` and return how many were inserted.
+
+        ``updated`` is how many of them match an existing entry's key, which
+        SQLite counts among the changed rows of an "update" import.
+        """
+        raw = self.connection.raw_connection
+        if self.dialect == "sqlite":
+            cursor = await raw.executemany(self.compiled.sql, [self.compiled.bind(row) for row in rows])
+            return cursor.rowcount - updated if self.on_conflict == "update" else cursor.rowcount
+
+        if not self.staged:
+            columns = ", ".join(IMPORT_COLUMNS)
+            await raw.execute(
+                f"CREATE TEMPORARY TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+                f"SELECT {columns} FROM {self.table.name} WITH NO DATA"
+            )
+            self.staged = True
+        await raw.copy_records_to_table(
+            STAGING_TABLE,
+            records=[tuple(row[name] for name in IMPORT_COLUMNS) for row in rows],
+            columns=list(IMPORT_COLUMNS),
+        )
+        written = await raw.fetch(self.sql)
+        await raw.execute(f"TRUNCATE {STAGING_TABLE}")
+        return sum(1 for record in written if record[0])
+
+
+async def import_entries(
+    database: Database,
+    records: AsyncIterable[Tuple[int, Any]],
+    on_conflict: str = "skip",
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress: Optional[Callable[[ImportReport], None]] = None,
+    on_error: Optional[Callable[[RowError], None]] = None,
+    on_loaded: Optional[Callable[[List[str]], None]] = None,
+    stats: bool = SIGNUP_STATS,
+    table: Table = waitlist_table,
+    waitlist: str = DEFAULT_WAITLIST,
+) -> ImportReport:
+    """Validate and load ``records`` into ``waitlist`` in chunks inside one transaction.
+
+    Rows whose email, or another with the same canonical key, is already on
+    the list are skipped or have their
+    name, comment and referral source overwritten, per ``on_conflict``.
+    Invalid rows are reported and do not stop the import. No signup
+    notifications are sent. ``progress`` is called after each chunk,
+    ``on_error`` for every failed row and ``on_loaded`` with each chunk's
+    emails. With ``stats`` the signup counters are updated in the same
+    transaction.
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise ValueError(f"Unknown conflict policy: {on_conflict}")
+
+    report = ImportReport()
+    started = time.perf_counter()
+
+    async def flush(chunk: List[Tuple[int, Any]], loader: _Loader) -> None:
+        rows = validate_chunk(chunk, report, on_error)
+        for row in rows:
+            row["waitlist"] = waitlist
+        if rows:
+            rows, repeats = _dedupe(rows, on_conflict)
+            existing = await loader.existing_entries(rows)
+            legacy = [row for row in rows if existing.get(row["email_key"], {}).get("legacy")]
+            keyed = [row for row in rows if not existing.get(row["email_key"], {}).get("legacy")]
+            inserted = 0
+            if keyed:
+                inserted = await loader.load(keyed, sum(row["email_key"] in existing for row in keyed))
+            if legacy and on_conflict == "update":
+                await loader.update_legacy(legacy, existing)
+            if stats:
+                await apply_deltas(database, _stats_deltas(rows, existing, on_conflict))
+            report.inserted += inserted
+            if on_conflict == "skip":
+                report.skipped += len(rows) - inserted + repeats
+            else:
+                report.updated += len(rows) - inserted + repeats
+            if on_loaded is not None:
+                on_loaded([row["email"] for row in rows])
+
+        report.elapsed_seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(report)
+
+    async with database.connection() as connection:
+        async with connection.transaction():
+            loader = _Loader(connection, database.url.dialect, on_conflict, table, waitlist)
+            chunk: List[Tuple[int, Any]] = []
+            async for item in records:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    await flush(chunk, loader)
+                    chunk = []
+            if chunk or report.processed == 0:
+                await flush(chunk, loader)
+
+    report.elapsed_seconds = time.perf_counter() - started
+    logger.info(
+        f"Imported {report.processed} rows in {report.elapsed_seconds:.1f}s: {report.inserted} inserted, "
+        f"{report.updated} updated, {report.skipped} skipped, {report.failed} failed"
+    )
+    return report
+
+
+async def _read_file(path: str, size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def main(args):
+    errors_file = open(args.errors, "w") if args.errors else None
+
+    def on_error(error: RowError) -> None:
+        if errors_file is not None:
+            errors_file.write(json.dumps(asdict(error), default=str) + "\n")
+
+    def progress(report: ImportReport) -> None:
+        rate = report.processed / report.elapsed_seconds if report.elapsed_seconds else 0.0
+        print(
+            f"{report.processed} rows: {report.inserted} inserted, {report.updated} updated, "
+            f"{report.skipped} skipped, {report.failed} failed ({rate:.0f} rows/s)",
+            file=sys.stderr,
+        )
+
+    try:
+        async with Database(args.database_url) as database:
+            report = await import_entries(
+                database,
+                PARSERS[args.format](_read_file(args.path)),
+                on_conflict=args.on_conflict,
+                chunk_size=args.chunk_size,
+                progress=progress,
+                on_error=on_error,
+                waitlist=args.waitlist,
+            )
+    finally:
+        if errors_file is not None:
+            errors_file.close()
+    for key, value in report.as_dict().items():
+        if key != "errors":
+            print(f"{key:<20}{value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import waitlist entries from a CSV or NDJSON file without sending signup notifications"
+    )
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=sorted(PARSERS))
+    parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="skip")
+    parser.add_argument("--errors", help="Write one JSON line per rejected row to this file")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument("--waitlist", default=DEFAULT_WAITLIST, help="List to import the entries into")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    args = parser.parse_args()
+    if args.format is None:
+        args.format = "csv" if args.path.endswith(".csv") else "ndjson"
+    asyncio.run(main(args))
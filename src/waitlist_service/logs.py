@@ -0,0 +1,173 @@
+"""
+Structured, sampled and queued logging with per-request IDs
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+LOG_QUEUE = os.getenv("LOG_QUEUE", "false").lower() == "true"
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Pass as ``extra=SAMPLED`` on high-volume logs (successes, 429s); LOG_SAMPLE_RATE of them are kept
+SAMPLED = {"sampled": True}
+
+# Accepted X-Request-ID values; anything else is replaced with a new ID
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# ID of the request being handled, set by RequestIdMiddleware
+request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# LogRecord attributes that are not ``extra`` fields
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "request_id", "sampled", "taskName",
+}
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps each record with the current request ID and drops unsampled success logs."""
+
+    def __init__(self, sample_rate: float = LOG_SAMPLE_RATE, rng: Callable[[], float] = random.random):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rng = rng
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sample_rate < 1 and getattr(record, "sampled", False) and self.rng() >= self.sample_rate:
+            return False
+        record.request_id = request_id.get()
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request ID and any ``extra`` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records unformatted, so message formatting happens on the listener thread.
+
+    The stock handler formats on the caller, i.e. on the event loop. Log
+    arguments are therefore read later; don't log objects you mutate right
+    after.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    format: str = LOG_FORMAT,
+    use_queue: bool = LOG_QUEUE,
+    sample_rate: float = LOG_SAMPLE_RATE,
+    stream: Any = None,
+) -> logging.Handler:
+    """Replace the root handlers with one writing ``text`` or ``json`` to ``stream`` (stderr).
+
+    With ``use_queue`` the root logger only enqueues records; a listener
+    thread formats and writes them. Returns the handler attached to the
+    root logger.
+    """
+    global _listener
+    stop_listener()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter() if format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler: logging.Handler = output
+    if use_queue:
+        records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        handler = DeferredQueueHandler(records)
+        _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+    # The filter runs on the caller, where the request ID context is set
+    handler.addFilter(RequestContextFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+
+def stop_listener() -> None:
+    """Flush queued records and stop the listener thread, if there is one."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_listener)
+
+
+class RequestIdMiddleware:
+    """ASGI middleware giving each request an ID from ``X-Request-ID`` or a new one.
+
+    The ID is set for the request's logs and echoed in the response header.
+    """
+
+    def __init__(self, app: Callable, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode()
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        value = None
+        for name, raw in scope["headers"]:
+            if name == self.header:
+                value = raw.decode("latin-1")
+                break
+        # Checked so a client can't put arbitrary text in every log line
+        if value is None or not _REQUEST_ID.fullmatch(value):
+            value = uuid.uuid4().hex
+        token = request_id.set(value)
+
+        async def send_with_id(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (self.header, value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -1,7 +1,28 @@
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from .router import waitlist_router
+from .router import email_filter, entry_cache, idempotency_keys, read_flights, router as waitlist_router
+from .state import database
+from .notifications import notifier
+from .metrics import (
+    METRICS,
+    MetricsMiddleware,
+    register_email_filter,
+    register_entry_cache,
+    register_idempotency,
+    register_notifier,
+    register_pool,
+    register_single_flight,
+    render_response,
+)
 from .events import register_db_events
+from .ratelimit import RateLimitMiddleware, create_rate_limiter
+from .profiling import PROFILE_TOKEN, PROFILING, ProfilingMiddleware, profiles
+from .logs import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE, LOG_SAMPLE_RATE, RequestIdMiddleware, configure_logging
+from .tenants import WAITLIST_MAX_CONCURRENCY, ListBudgets, WaitlistBudgetMiddleware, waitlist_path
+
+# Structured, queued or sampled logging replaces the default stderr handler when asked for
+if LOG_FORMAT != "text" or LOG_QUEUE or LOG_SAMPLE_RATE < 1 or LOG_LEVEL != "INFO":
+    configure_logging()
 
 app = FastAPI(
     title="Waitlist Service",
@@ -9,6 +30,77 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Include the waitlist router for the default list, and again under /lists/{waitlist} for named lists
+app.include_router(waitlist_router, prefix="/waitlist", tags=["waitlist"])
+app.include_router(
+    waitlist_router,
+    prefix="/lists/{waitlist}/waitlist",
+    tags=["waitlist"],
+    dependencies=[Depends(waitlist_path)],
+)
+
+# Optionally trace every route, profile requests on demand and keep slow ones on /debug/profiles;
+# added first so the traces cover the route handling only
+if PROFILING:
+    app.add_middleware(ProfilingMiddleware)
+
+    def check_profile_token(request: Request) -> None:
+        if PROFILE_TOKEN and request.headers.get("x-profile") != PROFILE_TOKEN:
+            raise HTTPException(status_code=403, detail="Profiling token required")
+
+    @app.get("/debug/profiles", include_in_schema=False)
+    async def list_profiles(request: Request):
+        check_profile_token(request)
+        return profiles.summaries()
+
+    @app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+    async def get_profile(profile_id: int, request: Request):
+        check_profile_token(request)
+        record = profiles.get(profile_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return record
+
+# Optionally cap the requests each list has in flight, so one busy list cannot take every
+# pooled connection; inside the rate limiter so rejected requests never take a slot
+list_budgets = ListBudgets() if WAITLIST_MAX_CONCURRENCY > 0 else None
+if list_budgets is not None:
+    app.add_middleware(WaitlistBudgetMiddleware, budgets=list_budgets)
+
+# Optionally limit writes per client IP, and signups per email domain and list (RATE_LIMIT=memory|redis);
+# added before CORS so 429 responses still carry the CORS headers
+rate_limiter = create_rate_limiter()
+if rate_limiter is not None:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=rate_limiter,
+        signup_path=app.url_path_for("create_entry"),
+    )
+
+# Optionally time every route and expose Prometheus/OpenMetrics metrics on /metrics;
+# added after the rate limiter so rejected requests are counted too
+if METRICS:
+    register_pool(database)
+    register_notifier(notifier)
+    if entry_cache is not None:
+        register_entry_cache(entry_cache)
+    if email_filter is not None:
+        register_email_filter(email_filter)
+    if idempotency_keys is not None:
+        register_idempotency(idempotency_keys)
+    if read_flights is not None:
+        register_single_flight(read_flights)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics(request: Request):
+        body, content_type = render_response(request.headers.get("accept"))
+        return Response(body, media_type=content_type)
+
+# Tag every request's logs with an X-Request-ID; added last but one so it wraps
+# the rate limiter and metrics too
+app.add_middleware(RequestIdMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +112,3 @@ app.add_middleware(
 
 # Register database event handlers
 register_db_events(app)
-
-# Include the waitlist router
-app.include_router(waitlist_router, prefix="/waitlist", tags=["waitlist"])
@@ -0,0 +1,356 @@
+"""
+Prometheus/OpenMetrics metrics for endpoints, database queries, the pool and the notifier
+"""
+import logging
+import math
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+METRICS = os.getenv("METRICS", "false").lower() == "true"
+
+# Latency buckets in seconds, from fast cache hits to slow notifier sends
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter per label set.
+
+    Updates are plain dict arithmetic with no lock: the service runs on one
+    event loop thread, so nothing interleaves within an increment.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for labels, value in sorted(self.values.items()):
+            yield "_total", _format_labels(self.labels, labels), value
+
+
+class Histogram:
+    """Bucketed observations per label set, cumulated only when scraped."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # Per label set: one count per bucket plus +Inf, then the sum
+        self.values: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self.values.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for labels, series in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield "_bucket", _format_labels(self.labels, labels, le), cumulative
+            yield "_count", _format_labels(self.labels, labels), cumulative
+            yield "_sum", _format_labels(self.labels, labels), series[-1]
+
+
+class Collected:
+    """Gauge or counter read from ``collect`` at scrape time, e.g. pool sizes and queue depth."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect: Callable[[], Iterable[Tuple[Labels, float]]],
+        labels: Sequence[str] = (),
+        type: str = "gauge",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.type = type
+        self.collect = collect
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        suffix = "_total" if self.type == "counter" else ""
+        for labels, value in self.collect():
+            yield suffix, _format_labels(self.labels, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def register(self, metric: Any) -> Any:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self, openmetrics: bool = False) -> str:
+        """All metrics in the Prometheus text format, or OpenMetrics with ``openmetrics``."""
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {e}")
+                continue
+            family = metric.name
+            if metric.type == "counter" and not openmetrics:
+                family += "_total"
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(
+    Counter("waitlist_http_requests", "HTTP requests by route and status code", ("method", "route", "status"))
+)
+HTTP_REQUEST_DURATION = REGISTRY.register(
+    Histogram("waitlist_http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+)
+DB_QUERY_DURATION = REGISTRY.register(
+    Histogram("waitlist_db_query_duration_seconds", "Database query latency by query name", ("query",))
+)
+DB_QUERY_ERRORS = REGISTRY.register(
+    Counter("waitlist_db_query_errors", "Database queries that raised, by query name", ("query",))
+)
+NOTIFIER_SEND_DURATION = REGISTRY.register(
+    Histogram("waitlist_notifier_send_duration_seconds", "Telegram send latency")
+)
+NOTIFIER_SENDS = REGISTRY.register(
+    Counter("waitlist_notifier_sends", "Telegram sends by result (ok, retry_after, error)", ("result",))
+)
+NOTIFIER_DROPPED = REGISTRY.register(
+    Counter("waitlist_notifier_dropped", "Signups announced only in a summary because the queue was full")
+)
+
+
+def query_name(query: Any) -> str:
+    """Low-cardinality name for a Core statement or SQL string, e.g. ``select:waitlist_entries``."""
+    if isinstance(query, str) or hasattr(query, "text"):
+        # Raw SQL, which ``databases`` wraps in text(): name it by its verb
+        words = str(getattr(query, "text", query)).split(None, 1)
+        return words[0].lower() if words else "text"
+    kind = getattr(query, "__visit_name__", "text")
+    table = getattr(query, "table", None)
+    if table is None and kind == "select":
+        froms = query.get_final_froms()
+        table = froms[0] if froms else None
+    name = getattr(table, "name", None)
+    return f"{kind}:{name}" if name else kind
+
+
+def observe_query(name: str, started: float, failed: bool = False) -> None:
+    DB_QUERY_DURATION.observe(time.perf_counter() - started, name)
+    if failed:
+        DB_QUERY_ERRORS.inc(name)
+
+
+def register_pool(database: Any, registry: Registry = REGISTRY) -> None:
+    """Expose a ``PooledDatabase``'s connection counters."""
+
+    def gauges() -> Iterable[Tuple[Labels, float]]:
+        stats = database.pool_stats()
+        for state in ("checked_out", "waiting", "size", "idle"):
+            if state in stats:
+                yield (state,), stats[state]
+
+    registry.register(Collected("waitlist_db_pool_connections", "Pool connections by state", gauges, ("state",)))
+    registry.register(Collected(
+        "waitlist_db_pool_acquires",
+        "Connections handed out by the pool",
+        lambda: [((), database.stats.acquired)],
+        type="counter",
+    ))
+    registry.register(Collected(
+        "waitlist_db_pool_wait_seconds",
+        "Time spent waiting for a pool connection",
+        lambda: [((), database.stats.wait_seconds)],
+        type="counter",
+    ))
+    registry.register(Collected(
+        "waitlist_db_pool_replaced_connections",
+        "Connections replaced after failing the pre-ping or reaching DB_POOL_RECYCLE_SECONDS",
+        lambda: [(("pre_ping",), database.stats.reconnects), (("age",), database.stats.recycled)],
+        ("reason",),
+        type="counter",
+    ))
+
+
+def register_notifier(notifier: Any, registry: Registry = REGISTRY) -> None:
+    """Expose the Telegram notifier's queue depth."""
+    registry.register(Collected(
+        "waitlist_notifier_queue_depth",
+        "Signups waiting to be announced",
+        lambda: [((), notifier.queue_depth)],
+    ))
+
+
+def register_entry_cache(cache: Any, registry: Registry = REGISTRY) -> None:
+    """Expose how entry lookups by ID were answered by the entry cache."""
+    registry.register(Collected(
+        "waitlist_entry_cache",
+        "Entry cache lookups by outcome (hits, misses, cached not-founds, misses not cached because a write raced them) and evicted entries",
+        lambda: [((outcome,), count) for outcome, count in cache.stats().items()],
+        ("outcome",),
+        type="counter",
+    ))
+
+
+def register_email_filter(email_filter: Any, registry: Registry = REGISTRY) -> None:
+    """Expose the email filter's size, staleness and false-positive rates, and how its checks were answered."""
+    gauges = (
+        "emails", "capacity", "memory_bytes", "stale", "false_positive_rate", "estimated_false_positive_rate"
+    )
+
+    def checks() -> Iterable[Tuple[Labels, float]]:
+        stats = email_filter.stats()
+        yield ("new",), stats["checks"] - stats["maybes"]
+        yield ("maybe",), stats["maybes"]
+        yield ("false_positive",), stats["false_positives"]
+
+    registry.register(Collected(
+        "waitlist_email_filter",
+        "Email filter state: emails held, capacity, memory, stale emails and false-positive rates",
+        lambda: [((name,), float(email_filter.stats()[name])) for name in gauges],
+        ("stat",),
+    ))
+    registry.register(Collected(
+        "waitlist_email_filter_checks",
+        "Signup emails checked against the filter: definitely new, maybe on the list, and maybes that were new",
+        checks,
+        ("outcome",),
+        type="counter",
+    ))
+
+
+def register_idempotency(keys: Any, registry: Registry = REGISTRY) -> None:
+    """Expose how signups sent with an Idempotency-Key were answered."""
+    registry.register(Collected(
+        "waitlist_idempotency_keys",
+        "Idempotency-Key outcomes: stored, replayed, coalesced, mismatched and evicted keys",
+        lambda: [((outcome,), count) for outcome, count in keys.stats().items()],
+        ("outcome",),
+        type="counter",
+    ))
+
+
+def register_single_flight(flights: Any, registry: Registry = REGISTRY) -> None:
+    """Expose how many reads ran a database call and how many shared one already in flight."""
+    registry.register(Collected(
+        "waitlist_single_flight_requests",
+        "Coalesced reads by outcome: led a call, shared one in flight, or ran alone with every slot taken",
+        lambda: [((outcome,), count) for outcome, count in flights.stats().items()],
+        ("outcome",),
+        type="counter",
+    ))
+    registry.register(Collected(
+        "waitlist_single_flight_in_flight",
+        "Distinct reads currently in flight and open to sharing",
+        lambda: [((), flights.in_flight)],
+    ))
+
+
+def route_template(scope: Dict[str, Any]) -> str:
+    """Full path template of the route that handled a request, e.g. ``/waitlist/waitlist/{entry_id}``."""
+    # FastAPI resolves routes of included routers lazily and records the prefixed route here
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    route = context if context is not None else scope.get("route")
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request, labelled by its route template.
+
+    Requests that match no route share the ``unmatched`` label, so probes
+    of random paths cannot create new series.
+    """
+
+    def __init__(self, app: Callable, exclude: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            template = route_template(scope)
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, template)
+            HTTP_REQUESTS.inc(method, template, str(status))
+
+
+def render_response(accept: Optional[str], registry: Registry = REGISTRY) -> Tuple[str, str]:
+    """Body and content type for a scrape, in OpenMetrics when the scraper asks for it."""
+    openmetrics = bool(accept) and "application/openmetrics-text" in accept
+    content_type = OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE
+    return registry.render(openmetrics), content_type
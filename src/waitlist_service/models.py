@@ -1,30 +1,75 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Index, true
 from datetime import datetime
 from .database import Base
 
+# List that entries belong to when none is named, i.e. everything under /waitlist
+DEFAULT_WAITLIST = "default"
+
 class WaitlistEntry(Base):
     """SQLAlchemy model for waitlist entries in the database.
     
     Attributes:
         id (int): Primary key
+        waitlist (str): Name of the list the entry is on
         name (str): User's full name
-        email (str): User's email address (unique)
+        email (str): User's email address as given
+        email_key (str): Canonical form of the email (see ``emails.email_key``), unique within its list;
+            NULL for rows written before it existed until the backfill fills it in
         ip_address (str): User's IP address
         comment (str): Optional comment from user
         referral_source (str): Where the user came from
         created_at (datetime): When the entry was created (UTC)
-        is_active (bool): Whether the entry is active
+        is_active (bool): Whether the entry is active; deleted entries are kept inactive until archived
+        deleted_at (datetime): When the entry was deleted (UTC), if it has been
+        queue_at (datetime): Place in line when moved ahead of ``created_at`` (UTC); NULL means ``created_at``
+        referred_by (int): ID of the entry whose referral code was used to sign up
+        referral_count (int): Signups credited to this entry's referral code
     """
     __tablename__ = "waitlist_entries"
 
     id = Column(Integer, primary_key=True, index=True)
+    waitlist = Column(String, nullable=False, default=DEFAULT_WAITLIST, server_default=DEFAULT_WAITLIST)
     name = Column(String, nullable=False)
-    email = Column(String, unique=True, nullable=False, index=True)
+    email = Column(String, nullable=False)
+    email_key = Column(String, nullable=True)
     ip_address = Column(String, nullable=True)
     comment = Column(String, nullable=True)
     referral_source = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    is_active = Column(Boolean, default=True)
+    is_active = Column(Boolean, nullable=False, default=True, server_default=true())
+    deleted_at = Column(DateTime, nullable=True)
+    queue_at = Column(DateTime, nullable=True)
+    referred_by = Column(Integer, nullable=True, index=True)
+    referral_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    # Emails and their canonical keys are unique per list among active entries, so a
+    # deleted entry's email can sign up again. The indexes behind duplicate checks, keyset
+    # pagination and the referral leaderboard cover active rows only and lead with the
+    # list, so hot queries read only their list's live rows. Exports of every row page
+    # through (created_at, id), and archiving finds deleted rows by deleted_at.
+    __table_args__ = (
+        Index(
+            "uq_waitlist_entries_waitlist_email", "waitlist", "email", unique=True,
+            sqlite_where=is_active.is_(True), postgresql_where=is_active.is_(True),
+        ),
+        Index(
+            "uq_waitlist_entries_waitlist_email_key", "waitlist", "email_key", unique=True,
+            sqlite_where=is_active.is_(True), postgresql_where=is_active.is_(True),
+        ),
+        Index(
+            "ix_waitlist_entries_waitlist_created_at_id", "waitlist", "created_at", "id",
+            sqlite_where=is_active.is_(True), postgresql_where=is_active.is_(True),
+        ),
+        Index(
+            "ix_waitlist_entries_waitlist_referral_count", "waitlist", "referral_count",
+            sqlite_where=is_active.is_(True), postgresql_where=is_active.is_(True),
+        ),
+        Index("ix_waitlist_entries_created_at_id", "created_at", "id"),
+        Index(
+            "ix_waitlist_entries_deleted_at", "deleted_at",
+            sqlite_where=is_active.is_(False), postgresql_where=is_active.is_(False),
+        ),
+    )
 
     def to_dict(self) -> dict:
         """Convert the model instance to a dictionary.
@@ -34,11 +79,125 @@ class WaitlistEntry(Base):
         """
         return {
             "id": self.id,
+            "waitlist": self.waitlist,
             "name": self.name,
             "email": self.email,
+            "email_key": self.email_key,
             "ip_address": self.ip_address,
             "comment": self.comment,
             "referral_source": self.referral_source,
             "created_at": self.created_at,
-            "is_active": self.is_active
+            "is_active": self.is_active,
+            "deleted_at": self.deleted_at,
+            "queue_at": self.queue_at,
+            "referred_by": self.referred_by,
+            "referral_count": self.referral_count
         }
+
+
+class ArchivedEntry(Base):
+    """Waitlist entries moved out of ``waitlist_entries`` by the archival job.
+
+    Same columns as ``WaitlistEntry``, keeping the entry's ID so it can be
+    restored, plus when it was archived. Nothing here is unique but the ID:
+    an email may be archived several times over.
+    """
+    __tablename__ = "waitlist_entries_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    waitlist = Column(String, nullable=False, default=DEFAULT_WAITLIST, server_default=DEFAULT_WAITLIST)
+    name = Column(String, nullable=False)
+    email = Column(String, nullable=False)
+    email_key = Column(String, nullable=True)
+    ip_address = Column(String, nullable=True)
+    comment = Column(String, nullable=True)
+    referral_source = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=True)
+    is_active = Column(Boolean, nullable=False)
+    deleted_at = Column(DateTime, nullable=True)
+    queue_at = Column(DateTime, nullable=True)
+    referred_by = Column(Integer, nullable=True)
+    referral_count = Column(Integer, nullable=False, default=0, server_default="0")
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    # Restores look entries up by ID; archiving finds the batch it just copied by archived_at
+    __table_args__ = (
+        Index("ix_waitlist_entries_archive_archived_at", "archived_at"),
+    )
+
+
+class NotificationOutbox(Base):
+    """Notifications written in the same transaction as the change they announce.
+
+    Attributes:
+        id (int): Primary key
+        topic (str): Kind of notification, e.g. ``signup``
+        payload (str): JSON body of the notification
+        created_at (datetime): When the notification was written (UTC)
+        available_at (datetime): Earliest time the next delivery attempt may run (UTC)
+        claimed_until (datetime): Lease held by the dispatcher sending it, if any (UTC)
+        attempts (int): Failed delivery attempts so far
+        last_error (str): Error from the most recent failed attempt
+        delivered_at (datetime): When the notification was sent (UTC)
+    """
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.utcnow)
+    claimed_until = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    delivered_at = Column(DateTime, nullable=True)
+
+    # Backs the dispatcher's scan for undelivered rows
+    __table_args__ = (
+        Index("ix_notification_outbox_pending", "delivered_at", "available_at"),
+    )
+
+
+class IdempotencyKey(Base):
+    """Responses to requests sent with an ``Idempotency-Key``, replayed to their retries.
+
+    Attributes:
+        key (str): List and client key, ``{waitlist}:{Idempotency-Key}``
+        fingerprint (str): Digest of the request body the key was first used with
+        status_code (int): Status of the stored response; NULL while the first request runs
+        body (str): JSON body of the stored response
+        created_at (datetime): When the key was first used (UTC)
+        expires_at (datetime): When the key may be reused (UTC); a running request's lease until then
+    """
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    body = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    # Backs the purge of expired keys
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+
+class SignupRollup(Base):
+    """Signup counts per list, time bucket and referral source, kept alongside the waitlist.
+
+    Attributes:
+        waitlist (str): Name of the list
+        granularity (str): ``hour``, ``day`` or ``total``
+        bucket (datetime): Start of the hour or day (UTC); the epoch for ``total``
+        referral_source (str): Referral source, or an empty string for none
+        count (int): Signups in the bucket from the source
+    """
+    __tablename__ = "signup_rollups"
+
+    waitlist = Column(String, primary_key=True, default=DEFAULT_WAITLIST, server_default=DEFAULT_WAITLIST)
+    granularity = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    referral_source = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
@@ -1,9 +1,14 @@
 import os
 import logging
-from typing import Optional
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
 from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
 import asyncio
 from dotenv import load_dotenv
+from .metrics import NOTIFIER_DROPPED, NOTIFIER_SEND_DURATION, NOTIFIER_SENDS
 
 # Configure root logger
 logging.basicConfig(level=logging.INFO)
@@ -11,11 +16,71 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+# Queue and pacing configuration. Telegram allows roughly one message per
+# second to a single chat before it starts answering with RetryAfter.
+TELEGRAM_QUEUE_SIZE = int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000"))
+TELEGRAM_RATE_PER_SECOND = float(os.getenv("TELEGRAM_RATE_PER_SECOND", "1"))
+TELEGRAM_BURST = int(os.getenv("TELEGRAM_BURST", "3"))
+TELEGRAM_SUMMARY_TOP_SOURCES = 3
+
+# Queue marker telling the worker to flush and exit
+_STOP = object()
+
+
+@dataclass
+class Signup:
+    """A signup waiting to be announced."""
+    email: str
+    name: Optional[str] = None
+    referral_source: Optional[str] = None
+    waitlist_type: str = "default"
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class TokenBucket:
+    """Paces sends to ``rate`` per second, allowing bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def defer(self, seconds: float) -> None:
+        """Hold off all sends for ``seconds``, e.g. after a RetryAfter from Telegram."""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
 class TelegramNotifier:
-    def __init__(self):
+    def __init__(
+        self,
+        queue_size: int = TELEGRAM_QUEUE_SIZE,
+        rate_per_second: float = TELEGRAM_RATE_PER_SECOND,
+        burst: int = TELEGRAM_BURST,
+    ):
         self.logger = logger
         self.enabled = False
         self.bot = None
+        self.queue_size = queue_size
+        self._bucket = TokenBucket(rate_per_second, burst)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dropped = 0
         
         # Load environment variables
         self.TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
@@ -35,27 +100,50 @@ class TelegramNotifier:
             self.enabled = True
             self.logger.info("TelegramNotifier initialized successfully")
         except Exception as e:
-            self.logger.error(f"Failed to initialize Telegram bot: {e}")
+            self.logger.error("Failed to initialize Telegram bot: %s", e)
 
     async def send_message(self, message: str) -> None:
         if not self.enabled:
-            self.logger.info(f"Telegram notifications disabled. Would have sent: {message}")
+            self.logger.info("Telegram notifications disabled. Would have sent: %s", message)
             return
             
         if not self.bot:
             self.logger.error("Bot not initialized but enabled flag is True")
             return
             
-        self.logger.debug(f"Sending Telegram message: {message}")
+        self.logger.debug("Sending Telegram message: %s", message)
+        try:
+            await self._send(message)
+            self.logger.info("Telegram notification sent successfully")
+        except TelegramRetryAfter as e:
+            self.logger.error("Telegram rate limit hit, pausing sends for %ss", e.retry_after)
+            self._bucket.defer(e.retry_after)
+        except Exception as e:
+            self.logger.error("Failed to send Telegram notification: %s", e)
+
+    async def _send(self, message: str) -> None:
+        """Send one message to the chat, recording its latency and result."""
+        started = time.perf_counter()
         try:
             await self.bot.send_message(
                 chat_id=self.TELEGRAM_CHAT_ID,
                 text=message,
                 parse_mode="Markdown"
             )
-            self.logger.info("Telegram notification sent successfully")
-        except Exception as e:
-            self.logger.error(f"Failed to send Telegram notification: {e}")
+        except TelegramRetryAfter:
+            NOTIFIER_SENDS.inc("retry_after")
+            raise
+        except Exception:
+            NOTIFIER_SENDS.inc("error")
+            raise
+        finally:
+            NOTIFIER_SEND_DURATION.observe(time.perf_counter() - started)
+        NOTIFIER_SENDS.inc("ok")
+
+    @property
+    def queue_depth(self) -> int:
+        """Signups queued for announcement."""
+        return self._queue.qsize() if self._queue is not None else 0
 
     async def notify_new_signup(
         self, 
@@ -64,24 +152,106 @@ class TelegramNotifier:
         referral_source: Optional[str] = None,
         waitlist_type: str = "default"
     ) -> None:
+        """Queue a signup announcement and return without waiting for Telegram."""
+        signup = Signup(email, name, referral_source, waitlist_type)
+        if not self.enabled:
+            await self.send_message(self._format_signup(signup))
+            return
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._worker = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait(signup)
+        except asyncio.QueueFull:
+            # Still counted in the next summary, just without its details
+            self._dropped += 1
+            NOTIFIER_DROPPED.inc()
+            self.logger.warning("Telegram queue full, dropped details for signup %s", email)
+
+    def _format_signup(self, signup: Signup) -> str:
         message = f"🎉 *New Waitlist Signup*\n\n"
-        message += f"*Type:* {waitlist_type}\n"
-        message += f"*Email:* {email}\n"
-        
-        if name:
-            message += f"*Name:* {name}\n"
-        if referral_source:
-            message += f"*Source:* {referral_source}"
+        message += f"*Type:* {signup.waitlist_type}\n"
+        message += f"*Email:* {signup.email}\n"
+
+        if signup.name:
+            message += f"*Name:* {signup.name}\n"
+        if signup.referral_source:
+            message += f"*Source:* {signup.referral_source}"
+        return message
+
+    def _format_summary(self, signups: List[Signup], dropped: int) -> str:
+        elapsed = time.monotonic() - min(signup.queued_at for signup in signups)
+        sources = Counter(signup.referral_source or "direct" for signup in signups)
+        top = ", ".join(
+            f"{source} ({count})"
+            for source, count in sources.most_common(TELEGRAM_SUMMARY_TOP_SOURCES)
+        )
+        message = f"🎉 *+{len(signups) + dropped} signups* in the last {max(1, round(elapsed))}s\n\n"
+        message += f"*Top sources:* {top}"
+        return message
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            # Signups that arrive while we wait for a token are coalesced
+            await self._bucket.acquire()
+            signups = [item]
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    stopping = True
+                    break
+                signups.append(item)
+            await self._send_signups(signups)
 
-        await self.send_message(message)
+    def _format_batch(self, signups: List[Signup], dropped: int = 0) -> str:
+        if len(signups) == 1 and not dropped:
+            return self._format_signup(signups[0])
+        return self._format_summary(signups, dropped)
+
+    async def _send_signups(self, signups: List[Signup]) -> None:
+        dropped, self._dropped = self._dropped, 0
+        await self.send_message(self._format_batch(signups, dropped))
+
+    async def send_signups(self, signups: List[Signup]) -> None:
+        """Announce signups in one message, paced by the token bucket.
+
+        Unlike ``send_message`` this raises if Telegram rejects the message,
+        so callers holding a durable copy (the outbox) can retry it.
+        """
+        message = self._format_batch(signups)
+        if not self.enabled or not self.bot:
+            self.logger.info("Telegram notifications disabled. Would have sent: %s", message)
+            return
+
+        await self._bucket.acquire()
+        try:
+            await self._send(message)
+        except TelegramRetryAfter as e:
+            self._bucket.defer(e.retry_after)
+            raise
+        self.logger.info("Telegram notification sent for %s signups", len(signups))
 
     async def close(self) -> None:
+        if self._worker is not None:
+            # Let the worker send what is already queued before closing the session
+            try:
+                await self._queue.put(_STOP)
+                await self._worker
+            except Exception as e:
+                self.logger.error("Error draining Telegram queue: %s", e)
+            self._worker = None
+
         if self.enabled and self.bot:
             try:
                 await self.bot.session.close()
                 self.logger.info("Telegram bot session closed")
             except Exception as e:
-                self.logger.error(f"Error closing Telegram bot session: {e}")
+                self.logger.error("Error closing Telegram bot session: %s", e)
 
 # Global instance
 notifier = TelegramNotifier()
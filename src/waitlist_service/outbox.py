@@ -0,0 +1,216 @@
+"""
+Transactional outbox for signup notifications
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+from databases import Database
+from databases.interfaces import Record
+from sqlalchemy import Table, or_, select
+from .models import NotificationOutbox
+from .notifications import Signup, TelegramNotifier
+from .queries import DEFAULT_WAITLIST, supports_returning, with_defaults
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Outbox configuration
+NOTIFICATION_OUTBOX = os.getenv("NOTIFICATION_OUTBOX", "false").lower() == "true"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "2"))
+OUTBOX_MAX_BACKOFF_SECONDS = 15 * 60
+
+outbox_table: Table = NotificationOutbox.__table__
+
+SIGNUP_TOPIC = "signup"
+
+
+async def enqueue_signups(
+    database: Database, entries: Sequence[Record], table: Table = outbox_table
+) -> None:
+    """Write a signup notification for each new entry.
+
+    Call this inside the transaction that inserted ``entries`` so the
+    notifications commit or roll back with them.
+    """
+    if not entries:
+        return
+    rows = [
+        with_defaults({
+            "topic": SIGNUP_TOPIC,
+            "payload": json.dumps({
+                "waitlist": entry["waitlist"],
+                "email": entry["email"],
+                "name": entry["name"],
+                "referral_source": entry["referral_source"],
+                "created_at": entry["created_at"].isoformat() if entry["created_at"] else None,
+            }),
+        }, table)
+        for entry in entries
+    ]
+    await database.execute(table.insert().values(rows))
+
+
+def _signup_from_row(row: Record) -> Signup:
+    payload = json.loads(row["payload"])
+    # Age the signup by how long it sat in the outbox, for the summary's time span
+    age = (datetime.utcnow() - row["created_at"]).total_seconds() if row["created_at"] else 0
+    return Signup(
+        email=payload["email"],
+        name=payload.get("name"),
+        referral_source=payload.get("referral_source"),
+        waitlist_type=payload.get("waitlist", DEFAULT_WAITLIST),
+        queued_at=time.monotonic() - max(0.0, age),
+    )
+
+
+class OutboxDispatcher:
+    """Claims undelivered outbox rows in batches and sends them through the notifier.
+
+    Rows are claimed by setting a lease (``claimed_until``) inside a single
+    UPDATE whose subquery uses ``FOR UPDATE SKIP LOCKED`` on PostgreSQL, so
+    several replicas never claim the same row. SQLite serializes writers, so
+    the same statement (without the locking clause) is already exclusive
+    there. Delivery is at least once: a replica that dies mid-send leaves its
+    rows to be reclaimed when the lease expires.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        notifier: TelegramNotifier,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_seconds: float = OUTBOX_POLL_SECONDS,
+        lease_seconds: float = OUTBOX_LEASE_SECONDS,
+        max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+        backoff_seconds: float = OUTBOX_BACKOFF_SECONDS,
+        table: Table = outbox_table,
+    ):
+        self.database = database
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.table = table
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self) -> None:
+        """Start the dispatch loop on the running event loop."""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Check the outbox now instead of at the next poll."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def close(self) -> None:
+        """Stop the dispatch loop once the batch in flight is finished."""
+        if self._worker is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        await self._worker
+        self._worker = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                sent = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"Outbox dispatch failed: {e}")
+                sent = 0
+            if sent or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def dispatch_once(self) -> int:
+        """Claim and send one batch. Returns the number of rows delivered."""
+        rows = await self._claim()
+        if not rows:
+            return 0
+
+        ids = [row["id"] for row in rows]
+        try:
+            await self.notifier.send_signups([_signup_from_row(row) for row in rows])
+        except Exception as e:
+            logger.error(f"Failed to deliver {len(rows)} outbox notifications: {e}")
+            await self._release(rows, e)
+            return 0
+
+        await self.database.execute(
+            self.table.update()
+            .where(self.table.c.id.in_(ids))
+            .values(delivered_at=datetime.utcnow(), claimed_until=None)
+        )
+        return len(rows)
+
+    async def _claim(self) -> List[Record]:
+        table = self.table
+        now = datetime.utcnow()
+        pending = (
+            select(table.c.id)
+            .where(
+                table.c.topic == SIGNUP_TOPIC,
+                table.c.delivered_at.is_(None),
+                table.c.attempts < self.max_attempts,
+                table.c.available_at <= now,
+                or_(table.c.claimed_until.is_(None), table.c.claimed_until < now),
+            )
+            .order_by(table.c.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        claim = table.update().values(claimed_until=now + self.lease)
+
+        if supports_returning(self.database):
+            return await self.database.fetch_all(
+                claim.where(table.c.id.in_(pending)).returning(*table.c)
+            )
+
+        async with self.database.transaction():
+            ids = [row["id"] for row in await self.database.fetch_all(pending)]
+            if not ids:
+                return []
+            await self.database.execute(claim.where(table.c.id.in_(ids)))
+            return await self.database.fetch_all(
+                table.select().where(table.c.id.in_(ids)).order_by(table.c.id)
+            )
+
+    async def _release(self, rows: List[Record], error: Exception) -> None:
+        """Record a failed attempt and schedule each row's retry with exponential backoff."""
+        now = datetime.utcnow()
+        for row in rows:
+            attempts = row["attempts"] + 1
+            delay = min(self.backoff_seconds * 2 ** (attempts - 1), OUTBOX_MAX_BACKOFF_SECONDS)
+            if attempts >= self.max_attempts:
+                logger.error(f"Giving up on outbox notification {row['id']} after {attempts} attempts")
+            await self.database.execute(
+                self.table.update()
+                .where(self.table.c.id == row["id"])
+                .values(
+                    attempts=attempts,
+                    available_at=now + timedelta(seconds=delay),
+                    claimed_until=None,
+                    last_error=str(error)[:500],
+                )
+            )
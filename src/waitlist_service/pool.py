@@ -0,0 +1,264 @@
+"""
+The service's single database pool and its configuration
+"""
+import logging
+import os
+import ssl
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import certifi
+from asyncpg.connection import Connection as AsyncpgConnection
+from asyncpg.exceptions import InterfaceError, OperatorInterventionError, PostgresConnectionError
+from databases import Database, DatabaseURL
+from .metrics import METRICS, observe_query, query_name
+from .profiling import PROFILING, current_trace
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Per-environment pool defaults, overridable with the DB_POOL_* variables
+ENVIRONMENT_DEFAULTS = {
+    "development": {"min_size": 1, "max_size": 5},
+    "production": {"min_size": 5, "max_size": 20},
+}
+
+# Errors from a connection that died while idle in the pool, raised by the pre-ping
+_DISCONNECT_ERRORS = (OSError, InterfaceError, PostgresConnectionError, OperatorInterventionError)
+
+
+@dataclass
+class PoolSettings:
+    """Connection pool options.
+
+    Sizing, recycling, pre-ping and the statement timeout apply to
+    PostgreSQL; SQLite opens a connection per acquire and ignores them.
+    ``recycle_seconds`` is a maximum connection age: older connections
+    are closed when released, and the pool opens fresh ones.
+    """
+    min_size: int = 5
+    max_size: int = 20
+    recycle_seconds: float = 1800
+    pre_ping: bool = False
+    statement_timeout_ms: int = 0
+    verify_ssl: bool = True
+
+    @classmethod
+    def from_env(cls, env: str) -> "PoolSettings":
+        defaults = ENVIRONMENT_DEFAULTS.get(env, ENVIRONMENT_DEFAULTS["production"])
+        return cls(
+            min_size=int(os.getenv("DB_POOL_MIN_SIZE", defaults["min_size"])),
+            max_size=int(os.getenv("DB_POOL_MAX_SIZE", defaults["max_size"])),
+            recycle_seconds=float(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800")),
+            pre_ping=os.getenv("DB_POOL_PRE_PING", "false").lower() == "true",
+            statement_timeout_ms=int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")),
+            verify_ssl=env != "development",
+        )
+
+
+class PoolStats:
+    """Counters for connections handed out by the pool."""
+
+    def __init__(self):
+        self.checked_out = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.reconnects = 0
+        self.recycled = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "checked_out": self.checked_out,
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "wait_seconds_total": self.wait_seconds,
+            "wait_seconds_max": self.max_wait_seconds,
+            "reconnects": self.reconnects,
+            "recycled": self.recycled,
+        }
+
+
+class _AgedConnection(AsyncpgConnection):
+    """asyncpg connection that remembers when it was opened, for recycling by age."""
+
+    __slots__ = ("opened_at",)
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.opened_at = time.monotonic()
+
+
+class _InstrumentedConnection:
+    """Wraps a backend connection to time how long ``acquire`` waits for the pool.
+
+    With ``retry_acquire``, an acquire whose pre-ping finds the connection
+    dead (asyncpg has already closed it) is retried once on a fresh one.
+    With ``max_age``, a connection opened longer ago than that is closed on
+    release instead of going back to the pool.
+    """
+
+    def __init__(self, connection: Any, stats: PoolStats, retry_acquire: bool = False, max_age: float = 0):
+        self._connection = connection
+        self._stats = stats
+        self._retry_acquire = retry_acquire
+        self._max_age = max_age
+
+    async def acquire(self) -> None:
+        stats = self._stats
+        stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            try:
+                await self._connection.acquire()
+            except _DISCONNECT_ERRORS as e:
+                if not self._retry_acquire:
+                    raise
+                stats.reconnects += 1
+                logger.warning("Pooled connection failed its pre-ping, retrying on a fresh one: %s", e)
+                await self._connection.acquire()
+        finally:
+            stats.waiting -= 1
+        waited = time.perf_counter() - started
+        stats.checked_out += 1
+        stats.acquired += 1
+        stats.wait_seconds += waited
+        stats.max_wait_seconds = max(stats.max_wait_seconds, waited)
+
+    async def release(self) -> None:
+        try:
+            if self._max_age:
+                await self._close_if_old()
+            await self._connection.release()
+        finally:
+            self._stats.checked_out -= 1
+
+    async def _close_if_old(self) -> None:
+        # databases keeps asyncpg's pool proxy here, which forwards opened_at
+        driver_connection = getattr(self._connection, "_connection", None)
+        opened_at = getattr(driver_connection, "opened_at", None)
+        if opened_at is None or time.monotonic() - opened_at < self._max_age:
+            return
+        # A closed connection goes back to the pool as an empty slot, reopened on the next acquire
+        self._stats.recycled += 1
+        try:
+            await driver_connection.close()
+        except Exception as e:
+            logger.warning("Closing a recycled connection failed, terminating it: %s", e)
+            driver_connection.terminate()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._connection, name)
+
+
+class _TimedConnection(_InstrumentedConnection):
+    """Also times each query sent through ``databases``, labelled by ``query_name``.
+
+    The time goes to the query metrics and to the traced request's
+    ``execute`` phase, whichever are on.
+    """
+
+    async def _timed(self, name: str, call: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await call
+        except BaseException:
+            if METRICS:
+                observe_query(name, started, failed=True)
+            raise
+        if METRICS:
+            observe_query(name, started)
+        trace = current_trace()
+        if trace is not None:
+            trace.add("execute", name, started)
+        return result
+
+    async def fetch_all(self, query: Any) -> Any:
+        return await self._timed(query_name(query), self._connection.fetch_all(query))
+
+    async def fetch_one(self, query: Any) -> Any:
+        return await self._timed(query_name(query), self._connection.fetch_one(query))
+
+    async def fetch_val(self, query: Any, column: Any = 0) -> Any:
+        return await self._timed(query_name(query), self._connection.fetch_val(query, column))
+
+    async def execute(self, query: Any) -> Any:
+        return await self._timed(query_name(query), self._connection.execute(query))
+
+    async def execute_many(self, queries: Any) -> Any:
+        name = query_name(queries[0]) if queries else "execute_many"
+        return await self._timed(name, self._connection.execute_many(queries))
+
+
+class PooledDatabase(Database):
+    """``databases.Database`` that keeps ``PoolStats`` for its connections.
+
+    ``retry_acquire`` and ``max_age`` are passed to each connection; see
+    ``_InstrumentedConnection``.
+    """
+
+    def __init__(self, url: str, retry_acquire: bool = False, max_age: float = 0, **options: Any):
+        super().__init__(url, **options)
+        self.stats = PoolStats()
+        backend_connection = self._backend.connection
+        wrapper = _TimedConnection if METRICS or PROFILING else _InstrumentedConnection
+        self._backend.connection = lambda: wrapper(backend_connection(), self.stats, retry_acquire, max_age)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Pool counters, plus the pool's own size figures where the driver reports them."""
+        stats = self.stats.as_dict()
+        pool = getattr(self._backend, "_pool", None)
+        if pool is not None and hasattr(pool, "get_size"):
+            stats["size"] = pool.get_size()
+            stats["idle"] = pool.get_idle_size()
+        return stats
+
+
+async def _ping(connection: Any) -> None:
+    await connection.execute("SELECT 1")
+
+
+def pool_options(url: str, settings: PoolSettings) -> Dict[str, Any]:
+    """Driver keyword arguments for ``settings``; only PostgreSQL takes any."""
+    if DatabaseURL(url).dialect != "postgresql":
+        return {}
+
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    if not settings.verify_ssl:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        logger.warning("SSL certificate verification disabled in development mode")
+
+    options: Dict[str, Any] = {
+        "ssl": ssl_context,
+        "min_size": settings.min_size,
+        "max_size": settings.max_size,
+        "connection_class": _AgedConnection,
+    }
+    if settings.pre_ping:
+        options["setup"] = _ping
+    if settings.statement_timeout_ms:
+        options["server_settings"] = {"statement_timeout": str(settings.statement_timeout_ms)}
+    return options
+
+
+def create_database(url: str, settings: Optional[PoolSettings] = None) -> PooledDatabase:
+    """Build the pooled database for ``url``."""
+    settings = settings or PoolSettings()
+    return PooledDatabase(
+        url,
+        retry_acquire=settings.pre_ping,
+        max_age=settings.recycle_seconds,
+        **pool_options(url, settings),
+    )
+
+
+def async_engine_url(url: str) -> str:
+    """SQLAlchemy async-driver form of ``url``, for the one-off schema engine."""
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
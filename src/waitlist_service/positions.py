@@ -0,0 +1,341 @@
+"""
+Waitlist positions: an entry's place in line and the front of the line
+"""
+import asyncio
+import logging
+import os
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table, and_, func, or_, select
+from .queries import DEFAULT_WAITLIST, active, waitlist_table
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Position index configuration
+POSITION_INDEX = os.getenv("POSITION_INDEX", "false").lower() == "true"
+POSITION_SYNC_SECONDS = float(os.getenv("POSITION_SYNC_SECONDS", "5"))
+POSITION_REBUILD_SECONDS = float(os.getenv("POSITION_REBUILD_SECONDS", "600"))
+# App processes writing to the database; the index is only exact when it is the only one
+POSITION_INDEX_REPLICAS = int(os.getenv("POSITION_INDEX_REPLICAS", "1"))
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_ID_BITS = 32
+_ID_MASK = (1 << _ID_BITS) - 1
+
+
+def queue_key(entry: Any) -> int:
+    """Sort key for an entry's place in line: ``queue_at`` (or ``created_at``), then ID.
+
+    Packed into one int so a million entries cost tens of megabytes.
+    """
+    at = entry["queue_at"] or entry["created_at"] or _EPOCH
+    return ((at - _EPOCH) // _MICROSECOND) << _ID_BITS | entry["id"]
+
+
+def key_id(key: int) -> int:
+    return key & _ID_MASK
+
+
+def is_active(entry: Any) -> bool:
+    # Rows written before is_active existed have NULL and count as active
+    return entry["is_active"] is not False
+
+
+class RankedSet:
+    """Sorted set of ints with O(log n) rank.
+
+    Keys live in sorted blocks of about ``load`` items. A Fenwick tree over
+    the block sizes gives the number of keys before any block, so a rank is
+    two bisects and a prefix sum. Adding or removing a key shifts at most
+    one block.
+    """
+
+    def __init__(self, keys: Iterable[int] = (), load: int = 1000):
+        self.load = load
+        ordered = sorted(keys)
+        self._blocks: List[List[int]] = [ordered[i:i + load] for i in range(0, len(ordered), load)]
+        self._maxes = [block[-1] for block in self._blocks]
+        self._len = len(ordered)
+        self._build_tree()
+
+    def _build_tree(self) -> None:
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _add_size(self, block: int, delta: int) -> None:
+        i = block + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _before(self, block: int) -> int:
+        """Number of keys in the blocks before ``block``."""
+        total = 0
+        i = block
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __contains__(self, key: int) -> bool:
+        b = bisect_left(self._maxes, key)
+        if b == len(self._blocks):
+            return False
+        block = self._blocks[b]
+        i = bisect_left(block, key)
+        return i < len(block) and block[i] == key
+
+    def add(self, key: int) -> None:
+        if key in self:
+            return
+        if not self._blocks:
+            self._blocks.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._build_tree()
+            return
+        b = min(bisect_left(self._maxes, key), len(self._blocks) - 1)
+        block = self._blocks[b]
+        insort(block, key)
+        self._maxes[b] = block[-1]
+        self._len += 1
+        if len(block) > 2 * self.load:
+            self._blocks[b:b + 1] = [block[:self.load], block[self.load:]]
+            self._maxes[b:b + 1] = [block[self.load - 1], block[-1]]
+            self._build_tree()
+        else:
+            self._add_size(b, 1)
+
+    def discard(self, key: int) -> None:
+        b = bisect_left(self._maxes, key)
+        if b == len(self._blocks):
+            return
+        block = self._blocks[b]
+        i = bisect_left(block, key)
+        if i == len(block) or block[i] != key:
+            return
+        del block[i]
+        self._len -= 1
+        if block:
+            self._maxes[b] = block[-1]
+            self._add_size(b, -1)
+        else:
+            del self._blocks[b]
+            del self._maxes[b]
+            self._build_tree()
+
+    def rank(self, key: int) -> int:
+        """Number of keys less than ``key``."""
+        b = bisect_left(self._maxes, key)
+        if b == len(self._blocks):
+            return self._len
+        return self._before(b) + bisect_left(self._blocks[b], key)
+
+    def first(self, n: int) -> List[int]:
+        keys: List[int] = []
+        for block in self._blocks:
+            if len(keys) >= n:
+                break
+            keys.extend(block[:n - len(keys)])
+        return keys
+
+
+def _key_columns(table: Table) -> List[Any]:
+    return [table.c.id, table.c.waitlist, table.c.created_at, table.c.queue_at, table.c.is_active]
+
+
+class PositionIndex:
+    """Per-process order-statistic index of the active entries, one line per list.
+
+    Built from the table in the background at startup; until then the
+    caller falls back to SQL. Writes made through this process are applied
+    at once with ``add`` and ``discard``, so the index is exact only while
+    this process makes every write to the list: ``create_position_index``
+    returns None when several replicas share the database. Rows inserted
+    out of band (the import CLI) are picked up every ``sync_seconds`` by
+    ID, and any other change made elsewhere (deletes, restores, moves, or
+    rows committed behind a higher ID) only by a full rebuild every
+    ``rebuild_seconds``.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        sync_seconds: float = POSITION_SYNC_SECONDS,
+        rebuild_seconds: float = POSITION_REBUILD_SECONDS,
+        table: Table = waitlist_table,
+    ):
+        self.database = database
+        self.sync_seconds = sync_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self.table = table
+        self._sets: Optional[Dict[str, RankedSet]] = None
+        self._max_id = 0
+        self._rebuilding = False
+        self._discarded_while_rebuilding: List[Tuple[str, int]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._sets is not None
+
+    def __len__(self) -> int:
+        return sum(len(ranked) for ranked in self._sets.values()) if self._sets is not None else 0
+
+    def _line(self, waitlist: str) -> RankedSet:
+        ranked = self._sets.get(waitlist)
+        if ranked is None:
+            ranked = self._sets[waitlist] = RankedSet()
+        return ranked
+
+    def add(self, entry: Any) -> None:
+        """Put a new, moved or reactivated entry in line."""
+        if self._sets is not None and is_active(entry):
+            self._line(entry["waitlist"]).add(queue_key(entry))
+
+    def discard(self, entry: Any) -> None:
+        """Take a deleted, moved or deactivated entry out of line, as it was before the change."""
+        key = queue_key(entry)
+        if self._sets is not None and entry["waitlist"] in self._sets:
+            self._sets[entry["waitlist"]].discard(key)
+        if self._rebuilding:
+            self._discarded_while_rebuilding.append((entry["waitlist"], key))
+
+    def position(self, entry: Any) -> Tuple[int, int]:
+        """1-based place in line of an active entry and the number of active entries on its list."""
+        ranked = self._sets.get(entry["waitlist"]) or RankedSet()
+        return ranked.rank(queue_key(entry)) + 1, len(ranked)
+
+    def top(self, n: int, waitlist: str = DEFAULT_WAITLIST) -> List[Tuple[int, int]]:
+        """``(entry_id, position)`` for the first ``n`` entries in line on ``waitlist``."""
+        ranked = self._sets.get(waitlist)
+        if ranked is None:
+            return []
+        return [(key_id(key), i + 1) for i, key in enumerate(ranked.first(n))]
+
+    async def rebuild(self) -> None:
+        """Scan the active entries into a fresh index and swap it in."""
+        self._rebuilding = True
+        self._discarded_while_rebuilding = []
+        try:
+            keys: Dict[str, List[int]] = {}
+            max_id = 0
+            query = select(*_key_columns(self.table)).where(active(self.table))
+            async for row in self.database.iterate(query):
+                keys.setdefault(row["waitlist"], []).append(queue_key(row))
+                max_id = max(max_id, row["id"])
+            sets = {waitlist: RankedSet(line) for waitlist, line in keys.items()}
+            # Local discards during the scan may have been read before they happened
+            for waitlist, key in self._discarded_while_rebuilding:
+                if waitlist in sets:
+                    sets[waitlist].discard(key)
+        finally:
+            self._rebuilding = False
+        self._sets = sets
+        # Rows past the scan, including ones added locally meanwhile, come in by ID
+        self._max_id = max_id
+        await self.sync()
+        logger.info(f"Position index rebuilt: {len(self)} active entries on {len(sets)} lists")
+
+    async def sync(self) -> int:
+        """Add entries inserted since the last scan; returns how many were added.
+
+        Only rows with an ID above the highest seen are read, so changes to
+        older rows wait for the next rebuild.
+        """
+        if self._sets is None:
+            return 0
+        query = (
+            select(*_key_columns(self.table))
+            .where(self.table.c.id > self._max_id)
+            .order_by(self.table.c.id)
+        )
+        added = 0
+        for row in await self.database.fetch_all(query):
+            if is_active(row):
+                self._line(row["waitlist"]).add(queue_key(row))
+                added += 1
+            self._max_id = max(self._max_id, row["id"])
+        return added
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_rebuild = loop.time()
+        while True:
+            try:
+                if loop.time() >= next_rebuild:
+                    await self.rebuild()
+                    next_rebuild = loop.time() + self.rebuild_seconds
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error(f"Error refreshing the position index: {e}")
+            await asyncio.sleep(self.sync_seconds)
+
+
+def create_position_index(
+    database: Database, enabled: bool = POSITION_INDEX, replicas: int = POSITION_INDEX_REPLICAS
+) -> Optional[PositionIndex]:
+    """Build the position index, or None to answer positions with SQL.
+
+    With more than one replica, another one's deletes, restores and moves
+    would go unseen until a rebuild, so every replica uses SQL instead.
+    """
+    if not enabled:
+        return None
+    if replicas > 1:
+        logger.warning(f"POSITION_INDEX ignored: it is per-process and {replicas} replicas share the database")
+        return None
+    return PositionIndex(database)
+
+
+async def sql_position(database: Database, entry: Any, table: Table = waitlist_table) -> Tuple[int, int]:
+    """Place in line on the entry's list computed with COUNT(*); cost grows with the list."""
+    at = entry["queue_at"] or entry["created_at"]
+    queue_at = func.coalesce(table.c.queue_at, table.c.created_at)
+    on_list = table.c.waitlist == entry["waitlist"]
+    ahead = select(func.count()).select_from(table).where(
+        on_list,
+        active(table),
+        or_(queue_at < at, and_(queue_at == at, table.c.id < entry["id"])),
+    )
+    total = select(func.count()).select_from(table).where(on_list, active(table))
+    return await database.fetch_val(ahead) + 1, await database.fetch_val(total)
+
+
+async def sql_top(
+    database: Database, n: int, waitlist: str = DEFAULT_WAITLIST, table: Table = waitlist_table
+) -> List[Tuple[int, int]]:
+    """``(entry_id, position)`` for the first ``n`` entries in line on ``waitlist``, sorted by the database."""
+    query = (
+        select(table.c.id)
+        .where(table.c.waitlist == waitlist, active(table))
+        .order_by(func.coalesce(table.c.queue_at, table.c.created_at), table.c.id)
+        .limit(n)
+    )
+    return [(row["id"], i + 1) for i, row in enumerate(await database.fetch_all(query))]
@@ -0,0 +1,155 @@
+"""
+Precompiled statements for the router's fixed queries
+"""
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from databases import Database
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlalchemy.dialects.sqlite import aiosqlite
+from sqlalchemy.engine import Dialect
+from sqlalchemy.sql import ClauseElement
+from .metrics import METRICS, observe_query
+from .profiling import PROFILING, current_trace
+
+# Dialects whose driver connection we can hand precompiled SQL to directly
+_DIALECTS: Dict[str, Dialect] = {
+    "postgresql": asyncpg.dialect(),
+    "sqlite": aiosqlite.dialect(),
+}
+
+
+class _Compiled:
+    """One statement compiled for one dialect, with its parameter order and type processors."""
+
+    def __init__(self, statement: ClauseElement, dialect: Dialect):
+        compiled = statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+        self.sql = compiled.string
+        self.params = []
+        for name in compiled.positiontup:
+            bind = compiled.binds[name]
+            processor = bind.type.dialect_impl(dialect).bind_processor(dialect)
+            self.params.append((name, bind.effective_value, processor))
+
+        self.columns = []
+        for column in getattr(statement, "exported_columns", []):
+            processor = column.type.dialect_impl(dialect).result_processor(dialect, None)
+            self.columns.append((column.name, processor))
+
+    def bind(self, values: Dict[str, Any]) -> List[Any]:
+        args = []
+        for name, default, processor in self.params:
+            value = values.get(name, default)
+            args.append(processor(value) if processor is not None and value is not None else value)
+        return args
+
+    def row(self, raw: Any) -> Dict[str, Any]:
+        return {
+            name: processor(value) if processor is not None else value
+            for (name, processor), value in zip(self.columns, raw)
+        }
+
+
+class PreparedQuery:
+    """A Core statement with ``bindparam`` placeholders, compiled once per dialect.
+
+    On PostgreSQL and SQLite the SQL string goes straight to the driver
+    connection, skipping SQLAlchemy compilation on every call; asyncpg also
+    keeps the server-side prepared statement in its per-connection cache.
+    Other dialects fall back to ``databases`` with the values bound.
+    """
+
+    def __init__(self, statement: ClauseElement, name: str = "prepared"):
+        self.statement = statement
+        self.name = name
+        self._compiled: Dict[str, _Compiled] = {}
+
+    def compiled(self, dialect_name: str) -> Optional[_Compiled]:
+        compiled = self._compiled.get(dialect_name)
+        if compiled is None and dialect_name in _DIALECTS:
+            compiled = self._compiled[dialect_name] = _Compiled(self.statement, _DIALECTS[dialect_name])
+        return compiled
+
+    async def _run(self, database: Database, values: Dict[str, Any], fetch: bool) -> List[Dict[str, Any]]:
+        if not METRICS:
+            return await self._execute(database, values, fetch)
+        started = time.perf_counter()
+        try:
+            rows = await self._execute(database, values, fetch)
+        except BaseException:
+            observe_query(self.name, started, failed=True)
+            raise
+        observe_query(self.name, started)
+        return rows
+
+    async def _execute(self, database: Database, values: Dict[str, Any], fetch: bool) -> List[Dict[str, Any]]:
+        # With profiling on, time the build, execute and fetch phases of traced requests
+        trace = current_trace() if PROFILING else None
+        started = time.perf_counter() if trace is not None else 0.0
+        dialect_name = database.url.dialect
+        compiled = self.compiled(dialect_name)
+        if compiled is None:
+            query = self.statement.params(**values)
+            if trace is not None:
+                trace.add("build", self.name, started)
+            # The pool's connection wrapper times the execute phase here
+            if not fetch:
+                await database.execute(query)
+                return []
+            return [dict(row._mapping) for row in await database.fetch_all(query)]
+
+        args = compiled.bind(values)
+        if trace is not None:
+            started = trace.add("build", self.name, started)
+        async with database.connection() as connection:
+            raw = connection.raw_connection
+            if dialect_name == "postgresql":
+                if not fetch:
+                    await raw.execute(compiled.sql, *args)
+                    rows = []
+                else:
+                    rows = await raw.fetch(compiled.sql, *args)
+                if trace is not None:
+                    started = trace.add("execute", self.name, started)
+            else:
+                cursor = await raw.execute(compiled.sql, args)
+                if trace is not None:
+                    started = trace.add("execute", self.name, started)
+                try:
+                    rows = await cursor.fetchall() if fetch else []
+                finally:
+                    await cursor.close()
+        result = [compiled.row(row) for row in rows]
+        if trace is not None and fetch:
+            trace.add("fetch", self.name, started)
+        return result
+
+    async def fetch_all(self, database: Database, **values: Any) -> List[Dict[str, Any]]:
+        return await self._run(database, values, fetch=True)
+
+    async def fetch_one(self, database: Database, **values: Any) -> Optional[Dict[str, Any]]:
+        rows = await self._run(database, values, fetch=True)
+        return rows[0] if rows else None
+
+    async def execute(self, database: Database, **values: Any) -> None:
+        await self._run(database, values, fetch=False)
+
+
+class StatementCache:
+    """Builds each statement shape once and reuses it, e.g. one INSERT per column set."""
+
+    def __init__(self):
+        self._queries: Dict[Hashable, PreparedQuery] = {}
+
+    def get(self, key: Hashable, build: Callable[[], ClauseElement]) -> PreparedQuery:
+        query = self._queries.get(key)
+        if query is None:
+            name = ":".join(str(part) for part in key[:2]) if isinstance(key, tuple) else str(key)
+            query = self._queries[key] = PreparedQuery(build(), name)
+        return query
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+
+statements = StatementCache()
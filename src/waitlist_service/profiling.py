@@ -0,0 +1,266 @@
+"""
+On-demand request profiles and phase timings for slow requests
+"""
+import cProfile
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from .logs import request_id
+from .metrics import route_template
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Profiling configuration
+PROFILING = os.getenv("PROFILING", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "100"))
+PROFILE_ENGINE = os.getenv("PROFILE_ENGINE", "cprofile").lower()
+# Value of the X-Profile header that profiles a request and unlocks /debug/profiles; empty
+# disables the header and leaves the endpoint open
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+
+# Functions listed in a cProfile report
+PROFILE_TOP_FUNCTIONS = 40
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("profiling_trace", default=None)
+
+
+class Trace:
+    """Phase timings of one request, relative to when it arrived.
+
+    Background tasks started during a request (e.g. the signup batcher's
+    worker) inherit its trace; once the request is finished ``closed`` is
+    set and their spans are dropped.
+    """
+
+    __slots__ = ("started", "spans", "handler_done", "closed")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.handler_done: Optional[float] = None
+        self.closed = False
+
+    def add(self, phase: str, detail: Optional[str], started: float) -> float:
+        ended = time.perf_counter()
+        if self.closed:
+            return ended
+        self.spans.append({
+            "phase": phase,
+            "detail": detail,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round((ended - started) * 1000, 3),
+        })
+        return ended
+
+
+def current_trace() -> Optional[Trace]:
+    """The trace of the request being handled, or None when it is not being traced."""
+    return _trace.get()
+
+
+class span:
+    """Times a block as one phase of the current request's trace; free when there is none."""
+
+    __slots__ = ("phase", "detail", "trace", "started")
+
+    def __init__(self, phase: str, detail: Optional[str] = None):
+        self.phase = phase
+        self.detail = detail
+
+    def __enter__(self) -> "span":
+        self.trace = _trace.get()
+        if self.trace is not None:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.trace is not None:
+            self.trace.add(self.phase, self.detail, self.started)
+
+
+def profiled(endpoint: Callable) -> Callable:
+    """Mark when an endpoint starts and returns, giving the ``validate`` and ``serialize`` phases.
+
+    ``validate`` runs from the request's arrival to the endpoint being
+    called (body parsing and Pydantic validation); ``serialize`` from its
+    return to the response starting. Returns ``endpoint`` unchanged when
+    profiling is off.
+    """
+    if not PROFILING:
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        trace = _trace.get()
+        if trace is not None:
+            trace.add("validate", None, trace.started)
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.handler_done = time.perf_counter()
+
+    return wrapper
+
+
+class ProfileBuffer:
+    """The most recent ``size`` captured requests, newest last."""
+
+    def __init__(self, size: int = PROFILE_BUFFER_SIZE):
+        self.records: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+
+    def add(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        record["id"] = next(self._ids)
+        self.records.append(record)
+        return record
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        return [{key: value for key, value in record.items() if key != "profile"} for record in self.records]
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        for record in self.records:
+            if record["id"] == record_id:
+                return record
+        return None
+
+
+profiles = ProfileBuffer()
+
+
+class _CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self) -> None:
+        self.profile.enable()
+
+    def stop(self) -> str:
+        self.profile.disable()
+        output = io.StringIO()
+        pstats.Stats(self.profile, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return output.getvalue()
+
+
+class _PyinstrumentProfiler:
+    def __init__(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError as e:
+            raise ImportError("PROFILE_ENGINE=pyinstrument requires the 'pyinstrument' package") from e
+        self.profiler = Profiler(async_mode="enabled")
+
+    def start(self) -> None:
+        self.profiler.start()
+
+    def stop(self) -> str:
+        self.profiler.stop()
+        return self.profiler.output_text()
+
+
+PROFILERS = {"cprofile": _CProfiler, "pyinstrument": _PyinstrumentProfiler}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware tracing every request and keeping the interesting ones in ``buffer``.
+
+    A request is profiled with ``engine`` when it sends ``X-Profile: <token>``
+    or is picked at ``sample_rate``; its profile and phase timings are kept.
+    Any other request slower than ``slow_ms`` keeps its phase timings only.
+    One request is profiled at a time: the profiler sees everything the
+    event loop runs meanwhile, so concurrent profiles would overlap.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        buffer: ProfileBuffer = profiles,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        token: str = PROFILE_TOKEN,
+        engine: str = PROFILE_ENGINE,
+        exclude: tuple = ("/metrics", "/debug/profiles"),
+    ):
+        if engine not in PROFILERS:
+            raise ValueError(f"Unknown PROFILE_ENGINE {engine!r}; expected one of {', '.join(PROFILERS)}")
+        self.app = app
+        self.buffer = buffer
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.token = token.encode()
+        self.profiler_class = PROFILERS[engine]
+        self.exclude = exclude
+        self.active = False
+
+    def _requested(self, scope: Dict[str, Any]) -> Optional[str]:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and value == self.token:
+                    return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        token = _trace.set(trace)
+        status = 500
+
+        async def send_traced(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace.handler_done is not None:
+                    trace.add("serialize", None, trace.handler_done)
+            await send(message)
+
+        reason = self._requested(scope)
+        profiler = None
+        if reason is not None and not self.active:
+            profiler = self.profiler_class()
+            self.active = True
+            profiler.start()
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            duration_ms = (time.perf_counter() - trace.started) * 1000
+            report = None
+            if profiler is not None:
+                report = profiler.stop()
+                self.active = False
+            _trace.reset(token)
+            trace.closed = True
+            if profiler is None and duration_ms >= self.slow_ms:
+                reason = "slow"
+            if report is not None or reason == "slow":
+                self.buffer.add({
+                    "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "reason": reason,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route_template(scope),
+                    "status": status,
+                    "duration_ms": round(duration_ms, 3),
+                    "request_id": request_id.get(),
+                    "spans": trace.spans,
+                    "profile": report,
+                })
+                if reason == "slow":
+                    logger.warning("Slow request %s %s took %.1f ms", scope["method"], scope["path"], duration_ms)
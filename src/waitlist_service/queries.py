@@ -0,0 +1,290 @@
+"""
+Query helpers for the waitlist table
+"""
+import base64
+import binascii
+import json
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from asyncpg.exceptions import IntegrityConstraintViolationError
+from databases import Database
+from databases.interfaces import Record
+from sqlalchemy import Integer, Table, and_, bindparam, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import Select
+from .emails import email_key
+from .models import DEFAULT_WAITLIST, WaitlistEntry
+from .prepared import statements
+
+# The table created from the ORM model; ``Base.metadata.tables['waitlist']``
+# is never registered in this service.
+waitlist_table: Table = WaitlistEntry.__table__
+
+# ``databases`` talks to the drivers directly, so unique violations surface as
+# the driver's exception type rather than SQLAlchemy's.
+INTEGRITY_ERRORS = (
+    IntegrityError,
+    sqlite3.IntegrityError,
+    IntegrityConstraintViolationError,
+)
+
+
+class DuplicateEmailError(ValueError):
+    """Raised when a signup's email is already on its waitlist."""
+
+    def __init__(self, email: str):
+        super().__init__(f"Email {email} already exists in waitlist")
+        self.email = email
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+# SQLite gained RETURNING in 3.35
+SQLITE_RETURNING_VERSION = (3, 35, 0)
+
+
+def supports_returning(database: Database) -> bool:
+    """Whether INSERT/UPDATE ... RETURNING can be used on this database."""
+    dialect = database.url.dialect
+    if dialect == "postgresql":
+        return True
+    if dialect == "sqlite":
+        return sqlite3.sqlite_version_info >= SQLITE_RETURNING_VERSION
+    return False
+
+
+def with_defaults(values: Dict[str, Any], table: Table = waitlist_table) -> Dict[str, Any]:
+    """Fill in client-side column defaults (``created_at``, ``is_active``) and the ``email_key``.
+
+    ``databases`` compiles Core statements itself and skips the Python-side
+    defaults SQLAlchemy would normally apply.
+    """
+    row = dict(values)
+    if "email" in row and "email_key" not in row and "email_key" in table.c:
+        row["email_key"] = email_key(row["email"])
+    for column in table.c:
+        default = column.default
+        if column.name in row or default is None:
+            continue
+        if default.is_scalar:
+            row[column.name] = default.arg
+        elif default.is_callable:
+            row[column.name] = default.arg(None)
+    return row
+
+
+async def insert_returning(
+    database: Database, values: Dict[str, Any], table: Table = waitlist_table
+) -> Mapping[str, Any]:
+    """Insert a row and return it in a single round trip where possible.
+
+    Falls back to INSERT followed by SELECT on the same connection for
+    dialects without RETURNING support.
+    """
+    row = with_defaults(values, table)
+    if supports_returning(database):
+        columns = tuple(sorted(row))
+        prepared = statements.get(
+            ("insert", table.name, columns),
+            lambda: table.insert()
+            .values({column: bindparam(column) for column in columns})
+            .returning(*table.c),
+        )
+        return await prepared.fetch_one(database, **row)
+
+    query = table.insert().values(**row)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        return await database.fetch_one(
+            table.select().where(table.c.id == last_record_id)
+        )
+
+
+def active(table: Table = waitlist_table) -> Any:
+    """Rows that have not been deleted; spelled as the partial indexes' predicate so they are used."""
+    return table.c.is_active.is_(True)
+
+
+def _by_id(table: Table, entry_id: Any, waitlist: Any = None, is_active: Optional[bool] = None) -> Any:
+    """Match one row by ID, and when given only on ``waitlist`` and only if its ``is_active`` matches."""
+    condition = table.c.id == entry_id
+    if waitlist is not None:
+        condition = and_(condition, table.c.waitlist == waitlist)
+    if is_active is not None:
+        condition = and_(condition, table.c.is_active.is_(is_active))
+    return condition
+
+
+async def update_returning(
+    database: Database,
+    entry_id: int,
+    values: Dict[str, Any],
+    table: Table = waitlist_table,
+    waitlist: Optional[str] = None,
+    is_active: Optional[bool] = None,
+) -> Optional[Mapping[str, Any]]:
+    """Update a row by ID and return the updated row, or None if it does not exist.
+
+    With ``waitlist`` a row on another list counts as not existing, and with
+    ``is_active`` so does a row that is not (or is) active before the update.
+    """
+    if supports_returning(database):
+        scoped = waitlist is not None
+        columns = tuple(sorted(values))
+        prepared = statements.get(
+            ("update", table.name, columns, scoped, is_active),
+            lambda: table.update()
+            .where(_by_id(table, bindparam("entry_id"), bindparam("waitlist") if scoped else None, is_active))
+            .values({column: bindparam(column) for column in columns})
+            .returning(*table.c),
+        )
+        keys = {"entry_id": entry_id, "waitlist": waitlist} if scoped else {"entry_id": entry_id}
+        return await prepared.fetch_one(database, **keys, **values)
+
+    query = table.update().where(_by_id(table, entry_id, waitlist)).values(**values)
+
+    async with database.transaction():
+        # Checked first: once updated the row may no longer match ``is_active``
+        if await database.fetch_one(table.select().where(_by_id(table, entry_id, waitlist, is_active))) is None:
+            return None
+        await database.execute(query)
+        return await database.fetch_one(table.select().where(_by_id(table, entry_id, waitlist)))
+
+
+async def fetch_entry(
+    database: Database, entry_id: int, table: Table = waitlist_table
+) -> Optional[Dict[str, Any]]:
+    """Fetch one row by ID, or None if it does not exist."""
+    prepared = statements.get(
+        ("get", table.name),
+        lambda: table.select().where(table.c.id == bindparam("entry_id")),
+    )
+    return await prepared.fetch_one(database, entry_id=entry_id)
+
+
+async def fetch_entry_by_email(
+    database: Database, email: str, waitlist: str = DEFAULT_WAITLIST, table: Table = waitlist_table
+) -> Optional[Dict[str, Any]]:
+    """Fetch the active row of ``waitlist`` whose email has the same canonical key as ``email``, or None."""
+    prepared = statements.get(
+        ("get_by_email", table.name),
+        lambda: table.select().where(
+            table.c.waitlist == bindparam("waitlist"), table.c.email_key == bindparam("email_key"), active(table)
+        ),
+    )
+    return await prepared.fetch_one(database, waitlist=waitlist, email_key=email_key(email))
+
+
+async def delete_entry(database: Database, entry_id: int, table: Table = waitlist_table) -> None:
+    """Delete one row by ID."""
+    prepared = statements.get(
+        ("delete", table.name),
+        lambda: table.delete().where(table.c.id == bindparam("entry_id")),
+    )
+    await prepared.execute(database, entry_id=entry_id)
+
+
+def encode_cursor(row: Mapping[str, Any]) -> str:
+    """Opaque cursor pointing just past ``row`` in (created_at, id) order."""
+    payload = json.dumps([row["created_at"].isoformat(), row["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor from ``encode_cursor`` into its (created_at, id) key."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, entry_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(entry_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+
+def select_entries(
+    referral_source: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    table: Table = waitlist_table,
+    waitlist: Optional[str] = None,
+) -> Select:
+    """Select active entries newest first, ordered by (created_at, id) so keyset paging is stable.
+
+    Entries of every list are selected unless ``waitlist`` names one.
+    """
+    query = table.select().where(active(table)).order_by(table.c.created_at.desc(), table.c.id.desc())
+    if waitlist is not None:
+        query = query.where(table.c.waitlist == waitlist)
+    if referral_source is not None:
+        query = query.where(table.c.referral_source == referral_source)
+    if created_after is not None:
+        query = query.where(table.c.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(table.c.created_at < created_before)
+    return query
+
+
+def _page_query(
+    table: Table, has_cursor: bool, has_source: bool, has_after: bool, has_before: bool
+) -> Select:
+    """The page query with placeholders for whichever filters are in use."""
+    query = select_entries(
+        bindparam("referral_source") if has_source else None,
+        bindparam("created_after") if has_after else None,
+        bindparam("created_before") if has_before else None,
+        table,
+        bindparam("waitlist"),
+    )
+    if has_cursor:
+        query = query.where(
+            or_(
+                table.c.created_at < bindparam("cursor_created_at"),
+                and_(
+                    table.c.created_at == bindparam("cursor_created_at"),
+                    table.c.id < bindparam("cursor_id"),
+                ),
+            )
+        )
+    return query.limit(bindparam("limit", type_=Integer))
+
+
+async def fetch_page(
+    database: Database,
+    limit: int,
+    cursor: Optional[str] = None,
+    referral_source: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    table: Table = waitlist_table,
+    waitlist: str = DEFAULT_WAITLIST,
+) -> Tuple[List[Mapping[str, Any]], Optional[str]]:
+    """Fetch up to ``limit`` entries of ``waitlist`` after ``cursor`` and the cursor for the next page.
+
+    The next cursor is None once the last page has been returned.
+    """
+    key = (
+        cursor is not None,
+        referral_source is not None,
+        created_after is not None,
+        created_before is not None,
+    )
+    prepared = statements.get(("page", table.name, key), lambda: _page_query(table, *key))
+
+    values: Dict[str, Any] = dict(
+        waitlist=waitlist,
+        referral_source=referral_source,
+        created_after=created_after,
+        created_before=created_before,
+    )
+    if cursor is not None:
+        values["cursor_created_at"], values["cursor_id"] = decode_cursor(cursor)
+
+    # One extra row tells us whether another page exists
+    rows = await prepared.fetch_all(database, limit=limit + 1, **values)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1])
@@ -0,0 +1,319 @@
+"""
+Per-IP, per-email-domain and per-list rate limiting in front of the waitlist routes
+"""
+import ipaddress
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .logs import SAMPLED
+from .tenants import split_list_path
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rate limit configuration: RATE_LIMIT is "memory", "redis" or unset (no limits)
+RATE_LIMIT = os.getenv("RATE_LIMIT", "").lower()
+RATE_LIMIT_IP_PER_MINUTE = float(os.getenv("RATE_LIMIT_IP_PER_MINUTE", "10"))
+RATE_LIMIT_IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", "5"))
+RATE_LIMIT_DOMAIN_PER_MINUTE = float(os.getenv("RATE_LIMIT_DOMAIN_PER_MINUTE", "60"))
+RATE_LIMIT_DOMAIN_BURST = int(os.getenv("RATE_LIMIT_DOMAIN_BURST", "20"))
+# Signups per list across every client; 0 leaves lists unlimited
+RATE_LIMIT_LIST_PER_MINUTE = float(os.getenv("RATE_LIMIT_LIST_PER_MINUTE", "0"))
+RATE_LIMIT_LIST_BURST = int(os.getenv("RATE_LIMIT_LIST_BURST", "100"))
+RATE_LIMIT_ALLOWLIST = os.getenv("RATE_LIMIT_ALLOWLIST", "127.0.0.1,::1")
+RATE_LIMIT_DOMAIN_ALLOWLIST = os.getenv(
+    "RATE_LIMIT_DOMAIN_ALLOWLIST", "gmail.com,googlemail.com,outlook.com,hotmail.com,yahoo.com,icloud.com"
+)
+# Proxies whose X-Forwarded-For entries are believed; 0 (no proxy) uses the socket peer
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Methods that are limited; reads pass straight through
+LIMITED_METHODS = frozenset({"POST", "PUT", "DELETE"})
+
+# Signup bodies larger than this are left to the route's own validation
+MAX_SIGNUP_BODY = 64 * 1024
+
+
+class MemoryLimitStore:
+    """Per-process GCRA buckets: one "theoretical arrival time" per key.
+
+    A key whose arrival time has passed is a full bucket and is dropped, so
+    memory holds only recently active clients, capped at ``max_keys``.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._arrivals: "OrderedDict[str, float]" = OrderedDict()
+
+    async def take(self, key: str, interval: float, tolerance: float) -> float:
+        now = time.monotonic()
+        arrival = max(self._arrivals.get(key, now), now)
+        if arrival - now > tolerance:
+            return arrival - now - tolerance
+        self._arrivals[key] = arrival + interval
+        self._arrivals.move_to_end(key)
+        self._prune(now)
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        arrivals = self._arrivals
+        while arrivals:
+            key, arrival = next(iter(arrivals.items()))
+            if arrival > now and len(arrivals) <= self.max_keys:
+                break
+            del arrivals[key]
+
+    def __len__(self) -> int:
+        return len(self._arrivals)
+
+
+# The same GCRA step in one round trip, timed by the Redis server so replicas agree
+_GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local arrival = tonumber(redis.call('GET', KEYS[1]) or now)
+if arrival < now then arrival = now end
+if arrival - now > tolerance then return arrival - now - tolerance end
+arrival = arrival + interval
+redis.call('SET', KEYS[1], string.format('%.0f', arrival), 'PX', math.ceil((arrival - now) / 1000))
+return 0
+"""
+
+
+class RedisLimitStore:
+    """GCRA buckets shared by every replica through Redis."""
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+        self._script = client.register_script(_GCRA_SCRIPT)
+
+    async def take(self, key: str, interval: float, tolerance: float) -> float:
+        wait_us = await self._script(
+            keys=[self.prefix + key], args=[int(interval * 1e6), int(tolerance * 1e6)]
+        )
+        return int(wait_us) / 1e6
+
+
+class Limit:
+    """``per_minute`` requests on average, up to ``burst`` at once."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.per_minute = per_minute
+        self.interval = 60 / per_minute if per_minute > 0 else 0.0
+        self.tolerance = self.interval * (max(burst, 1) - 1)
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0
+
+
+def _networks(allowlist: str) -> List[Any]:
+    return [ipaddress.ip_network(item.strip(), strict=False) for item in allowlist.split(",") if item.strip()]
+
+
+class RateLimiter:
+    """Checks a request's client IP and, for signups, its email domain and list.
+
+    ``check`` returns 0 when the request may proceed, otherwise the seconds
+    until it would be allowed. If the store fails the request is let through.
+    """
+
+    def __init__(
+        self,
+        store: Any,
+        ip_limit: Limit = Limit(RATE_LIMIT_IP_PER_MINUTE, RATE_LIMIT_IP_BURST),
+        domain_limit: Limit = Limit(RATE_LIMIT_DOMAIN_PER_MINUTE, RATE_LIMIT_DOMAIN_BURST),
+        list_limit: Limit = Limit(RATE_LIMIT_LIST_PER_MINUTE, RATE_LIMIT_LIST_BURST),
+        allowlist: str = RATE_LIMIT_ALLOWLIST,
+        domain_allowlist: str = RATE_LIMIT_DOMAIN_ALLOWLIST,
+    ):
+        self.store = store
+        self.ip_limit = ip_limit
+        self.domain_limit = domain_limit
+        self.list_limit = list_limit
+        self._networks = _networks(allowlist)
+        self._domains = frozenset(item.strip().lower() for item in domain_allowlist.split(",") if item.strip())
+        self._allowed_ips: Dict[str, bool] = {}
+        self.rejected = 0
+
+    def ip_allowed(self, ip: str) -> bool:
+        """Whether ``ip`` is on the allowlist and skips every limit."""
+        allowed = self._allowed_ips.get(ip)
+        if allowed is None:
+            try:
+                address = ipaddress.ip_address(ip)
+                allowed = any(address in network for network in self._networks)
+            except ValueError:
+                allowed = False
+            if len(self._allowed_ips) >= RATE_LIMIT_MAX_KEYS:
+                self._allowed_ips.clear()
+            self._allowed_ips[ip] = allowed
+        return allowed
+
+    async def check(self, ip: Optional[str], domain: Optional[str] = None, waitlist: Optional[str] = None) -> float:
+        if ip is not None and self.ip_allowed(ip):
+            return 0.0
+        try:
+            if ip is not None and self.ip_limit.enabled:
+                wait = await self.store.take(f"ip:{ip}", self.ip_limit.interval, self.ip_limit.tolerance)
+                if wait:
+                    self.rejected += 1
+                    return wait
+            if domain and domain not in self._domains and self.domain_limit.enabled:
+                wait = await self.store.take(
+                    f"domain:{domain}", self.domain_limit.interval, self.domain_limit.tolerance
+                )
+                if wait:
+                    self.rejected += 1
+                    return wait
+            if waitlist is not None and self.list_limit.enabled:
+                wait = await self.store.take(f"list:{waitlist}", self.list_limit.interval, self.list_limit.tolerance)
+                if wait:
+                    self.rejected += 1
+                    return wait
+        except Exception as e:
+            logger.error("Rate limit check failed; allowing request: %s", e)
+        return 0.0
+
+
+def client_ip(headers: Iterable[Tuple[bytes, bytes]], peer: Optional[Tuple[str, int]], trusted_proxies: int) -> Optional[str]:
+    """The client address as seen by the last ``trusted_proxies`` proxies.
+
+    Each proxy appends the address it received the request from to
+    ``X-Forwarded-For``, so entries further left can be forged by the client.
+    """
+    if trusted_proxies > 0:
+        for name, value in headers:
+            if name == b"x-forwarded-for":
+                hops = [hop.strip() for hop in value.decode("latin-1").split(",")]
+                return hops[-min(trusted_proxies, len(hops))]
+    return peer[0] if peer else None
+
+
+def email_domain(body: bytes) -> Optional[str]:
+    """Lower-cased domain of the ``email`` field of a JSON signup body, if there is one."""
+    try:
+        email = json.loads(body).get("email")
+    except (ValueError, AttributeError):
+        return None
+    if not isinstance(email, str) or "@" not in email:
+        return None
+    return email.rsplit("@", 1)[1].strip().lower() or None
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 with ``Retry-After`` when a client is over its limit.
+
+    Reads pass straight through. Writes are limited per client IP, and JSON
+    bodies sent to ``signup_path`` (of any list) also per email domain and
+    per list; those bodies are read here and replayed to the route.
+    """
+
+    def __init__(
+        self,
+        app: Callable[..., Awaitable[None]],
+        limiter: RateLimiter,
+        signup_path: str,
+        trusted_proxies: int = RATE_LIMIT_TRUSTED_PROXIES,
+    ):
+        self.app = app
+        self.limiter = limiter
+        self.signup_path = signup_path
+        self.trusted_proxies = trusted_proxies
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["method"] not in LIMITED_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        ip = client_ip(scope["headers"], scope.get("client"), self.trusted_proxies)
+        if ip is not None and self.limiter.ip_allowed(ip):
+            await self.app(scope, receive, send)
+            return
+
+        domain = waitlist = None
+        if scope["method"] == "POST":
+            name, path = split_list_path(scope["path"])
+            if path == self.signup_path:
+                waitlist = name
+                body, receive = await _buffer_body(receive)
+                if body is not None:
+                    domain = email_domain(body)
+
+        wait = await self.limiter.check(ip, domain, waitlist)
+        if wait:
+            logger.warning(
+                "Rate limited %s %s from %s (%s)",
+                scope["method"], scope["path"], ip, domain or "no domain",
+                extra=SAMPLED,
+            )
+            await _too_many_requests(send, wait)
+            return
+        await self.app(scope, receive, send)
+
+
+async def _buffer_body(receive: Callable) -> Tuple[Optional[bytes], Callable]:
+    """Read the request body and return it with a ``receive`` that replays it.
+
+    Gives up on bodies over MAX_SIGNUP_BODY, returning None for the body.
+    """
+    messages = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if size > MAX_SIGNUP_BODY or not message.get("more_body", False):
+            break
+
+    body = None
+    if size <= MAX_SIGNUP_BODY and messages[-1]["type"] == "http.request":
+        body = b"".join(message.get("body", b"") for message in messages)
+
+    async def replay() -> Dict[str, Any]:
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return body, replay
+
+
+async def _too_many_requests(send: Callable, wait: float) -> None:
+    body = b'{"detail":"Too many requests."}'
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_rate_limiter(kind: str = RATE_LIMIT) -> Optional[RateLimiter]:
+    """Build the configured rate limiter, or None when rate limiting is off."""
+    if not kind:
+        return None
+    if kind == "memory":
+        return RateLimiter(MemoryLimitStore())
+    if kind == "redis":
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise ImportError("RATE_LIMIT=redis requires the redis package (pip install redis)") from e
+        return RateLimiter(RedisLimitStore(redis.from_url(REDIS_URL)))
+    raise ValueError(f"Unknown RATE_LIMIT store: {kind}")
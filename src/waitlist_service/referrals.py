@@ -0,0 +1,188 @@
+"""
+Referral codes and referral crediting
+"""
+import functools
+import hashlib
+import logging
+import os
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Integer, Table, bindparam, select
+from .cache import MemoryCache, MISS
+from .prepared import statements
+from .queries import DEFAULT_WAITLIST, active, waitlist_table, supports_returning, update_returning, fetch_entry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Referral configuration
+REFERRAL_CODE_SECRET = os.getenv("REFERRAL_CODE_SECRET", "")
+REFERRAL_BOOST_SECONDS = float(os.getenv("REFERRAL_BOOST_SECONDS", "0"))
+LEADERBOARD_CACHE_SECONDS = float(os.getenv("LEADERBOARD_CACHE_SECONDS", "5"))
+
+# Crockford base32: no I, L, O or U, so codes survive being read aloud or retyped
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {char: value for value, char in enumerate(_ALPHABET)}
+_DECODE.update({"O": 0, "I": 1, "L": 1})
+_CODE_LENGTH = 8  # 40 bits: a permuted 32-bit ID and an 8-bit check
+_ROUNDS = 4
+
+
+@functools.lru_cache(maxsize=8)
+def _hashers(secret: bytes) -> Tuple[Any, ...]:
+    """Keyed BLAKE2b states for each Feistel round and the check, copied per use.
+
+    Keying a BLAKE2b state costs more than hashing the few bytes of an ID,
+    so each key is set up once.
+    """
+    rounds = tuple(
+        hashlib.blake2b(key=secret, digest_size=2, person=bytes([round_number]) * 16)
+        for round_number in range(_ROUNDS)
+    )
+    return rounds + (hashlib.blake2b(key=secret, digest_size=1, person=b"referral-check!!"),)
+
+
+def _round(hashers: Tuple[Any, ...], round_number: int, half: int) -> int:
+    hasher = hashers[round_number].copy()
+    hasher.update(half.to_bytes(2, "big"))
+    return int.from_bytes(hasher.digest(), "big")
+
+
+def _check(hashers: Tuple[Any, ...], value: int) -> int:
+    hasher = hashers[_ROUNDS].copy()
+    hasher.update(value.to_bytes(4, "big"))
+    return hasher.digest()[0]
+
+
+def _secret(secret: Optional[str]) -> bytes:
+    return (REFERRAL_CODE_SECRET if secret is None else secret).encode()[:64]
+
+
+def encode_referral_code(entry_id: int, secret: Optional[str] = None) -> str:
+    """The referral code of an entry.
+
+    Codes are a keyed Feistel permutation of the ID, so two entries can
+    never share one and nothing needs to be stored or retried; an 8-bit
+    keyed check rejects most mistyped or made-up codes.
+    """
+    hashers = _hashers(_secret(secret))
+    left, right = entry_id >> 16 & 0xFFFF, entry_id & 0xFFFF
+    for round_number in range(_ROUNDS):
+        left, right = right, left ^ _round(hashers, round_number, right)
+    permuted = left << 16 | right
+    value = permuted << 8 | _check(hashers, permuted)
+    return "".join(_ALPHABET[value >> shift & 31] for shift in range(5 * (_CODE_LENGTH - 1), -1, -5))
+
+
+def decode_referral_code(code: str, secret: Optional[str] = None) -> Optional[int]:
+    """The entry ID a referral code belongs to, or None if the code is not valid."""
+    code = code.strip().upper().replace("-", "")
+    if len(code) != _CODE_LENGTH or any(char not in _DECODE for char in code):
+        return None
+    value = 0
+    for char in code:
+        value = value << 5 | _DECODE[char]
+    hashers = _hashers(_secret(secret))
+    permuted, check = value >> 8, value & 0xFF
+    if _check(hashers, permuted) != check:
+        return None
+    left, right = permuted >> 16, permuted & 0xFFFF
+    for round_number in reversed(range(_ROUNDS)):
+        left, right = right ^ _round(hashers, round_number, left), left
+    return left << 16 | right
+
+
+async def credit_referrals(
+    database: Database,
+    entries: Iterable[Any],
+    boost_seconds: float = REFERRAL_BOOST_SECONDS,
+    table: Table = waitlist_table,
+) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """Credit each new entry's referrer; returns ``(before, after)`` rows of the referrers.
+
+    Call this inside the transaction that inserted ``entries``. The counter
+    is incremented in place (``referral_count = referral_count + n``), so
+    concurrent signups never lose a credit. With ``boost_seconds`` the
+    referrer also moves that far ahead in line per referral. Referrers that
+    no longer exist are skipped.
+    """
+    counts = Counter(entry["referred_by"] for entry in entries if entry["referred_by"] is not None)
+    credited = []
+    # A fixed order keeps concurrent batches from locking referrers in opposite orders
+    for referrer_id, referrals in sorted(counts.items()):
+        after = await _increment(database, referrer_id, referrals, table)
+        if after is None:
+            logger.warning(f"Referrer {referrer_id} not found; referral not credited")
+            continue
+        before = {**after, "referral_count": after["referral_count"] - referrals}
+        if boost_seconds:
+            # The increment above holds the referrer's row lock, so this read-modify-write is safe
+            queue_at = (after["queue_at"] or after["created_at"]) - timedelta(seconds=boost_seconds * referrals)
+            after = dict(await update_returning(database, referrer_id, {"queue_at": queue_at}, table))
+        credited.append((before, after))
+    return credited
+
+
+async def _increment(database: Database, entry_id: int, referrals: int, table: Table) -> Optional[Dict[str, Any]]:
+    if supports_returning(database):
+        prepared = statements.get(
+            ("credit_referral", table.name),
+            lambda: table.update()
+            .where(table.c.id == bindparam("entry_id"))
+            .values(referral_count=table.c.referral_count + bindparam("referrals", type_=Integer))
+            .returning(*table.c),
+        )
+        return await prepared.fetch_one(database, entry_id=entry_id, referrals=referrals)
+
+    await database.execute(
+        table.update().where(table.c.id == entry_id).values(referral_count=table.c.referral_count + referrals)
+    )
+    return await fetch_entry(database, entry_id, table)
+
+
+async def fetch_leaderboard(
+    database: Database, limit: int, waitlist: str = DEFAULT_WAITLIST, table: Table = waitlist_table
+) -> List[Dict[str, Any]]:
+    """The active entries of ``waitlist`` with the most referrals, earliest signup first among ties."""
+    prepared = statements.get(
+        ("leaderboard", table.name),
+        lambda: select(table.c.id, table.c.name, table.c.referral_count)
+        .where(table.c.waitlist == bindparam("waitlist"), table.c.referral_count > 0, active(table))
+        .order_by(table.c.referral_count.desc(), table.c.id)
+        .limit(bindparam("limit", type_=Integer)),
+    )
+    return [
+        {
+            "entry_id": row["id"],
+            "name": row["name"],
+            "referral_code": encode_referral_code(row["id"]),
+            "referral_count": row["referral_count"],
+        }
+        for row in await prepared.fetch_all(database, waitlist=waitlist, limit=limit)
+    ]
+
+
+class Leaderboard:
+    """Referral leaderboards cached in memory for ``ttl`` seconds per list and limit.
+
+    The counters change with every referred signup, so the board is allowed
+    to lag by up to ``ttl`` rather than re-sorting on each request.
+    """
+
+    def __init__(self, database: Database, ttl: float = LEADERBOARD_CACHE_SECONDS, table: Table = waitlist_table):
+        self.database = database
+        self.ttl = ttl
+        self.table = table
+        self._cache = MemoryCache(max_size=1024)
+
+    async def get(self, limit: int, waitlist: str = DEFAULT_WAITLIST) -> List[Dict[str, Any]]:
+        key = f"{waitlist}:{limit}"
+        board = await self._cache.get(key)
+        if board is MISS:
+            board = await fetch_leaderboard(self.database, limit, waitlist, self.table)
+            if self.ttl > 0:
+                await self._cache.set(key, board, self.ttl)
+        return board
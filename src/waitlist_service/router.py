@@ -1,40 +1,138 @@
 # backend/route/website_services/waitlist_router.py
 
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException, Request, status
-from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from dataclasses import asdict
+from datetime import datetime, timedelta
+import asyncio
 import logging
-import os
-import ssl
-from databases import Database
-from sqlalchemy.exc import IntegrityError
-from .database import Base
-from .state import database
-from .models import WaitlistEntry
+from .state import database, DATABASE_URL
+from .queries import (
+    insert_returning,
+    update_returning,
+    fetch_entry,
+    fetch_entry_by_email,
+    select_entries,
+    fetch_page,
+    decode_cursor,
+    DuplicateEmailError,
+    InvalidCursorError,
+    INTEGRITY_ERRORS,
+)
+from .archive import ARCHIVE_DELETED_AFTER_DAYS, archive_entries, restore_entry
+from .export import EXPORTERS, EXPORT_MEDIA_TYPES
+from .importer import PARSERS, import_entries
+from .exporter import ExportJobs
+from .batching import SignupBatcher, SIGNUP_BATCHING
+from .outbox import OutboxDispatcher, enqueue_signups, NOTIFICATION_OUTBOX
+from .email_filter import EmailFilter, EMAIL_FILTER
+from .cache import create_entry_cache
+from .singleflight import SingleFlight, SINGLE_FLIGHT
+from . import stats
+from .positions import create_position_index, is_active, sql_position, sql_top
+from .stats import SIGNUP_STATS, record_signups, record_removals
+from .referrals import Leaderboard, credit_referrals, decode_referral_code, encode_referral_code
 from .schemas.waitlist import WaitlistEntry, WaitlistCreate, WaitlistUpdate
 from .notifications import notifier
+from .logs import SAMPLED
+from .profiling import profiled, span
+from .serialization import FAST_SERIALIZATION, dumps, entries_response, entry_json, entry_response
+from .tenants import current_waitlist
+from .ratelimit import RATE_LIMIT_TRUSTED_PROXIES, client_ip
+from .idempotency import (
+    MAX_KEY_LENGTH,
+    IdempotencyKeyInProgress,
+    IdempotencyKeyMismatch,
+    StoredResponse,
+    create_idempotency_keys,
+    fingerprint,
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Get database URL from environment
-DATABASE_URL = os.getenv("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL environment variable not set")
-
-# Configure SSL context for database connection
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE  # Only for development! Remove in production
-
-# Initialize database with SSL context
-database = Database(
-    DATABASE_URL,
-    ssl=ssl_context,
-    min_size=5,
-    max_size=20
+
+async def referrers_credited(credited):
+    """Refresh cached copies of referrers whose counters (and places in line) a signup changed."""
+    for before, after in credited:
+        entry_changed(after["id"])
+        if entry_cache is not None:
+            await entry_cache.put(after)
+        if position_index is not None and after["queue_at"] != before["queue_at"]:
+            position_index.discard(before)
+            position_index.add(after)
+
+
+# Optionally group concurrent signups into multi-row INSERTs
+signup_batcher = (
+    SignupBatcher(database, outbox=NOTIFICATION_OUTBOX, stats=SIGNUP_STATS, on_credited=referrers_credited)
+    if SIGNUP_BATCHING
+    else None
 )
 
+# Optionally deliver signup notifications from a durable outbox table
+outbox_dispatcher = OutboxDispatcher(database, notifier) if NOTIFICATION_OUTBOX else None
+
+# Optionally answer "definitely new email" without a database lookup
+email_filter = EmailFilter(database) if EMAIL_FILTER else None
+
+# Optionally replay signups retried with the same Idempotency-Key (IDEMPOTENCY_KEYS=memory|database)
+idempotency_keys = create_idempotency_keys(database)
+
+# Optionally cache entry lookups by ID (ENTRY_CACHE=memory|redis)
+entry_cache = create_entry_cache()
+
+# Optionally share one database call among concurrent identical reads
+read_flights = SingleFlight() if SINGLE_FLIGHT else None
+
+# Optionally answer position-in-line queries from an in-memory index (single replica only)
+position_index = create_position_index(database)
+
+# Referral leaderboard, cached for LEADERBOARD_CACHE_SECONDS
+leaderboard = Leaderboard(database)
+
+# Bulk file exports, run in child processes
+export_jobs = ExportJobs(DATABASE_URL)
+
+def respond(row, status_code: int = status.HTTP_200_OK):
+    """The row for FastAPI to validate against the response model, or with FAST_SERIALIZATION its JSON."""
+    return entry_response(row, status_code) if FAST_SERIALIZATION else row
+
+
+def on_list(entry, waitlist: str):
+    """``entry`` if it is active and on ``waitlist``, else None: deleted entries and other lists' are not found."""
+    return entry if entry is not None and entry["waitlist"] == waitlist and is_active(entry) else None
+
+
+async def shared(key, fn):
+    """``fn()``, or with SINGLE_FLIGHT the result of the identical call already in flight."""
+    if read_flights is None:
+        return await fn()
+    return await read_flights.do(key, fn)
+
+
+def entry_changed(entry_id: int) -> None:
+    """Make reads of an entry that start after writing it run afresh rather than join one in flight."""
+    if read_flights is not None:
+        read_flights.forget(("entry", entry_id))
+        read_flights.forget(("referral", entry_id))
+        read_flights.forget(("position", entry_id))
+
+
+async def load_entry(entry_id: int, waitlist: str):
+    """Entry ``entry_id`` of ``waitlist``, through the entry cache when there is one."""
+    if entry_cache is not None:
+        entry = await shared(("entry", entry_id), lambda: entry_cache.get_entry(database, entry_id))
+    else:
+        entry = await shared(("entry", entry_id), lambda: fetch_entry(database, entry_id))
+    return on_list(entry, waitlist)
+
+
+# Page size limits for GET /waitlist/
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 # Initialize the router
 router = APIRouter(prefix="/waitlist", tags=["Waitlist CRUD"])
 
@@ -46,107 +144,506 @@ router = APIRouter(prefix="/waitlist", tags=["Waitlist CRUD"])
     status_code=status.HTTP_201_CREATED,
     summary="Create a new waitlist entry",
 )
-async def create_entry(entry: WaitlistCreate, request: Request):
+@profiled
+async def create_entry(entry: WaitlistCreate, request: Request, waitlist: str = Depends(current_waitlist)):
     """
     Create a new waitlist entry with the provided name, email, comment, and optional referral_source.
-    The client's IP address is recorded from the request headers.
+    The client's IP address is recorded from the request headers. A `referrer_code` from another
+    entry on the same list credits the signup to that entry; any other code is ignored.
+    With IDEMPOTENCY_KEYS set, a retry carrying the same `Idempotency-Key` header as an earlier
+    signup gets that signup's response again, marked `Idempotent-Replayed: true`.
     """
-    logger.info(f"Creating entry: {entry.dict()}")
+    key = request.headers.get("Idempotency-Key")
+    if idempotency_keys is None or key is None:
+        return respond(await insert_signup(entry, request, waitlist), status.HTTP_201_CREATED)
+    if not 0 < len(key) <= MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters.",
+        )
 
-    # Extract client IP
-    ip_address = request.headers.get("X-Forwarded-For")
-    if ip_address:
-        ip_address = ip_address.split(",")[0].strip()
-    else:
-        ip_address = request.client.host
-    logger.info(f"Client IP address: {ip_address}")
+    async def handler():
+        try:
+            new_entry = await insert_signup(entry, request, waitlist)
+        except HTTPException as e:
+            return StoredResponse(e.status_code, dumps({"detail": e.detail}))
+        return StoredResponse(status.HTTP_201_CREATED, dumps(entry_json(new_entry)))
+
+    try:
+        stored, replayed = await idempotency_keys.run(waitlist, key, fingerprint(entry.model_dump()), handler)
+    except IdempotencyKeyMismatch:
+        logger.warning("Idempotency-Key %s reused with a different request.", key)
+        raise HTTPException(
+            status_code=422,
+            detail="This Idempotency-Key was used with a different request.",
+        )
+    except IdempotencyKeyInProgress:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still in progress.",
+        )
+    if replayed:
+        logger.info("Replayed signup response for Idempotency-Key %s", key, extra=SAMPLED)
+    return Response(
+        stored.body,
+        status_code=stored.status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"} if replayed else None,
+    )
 
-    # Insert the new entry, including the comment and referral_source
-    query = Base.metadata.tables['waitlist'].insert().values(
+
+async def insert_signup(entry: WaitlistCreate, request: Request, waitlist: str):
+    """Insert ``entry`` on ``waitlist`` and announce it; returns the new row or raises HTTPException."""
+    logger.info("Creating entry: %s", entry, extra=SAMPLED)
+
+    # Client IP by the rate limiter's rule, so the stored address is the one it limits
+    ip_address = client_ip(request.scope["headers"], request.client, RATE_LIMIT_TRUSTED_PROXIES)
+    logger.debug("Client IP address: %s", ip_address)
+
+    # Resubmitted forms are common; reject known emails before attempting the INSERT
+    if email_filter is not None and email_filter.might_contain(entry.email):
+        existing = await fetch_entry_by_email(database, entry.email, waitlist)
+        if existing is not None:
+            logger.info("Email %s already exists.", entry.email)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="An entry with this email already exists.",
+            )
+        email_filter.record_false_positive()
+
+    # Insert the new entry, including the comment and referral_source,
+    # and get the created row back from the same statement
+    values = dict(
+        waitlist=waitlist,
         name=entry.name,
         email=entry.email,
+        email_key=entry.email_key,
         ip_address=ip_address,
         comment=entry.comment,
         referral_source=entry.referral_source,  # Include referral_source
     )
+    if entry.referrer_code:
+        referrer_id = decode_referral_code(entry.referrer_code)
+        if referrer_id is None:
+            logger.warning("Ignoring invalid referrer code: %s", entry.referrer_code)
+        elif await load_entry(referrer_id, waitlist) is None:
+            logger.warning("Ignoring referrer code %s: not on waitlist %s", entry.referrer_code, waitlist)
+        else:
+            values["referred_by"] = referrer_id
     try:
-        last_record_id = await database.execute(query)
-        logger.info(f"Inserted entry with ID: {last_record_id}")
-    except IntegrityError:
-        logger.error(f"IntegrityError: Email {entry.email} already exists.")
+        if signup_batcher is not None:
+            with span("execute", "signup_batch"):
+                new_entry = await signup_batcher.submit(values)
+        elif outbox_dispatcher is not None or SIGNUP_STATS or "referred_by" in values:
+            async with database.transaction():
+                new_entry = await insert_returning(database, values)
+                if outbox_dispatcher is not None:
+                    await enqueue_signups(database, [new_entry])
+                if SIGNUP_STATS:
+                    await record_signups(database, [new_entry])
+                credited = await credit_referrals(database, [new_entry])
+            await referrers_credited(credited)
+        else:
+            new_entry = await insert_returning(database, values)
+        logger.info("Inserted entry with ID: %s", new_entry["id"], extra={**SAMPLED, "entry_id": new_entry["id"]})
+        if email_filter is not None:
+            email_filter.add(entry.email)
+        entry_changed(new_entry["id"])
+        if entry_cache is not None:
+            await entry_cache.put(new_entry)
+        if position_index is not None:
+            position_index.add(new_entry)
+    except (DuplicateEmailError, *INTEGRITY_ERRORS):
+        logger.error("IntegrityError: Email %s already exists.", entry.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="An entry with this email already exists.",
         )
     except Exception as e:
-        logger.error(f"Unexpected error during insertion: {e}")
+        logger.error("Unexpected error during insertion: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred.",
         )
 
-    # Retrieve the created entry
-    query = Base.metadata.tables['waitlist'].select().where(Base.metadata.tables['waitlist'].c.id == last_record_id)
-    new_entry = await database.fetch_one(query)
-    logger.info(f"New entry retrieved: {new_entry}")
+    # The outbox row is already committed; let the dispatcher pick it up now
+    if outbox_dispatcher is not None:
+        outbox_dispatcher.wake()
+        return new_entry
 
-    # Send Telegram notification
+    # Queue the Telegram notification; the notifier sends it in the background
     try:
-        await notifier.notify_new_signup(
-            email=entry.email,
-            name=entry.name,
-            referral_source=entry.referral_source
-        )
+        with span("notify"):
+            await notifier.notify_new_signup(
+                email=entry.email,
+                name=entry.name,
+                referral_source=entry.referral_source,
+                waitlist_type=waitlist,
+            )
     except Exception as e:
-        logger.error(f"Failed to send Telegram notification: {e}")
+        logger.error("Failed to send Telegram notification: %s", e)
         # Don't raise an exception - we don't want to fail the signup if notification fails
 
     return new_entry
 
 
+# TODO: DUE TO THE notifications with telegram we no longer need to make the list accessible via post requests i believe, its highly unsafe and bad user usage
+@router.get(
+    "/", response_model=List[WaitlistEntry], summary="List waitlist entries a page at a time"
+)
+@profiled
+async def list_entries(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    referral_source: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    Retrieve waitlist entries ordered by creation date descending, up to `limit` at a time.
+    When more entries remain, the `X-Next-Cursor` response header holds the cursor
+    to pass back for the next page.
+    """
+    logger.info("Listing waitlist entries (limit=%s, cursor=%s)", limit, cursor, extra=SAMPLED)
+    try:
+        entries, next_cursor = await fetch_page(
+            database,
+            limit,
+            cursor=cursor,
+            referral_source=referral_source,
+            created_after=created_after,
+            created_before=created_before,
+            waitlist=waitlist,
+        )
+    except InvalidCursorError:
+        logger.warning("Invalid cursor: %s", cursor)
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    logger.info("Number of entries retrieved: %s", len(entries), extra=SAMPLED)
+    if FAST_SERIALIZATION:
+        return entries_response(entries, headers=dict(response.headers))
+    return entries
+
+
+@router.get("/export", summary="Stream all waitlist entries as NDJSON or CSV")
+async def export_entries(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    referral_source: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    Stream waitlist entries ordered by creation date descending, one row at a time,
+    without loading the full result set into memory.
+    """
+    logger.info("Exporting waitlist %s entries as %s", waitlist, format)
+    query = select_entries(referral_source, created_after, created_before, waitlist=waitlist)
+    return StreamingResponse(
+        EXPORTERS[format](database, query),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="waitlist.{format}"'},
+    )
+
+
+@router.post(
+    "/export/jobs",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Start a bulk export of the waitlist to a compressed file",
+)
+async def start_export_job(
+    format: Literal["csv", "parquet", "arrow"] = "csv",
+    compression: Literal["gzip", "zstd", "none"] = "gzip",
+    since: Optional[str] = None,
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    Export the list's entries, or only those after the `since` watermark of a previous
+    export, to a file in EXPORT_DIR. The export runs in a separate process; poll
+    `GET /waitlist/export/jobs/{job_id}` for its file and next watermark.
+    """
+    if since is not None:
+        try:
+            decode_cursor(since)
+        except InvalidCursorError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid watermark.",
+            )
+    try:
+        job = await export_jobs.start(format, compression, since, waitlist)
+    except RuntimeError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An export is already running.",
+        )
+    return asdict(job)
+
+
+@router.get("/export/jobs/{job_id}", summary="Get the status of a bulk export")
+async def get_export_job(job_id: str):
+    """
+    Return an export job's status and, once it has succeeded, its file and watermark.
+    """
+    job = export_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return asdict(job)
+
+
+@router.post("/import", summary="Bulk import waitlist entries from streamed NDJSON or CSV")
+async def import_waitlist(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    on_conflict: Literal["skip", "update"] = "skip",
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    Load entries from the request body, read as it streams in, without sending signup
+    notifications. Existing emails are skipped, or with `on_conflict=update` get the
+    imported name, comment and referral_source. Returns the counts and the rejected rows.
+    """
+    logger.info("Importing waitlist %s entries from %s (on_conflict=%s)", waitlist, format, on_conflict)
+
+    def progress(report):
+        logger.info("Import progress: %s rows, %s failed", report.processed, report.failed)
+
+    try:
+        report = await import_entries(
+            database,
+            PARSERS[format](request.stream()),
+            on_conflict=on_conflict,
+            progress=progress,
+            on_loaded=email_filter.add_many if email_filter is not None else None,
+            waitlist=waitlist,
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Import body must be UTF-8.",
+        )
+    except Exception as e:
+        logger.error("Unexpected error during import: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred.",
+        )
+    if position_index is not None:
+        await position_index.sync()
+    # Cached entries overwritten by an update import refresh within ENTRY_CACHE_TTL
+    return report.as_dict()
+
+
+@router.post("/archive", summary="Move deleted and old waitlist entries to the archive")
+async def archive_waitlist(
+    deleted_days: float = Query(ARCHIVE_DELETED_AFTER_DAYS, ge=0),
+    created_before: Optional[datetime] = None,
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    Move the list's entries deleted at least `deleted_days` ago, and with `created_before`
+    every entry that signed up before then, to the archive table in batches. Archived
+    entries can still be restored.
+    """
+    logger.info(
+        "Archiving waitlist %s entries (deleted_days=%s, created_before=%s)", waitlist, deleted_days, created_before
+    )
+
+    async def archived(rows):
+        for row in rows:
+            entry_changed(row["id"])
+            if entry_cache is not None:
+                await entry_cache.invalidate(row["id"])
+            if is_active(row):
+                if email_filter is not None:
+                    email_filter.discard(row["email"])
+                if position_index is not None:
+                    position_index.discard(row)
+
+    report = await archive_entries(
+        database,
+        deleted_before=datetime.utcnow() - timedelta(days=deleted_days),
+        created_before=created_before,
+        waitlist=waitlist,
+        on_archived=archived,
+    )
+    return report.as_dict()
+
+
+@router.get("/stats", summary="Total signups and signups per referral source")
+async def get_stats(waitlist: str = Depends(current_waitlist)):
+    """
+    Read the list's precomputed signup counters. Without SIGNUP_STATS the counts are
+    computed from the waitlist table on every call.
+    """
+
+    async def totals():
+        if SIGNUP_STATS:
+            return await stats.totals(database, waitlist)
+        return stats.summarize(await stats.live_counts(database, waitlist))
+
+    return await shared(("stats", waitlist), totals)
+
+
+@router.get("/stats/series", summary="Signups per hour or day and referral source")
+async def get_stats_series(
+    granularity: Literal["day", "hour"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    referral_source: Optional[str] = None,
+    waitlist: str = Depends(current_waitlist),
+):
+    """
+    The list's signup counts per bucket and referral source in `[start, end)`, oldest first.
+    Buckets without signups are omitted.
+    """
+    if SIGNUP_STATS:
+        return await stats.series(database, granularity, start, end, referral_source, waitlist)
+    return stats.to_series(
+        await stats.live_counts(database, waitlist),
+        granularity,
+        start=start,
+        end=end,
+        referral_source=referral_source,
+    )
+
+
+@router.get("/stats/check", summary="Compare the signup counters with the waitlist table")
+async def check_stats():
+    """
+    Recount signups with a GROUP BY over the waitlist table and list the counters
+    that disagree with it. Covers every list.
+    """
+    return await stats.check(database)
+
+
+@router.post("/stats/rebuild", summary="Recompute the signup counters from the waitlist table")
+async def rebuild_stats():
+    """
+    Replace every stored counter, of every list, with a fresh count from the waitlist table.
+    """
+    return {"counters": await stats.rebuild(database)}
+
+
+@router.post("/email-filter/rebuild", summary="Rebuild the email filter from the waitlist table")
+async def rebuild_email_filter():
+    """
+    Rescan the active entries' emails into a fresh filter, dropping deleted and changed
+    emails, and return its stats. Joins the rebuild already running, if any.
+    """
+    if email_filter is None:
+        raise HTTPException(status_code=404, detail="Email filter is not enabled")
+    # Shielded: a client hanging up must not cancel the rebuild
+    await asyncio.shield(email_filter.start())
+    return email_filter.stats()
+
+
+@router.get("/positions/top", summary="The entries at the front of the line")
+async def get_top_positions(
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), waitlist: str = Depends(current_waitlist)
+):
+    """
+    Return the IDs and positions of the first `limit` active entries in line.
+    """
+    if position_index is not None and position_index.ready:
+        top = position_index.top(limit, waitlist)
+    else:
+        top = await shared(("top", limit, waitlist), lambda: sql_top(database, limit, waitlist))
+    return [{"entry_id": entry_id, "position": position} for entry_id, position in top]
+
+
+@router.get("/referrals/leaderboard", summary="The entries with the most referred signups")
+async def get_referral_leaderboard(
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), waitlist: str = Depends(current_waitlist)
+):
+    """
+    Return the top `limit` referrers by credited signups. The board is cached and may
+    lag new signups by up to LEADERBOARD_CACHE_SECONDS.
+    """
+    return await leaderboard.get(limit, waitlist)
+
+
+@router.get("/referrals/{code}", summary="Look up a referral code")
+async def get_referral(code: str, waitlist: str = Depends(current_waitlist)):
+    """
+    Return the entry a referral code belongs to and how many signups it has been credited with.
+    """
+    entry_id = decode_referral_code(code)
+    entry = (
+        on_list(await shared(("referral", entry_id), lambda: fetch_entry(database, entry_id)), waitlist)
+        if entry_id is not None
+        else None
+    )
+    if entry is None:
+        logger.warning("Referral code %s not found.", code)
+        raise HTTPException(status_code=404, detail="Referral code not found")
+    return {
+        "entry_id": entry_id,
+        "name": entry["name"],
+        "referral_code": encode_referral_code(entry_id),
+        "referral_count": entry["referral_count"],
+    }
+
+
 @router.get(
     "/{entry_id}",
     response_model=WaitlistEntry,
     summary="Retrieve a waitlist entry by ID",
 )
-async def get_entry(entry_id: int):
+@profiled
+async def get_entry(entry_id: int, waitlist: str = Depends(current_waitlist)):
     """
     Retrieve a specific waitlist entry by its ID.
     """
-    logger.info(f"Retrieving entry with ID: {entry_id}")
-    query = Base.metadata.tables['waitlist'].select().where(Base.metadata.tables['waitlist'].c.id == entry_id)
-    entry = await database.fetch_one(query)
+    logger.info("Retrieving entry with ID: %s", entry_id, extra=SAMPLED)
+    entry = await load_entry(entry_id, waitlist)
     if entry is None:
-        logger.warning(f"Entry with ID {entry_id} not found.")
+        logger.warning("Entry with ID %s not found.", entry_id)
         raise HTTPException(status_code=404, detail="Entry not found")
-    logger.info(f"Entry found: {entry}")
-    return entry
+    logger.info("Entry found: %s", entry, extra={**SAMPLED, "entry_id": entry_id})
+    return respond(entry)
 
 
-# TODO: DUE TO THE notifications with telegram we no longer need to make the list accessible via post requests i believe, its highly unsafe and bad user usage
-@router.get(
-    "/", response_model=List[WaitlistEntry], summary="List all waitlist entries"
-)
-async def list_entries():
+@router.get("/{entry_id}/position", summary="Get a waitlist entry's place in line")
+@profiled
+async def get_position(entry_id: int, waitlist: str = Depends(current_waitlist)):
     """
-    Retrieve all waitlist entries, ordered by creation date descending.
+    Return the entry's 1-based place in line among active entries and how many
+    active entries there are.
     """
-    logger.info("Listing all waitlist entries.")
-    query = Base.metadata.tables['waitlist'].select().order_by(Base.metadata.tables['waitlist'].c.created_at.desc())
-    entries = await database.fetch_all(query)
-    logger.info(f"Number of entries retrieved: {len(entries)}")
-    return entries
+
+    async def place():
+        entry = await fetch_entry(database, entry_id)
+        if entry is None or not is_active(entry):
+            return entry, None
+        if position_index is not None and position_index.ready:
+            return entry, position_index.position(entry)
+        return entry, await sql_position(database, entry)
+
+    entry, place_in_line = await shared(("position", entry_id), place)
+    if on_list(entry, waitlist) is None:
+        logger.warning("Entry with ID %s not found in line.", entry_id)
+        raise HTTPException(status_code=404, detail="Entry not found")
+    position, total = place_in_line
+    return {"entry_id": entry_id, "position": position, "total": total}
 
 
 @router.put(
     "/{entry_id}", response_model=WaitlistEntry, summary="Update a waitlist entry by ID"
 )
-async def update_entry(entry_id: int, entry: WaitlistUpdate):
+@profiled
+async def update_entry(entry_id: int, entry: WaitlistUpdate, waitlist: str = Depends(current_waitlist)):
     """
     Update an existing waitlist entry's name, email, comment, and/or referral_source.
     Only provided fields will be updated.
     """
-    logger.info(f"Updating entry ID {entry_id} with data: {entry.dict(exclude_unset=True)}")
+    logger.info("Updating entry ID %s with data: %s", entry_id, entry, extra=SAMPLED)
 
     # Prepare the update data, including the comment and referral_source
     update_data = {k: v for k, v in entry.dict().items() if v is not None}
@@ -156,38 +653,47 @@ async def update_entry(entry_id: int, entry: WaitlistUpdate):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No fields provided for update.",
         )
+    if entry.email is not None:
+        update_data["email_key"] = entry.email_key
 
-    # Execute the update
-    query = (
-        Base.metadata.tables['waitlist'].update()
-        .where(Base.metadata.tables['waitlist'].c.id == entry_id)
-        .values(**update_data)
-    )
+    # Execute the update and get the updated row back from the same statement
     try:
-        await database.execute(query)
-        logger.info(f"Entry ID {entry_id} updated successfully.")
-    except IntegrityError:
-        logger.error(f"IntegrityError: Email {entry.email} already exists.")
+        if SIGNUP_STATS and "referral_source" in update_data:
+            # Move the entry's signup from its old source's counters to the new one
+            async with database.transaction():
+                previous = await fetch_entry(database, entry_id)
+                updated_entry = await update_returning(
+                    database, entry_id, update_data, waitlist=waitlist, is_active=True
+                )
+                if updated_entry is not None:
+                    await record_removals(database, [previous])
+                    await record_signups(database, [updated_entry])
+        else:
+            updated_entry = await update_returning(database, entry_id, update_data, waitlist=waitlist, is_active=True)
+    except INTEGRITY_ERRORS:
+        logger.error("IntegrityError: Email %s already exists.", entry.email)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="An entry with this email already exists.",
         )
     except Exception as e:
-        logger.error(f"Unexpected error during update: {e}")
+        logger.error("Unexpected error during update: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred.",
         )
 
-    # Fetch the updated entry
-    query = Base.metadata.tables['waitlist'].select().where(Base.metadata.tables['waitlist'].c.id == entry_id)
-    updated_entry = await database.fetch_one(query)
     if updated_entry is None:
-        logger.warning(f"Entry with ID {entry_id} not found after update.")
+        logger.warning("Entry with ID %s not found for update.", entry_id)
         raise HTTPException(status_code=404, detail="Entry not found")
-    logger.info(f"Updated entry retrieved: {updated_entry}")
+    if email_filter is not None and "email" in update_data:
+        email_filter.add(update_data["email"])
+    entry_changed(entry_id)
+    if entry_cache is not None:
+        await entry_cache.put(updated_entry)
+    logger.info("Entry ID %s updated successfully.", entry_id, extra={**SAMPLED, "entry_id": entry_id})
 
-    return updated_entry
+    return respond(updated_entry)
 
 
 @router.delete(
@@ -195,28 +701,78 @@ async def update_entry(entry_id: int, entry: WaitlistUpdate):
     status_code=status.HTTP_200_OK,
     summary="Delete a waitlist entry by ID",
 )
-async def delete_entry(entry_id: int):
+@profiled
+async def delete_entry(entry_id: int, waitlist: str = Depends(current_waitlist)):
     """
-    Delete a waitlist entry by its ID.
+    Delete a waitlist entry by its ID. The entry leaves the line and its email may sign up
+    again, but it is kept, inactive, until archived and can be restored until then.
     """
-    logger.info(f"Deleting entry with ID: {entry_id}")
+    logger.info("Deleting entry with ID: %s", entry_id)
+
+    # Deactivate the entry in one statement that also returns it; no row means not found
+    values = {"is_active": False, "deleted_at": datetime.utcnow()}
+    try:
+        if SIGNUP_STATS:
+            async with database.transaction():
+                entry = await update_returning(database, entry_id, values, waitlist=waitlist, is_active=True)
+                if entry is not None:
+                    await record_removals(database, [entry])
+        else:
+            entry = await update_returning(database, entry_id, values, waitlist=waitlist, is_active=True)
+    except Exception as e:
+        logger.error("Unexpected error during deletion: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred.",
+        )
 
-    # Check if the entry exists
-    query = Base.metadata.tables['waitlist'].select().where(Base.metadata.tables['waitlist'].c.id == entry_id)
-    entry = await database.fetch_one(query)
     if entry is None:
-        logger.warning(f"Entry with ID {entry_id} not found for deletion.")
+        logger.warning("Entry with ID %s not found for deletion.", entry_id)
         raise HTTPException(status_code=404, detail="Entry not found")
+    logger.info("Entry ID %s deleted successfully.", entry_id, extra={"entry_id": entry_id})
+    if email_filter is not None:
+        email_filter.discard(entry["email"])
+    entry_changed(entry_id)
+    if entry_cache is not None:
+        await entry_cache.invalidate(entry_id)
+    if position_index is not None:
+        position_index.discard(entry)
+    return {"message": "Entry deleted successfully", "entry_id": entry_id}
 
-    # Perform the deletion
-    delete_query = Base.metadata.tables['waitlist'].delete().where(Base.metadata.tables['waitlist'].c.id == entry_id)
+
+@router.post(
+    "/{entry_id}/restore", response_model=WaitlistEntry, summary="Restore a deleted or archived waitlist entry"
+)
+async def restore_waitlist_entry(entry_id: int, waitlist: str = Depends(current_waitlist)):
+    """
+    Bring a deleted entry back, from the waitlist table or the archive, with its original
+    ID and place in line. Fails if its email has signed up again since.
+    """
+    logger.info("Restoring entry with ID: %s", entry_id)
     try:
-        await database.execute(delete_query)
-        logger.info(f"Entry ID {entry_id} deleted successfully.")
+        entry = await restore_entry(database, entry_id, waitlist)
+    except INTEGRITY_ERRORS:
+        logger.error("Cannot restore entry ID %s: its email has signed up again.", entry_id)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An entry with this email already exists.",
+        )
     except Exception as e:
-        logger.error(f"Unexpected error during deletion: {e}")
+        logger.error("Unexpected error during restore: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred.",
         )
-    return {"message": "Entry deleted successfully", "entry_id": entry_id}
+
+    if entry is None:
+        logger.warning("No deleted or archived entry with ID %s.", entry_id)
+        raise HTTPException(status_code=404, detail="Entry not found")
+    if email_filter is not None:
+        email_filter.add(entry["email"])
+    entry_changed(entry_id)
+    if entry_cache is not None:
+        await entry_cache.put(entry)
+    if position_index is not None:
+        position_index.add(entry)
+    logger.info("Entry ID %s restored successfully.", entry_id, extra={"entry_id": entry_id})
+    return respond(entry)
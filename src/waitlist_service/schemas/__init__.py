@@ -1,3 +1,3 @@
-from .waitlist import WaitlistEntry, WaitlistCreate, WaitlistUpdate, WaitlistEntryBase
+from .waitlist import WaitlistEntry, WaitlistCreate, WaitlistImport, WaitlistUpdate, WaitlistEntryBase
 
-__all__ = ['WaitlistEntry', 'WaitlistCreate', 'WaitlistUpdate', 'WaitlistEntryBase']
\ No newline at end of file
+__all__ = ['WaitlistEntry', 'WaitlistCreate', 'WaitlistImport', 'WaitlistUpdate', 'WaitlistEntryBase']
\ No newline at end of file
@@ -1,6 +1,9 @@
 from typing import Optional
 from datetime import datetime
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, computed_field
+from ..emails import email_key
+from ..models import DEFAULT_WAITLIST
+from ..referrals import encode_referral_code
 
 class WaitlistEntryBase(BaseModel):
     name: str
@@ -8,8 +11,18 @@ class WaitlistEntryBase(BaseModel):
     comment: Optional[str] = None
     referral_source: Optional[str] = None
 
+    @property
+    def email_key(self) -> str:
+        """Canonical form of the email that duplicates are detected on."""
+        return email_key(self.email)
+
 class WaitlistCreate(WaitlistEntryBase):
-    pass
+    referrer_code: Optional[str] = None
+
+class WaitlistImport(WaitlistEntryBase):
+    """A row of a bulk import; keeps the source's IP and signup time when given."""
+    ip_address: Optional[str] = None
+    created_at: Optional[datetime] = None
 
 class WaitlistUpdate(BaseModel):
     name: Optional[str] = None
@@ -17,9 +30,23 @@ class WaitlistUpdate(BaseModel):
     comment: Optional[str] = None
     referral_source: Optional[str] = None
 
+    @property
+    def email_key(self) -> Optional[str]:
+        """Canonical form of the new email, if one is given."""
+        return email_key(self.email) if self.email is not None else None
+
 class WaitlistEntry(WaitlistEntryBase):
     model_config = ConfigDict(from_attributes=True)
     
     id: Optional[int] = None
+    waitlist: str = DEFAULT_WAITLIST
     ip_address: Optional[str]
     created_at: Optional[datetime] = None
+    referred_by: Optional[int] = None
+    referral_count: int = 0
+
+    @computed_field
+    @property
+    def referral_code(self) -> Optional[str]:
+        """Code this entry shares to credit signups to itself."""
+        return encode_referral_code(self.id) if self.id is not None else None
@@ -0,0 +1,62 @@
+"""
+JSON responses written straight from database rows
+"""
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from fastapi import Response
+
+from .referrals import encode_referral_code
+from .schemas.waitlist import WaitlistEntry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Serialization configuration
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "false").lower() == "true"
+
+# Stored columns a WaitlistEntry response carries; referral_code is derived from id
+ENTRY_FIELDS = tuple(WaitlistEntry.model_fields)
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        # Pydantic writes UTC as "Z"
+        return text[:-6] + "Z" if value.utcoffset() == timezone.utc.utcoffset(None) else text
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode ``content`` as compact JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response for content that is already plain dicts, lists and datetimes."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def entry_json(row: Mapping[str, Any]) -> Dict[str, Any]:
+    """The ``WaitlistEntry`` representation of a trusted row, without validating it."""
+    entry = {field: row[field] for field in ENTRY_FIELDS}
+    entry["referral_code"] = encode_referral_code(entry["id"]) if entry["id"] is not None else None
+    return entry
+
+
+def entry_response(row: Mapping[str, Any], status_code: int = 200) -> FastJSONResponse:
+    return FastJSONResponse(entry_json(row), status_code=status_code)
+
+
+def entries_response(rows: Iterable[Mapping[str, Any]], headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    return FastJSONResponse([entry_json(row) for row in rows], headers=headers)
@@ -0,0 +1,103 @@
+"""
+Single-flight reads: concurrent identical reads share one in-flight database call
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Single-flight configuration
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "false").lower() == "true"
+SINGLE_FLIGHT_MAX_KEYS = int(os.getenv("SINGLE_FLIGHT_MAX_KEYS", "10000"))
+
+
+@dataclass
+class SingleFlightStats:
+    led: int = 0
+    shared: int = 0
+    overflowed: int = 0
+
+
+class _Call:
+    """One in-flight call and how many requests are waiting on it."""
+
+    def __init__(self):
+        self.task: Optional["asyncio.Task[Any]"] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs one call per key at a time and hands its result to every request that asked meanwhile.
+
+    The call runs in its own task, so a request that goes away does not
+    cancel it for the others; it is cancelled once nobody waits on it.
+    A key is forgotten as soon as its call finishes: results are not
+    cached, and a request arriving afterwards starts a new call. Writers
+    call ``forget`` so reads that start after a write never join a call
+    that started before it. At most ``max_keys`` calls are shared at
+    once; beyond that, reads run on their own.
+    """
+
+    def __init__(self, max_keys: int = SINGLE_FLIGHT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = SingleFlightStats()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """The result of ``fn()``, or of the call already running for ``key``.
+
+        Shared results must be treated as read-only.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            if len(self._calls) >= self.max_keys:
+                self._stats.overflowed += 1
+                return await fn()
+            call = _Call()
+            call.task = asyncio.ensure_future(self._run(key, call, fn))
+            call.task.add_done_callback(_consume_exception)
+            self._calls[key] = call
+            self._stats.led += 1
+        else:
+            self._stats.shared += 1
+
+        call.waiters += 1
+        try:
+            # Shielded: a cancelled request must not cancel the call others wait on
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+
+    async def _run(self, key: Hashable, call: _Call, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fn()
+        finally:
+            self._forget(key, call)
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def forget(self, key: Hashable) -> None:
+        """Let the next read of ``key`` start a new call; requests already waiting keep theirs."""
+        self._calls.pop(key, None)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        return asdict(self._stats)
+
+
+def _consume_exception(task: "asyncio.Task[Any]") -> None:
+    # Every waiter may have gone between the call failing and it being awaited
+    if not task.cancelled():
+        task.exception()
@@ -3,12 +3,10 @@ Global state management for the waitlist service
 """
 import os
 import logging
-import ssl
 from typing import Optional
-import certifi
-from databases import Database
 from dotenv import load_dotenv
 from .models import WaitlistEntry
+from .pool import PoolSettings, create_database
 
 # Load environment variables
 load_dotenv()
@@ -25,20 +23,9 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
 
-# Configure SSL context for database
-ssl_context = ssl.create_default_context(cafile=certifi.where())
-if ENV == "development":
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-    logger.warning("SSL certificate verification disabled in development mode")
-
-# Initialize database with SSL context
-database = Database(
-    DATABASE_URL,
-    ssl=ssl_context,
-    min_size=5,
-    max_size=20
-)
+# The one database pool shared by every code path
+pool_settings = PoolSettings.from_env(ENV)
+database = create_database(DATABASE_URL, pool_settings)
 
 # Supabase configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -68,12 +55,13 @@ def get_db_state():
         "database": database,
         "metadata": WaitlistEntry.metadata,
         "environment": ENV,
-        "url": DATABASE_URL
+        "url": DATABASE_URL,
+        "pool": database.pool_stats(),
     }
 
 def set_db_state(database_url: str = None):
     """Set the database state with a new URL."""
     global database
     if database_url:
-        database = Database(database_url)
+        database = create_database(database_url, pool_settings)
     return database
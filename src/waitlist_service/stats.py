@@ -0,0 +1,279 @@
+"""
+Precomputed signup counts per list by hour, day and referral source
+"""
+import argparse
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from databases import Database
+from sqlalchemy import Table, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import SignupRollup
+from .queries import DEFAULT_WAITLIST, active, waitlist_table
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Rollup configuration
+SIGNUP_STATS = os.getenv("SIGNUP_STATS", "false").lower() == "true"
+
+rollup_table: Table = SignupRollup.__table__
+
+# Bucket of the "total" rows
+EPOCH = datetime(1970, 1, 1)
+
+# Mismatches listed by a consistency check
+MAX_MISMATCHES = 100
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# (waitlist, granularity, bucket, referral source)
+RollupKey = Tuple[str, str, datetime, str]
+
+
+def _buckets(created_at: Optional[datetime]) -> List[Tuple[str, datetime]]:
+    if created_at is None:
+        return [("total", EPOCH)]
+    hour = created_at.replace(minute=0, second=0, microsecond=0)
+    return [("hour", hour), ("day", hour.replace(hour=0)), ("total", EPOCH)]
+
+
+def rollup_deltas(entries: Iterable[Any], sign: int = 1) -> "Counter[RollupKey]":
+    """Counter changes for adding (``sign=1``) or removing (``sign=-1``) ``entries``."""
+    deltas: "Counter[RollupKey]" = Counter()
+    for entry in entries:
+        source = entry["referral_source"] or ""
+        for granularity, bucket in _buckets(entry["created_at"]):
+            deltas[(entry["waitlist"], granularity, bucket, source)] += sign
+    return deltas
+
+
+def _row(key: RollupKey, count: int) -> Dict[str, Any]:
+    waitlist, granularity, bucket, source = key
+    return {"waitlist": waitlist, "granularity": granularity, "bucket": bucket, "referral_source": source, "count": count}
+
+
+async def apply_deltas(database: Database, deltas: "Counter[RollupKey]", table: Table = rollup_table) -> None:
+    """Add ``deltas`` to the stored counters.
+
+    Call this inside the transaction that changed the entries so the
+    counters commit or roll back with them.
+    """
+    rows = [_row(key, delta) for key, delta in sorted(deltas.items()) if delta]
+    if not rows:
+        return
+
+    insert = _UPSERT_INSERTS.get(database.url.dialect)
+    if insert is not None:
+        query = insert(table).values(rows)
+        query = query.on_conflict_do_update(
+            index_elements=[table.c.waitlist, table.c.granularity, table.c.bucket, table.c.referral_source],
+            set_={"count": table.c["count"] + query.excluded["count"]},
+        )
+        await database.execute(query)
+        return
+
+    for row in rows:
+        key = (
+            (table.c.waitlist == row["waitlist"])
+            & (table.c.granularity == row["granularity"])
+            & (table.c.bucket == row["bucket"])
+            & (table.c.referral_source == row["referral_source"])
+        )
+        existing = await database.fetch_one(select(table.c["count"]).where(key))
+        if existing is None:
+            await database.execute(table.insert().values(**row))
+        else:
+            await database.execute(table.update().where(key).values(count=table.c["count"] + row["count"]))
+
+
+async def record_signups(database: Database, entries: Iterable[Any]) -> None:
+    """Count newly inserted ``entries``."""
+    await apply_deltas(database, rollup_deltas(entries, 1))
+
+
+async def record_removals(database: Database, entries: Iterable[Any]) -> None:
+    """Uncount deleted or archived ``entries``."""
+    await apply_deltas(database, rollup_deltas(entries, -1))
+
+
+def _hour_expression(dialect: str, table: Table) -> Any:
+    if dialect == "postgresql":
+        return func.date_trunc("hour", table.c.created_at)
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00", table.c.created_at)
+    raise ValueError(f"Signup stats support PostgreSQL and SQLite, not {dialect}")
+
+
+async def live_counts(
+    database: Database, waitlist: Optional[str] = None, table: Table = waitlist_table
+) -> "Counter[RollupKey]":
+    """Every counter computed from the active entries with one GROUP BY per list, hour and source.
+
+    Only ``waitlist``'s counters are computed when it is given.
+    """
+    hour = _hour_expression(database.url.dialect, table).label("hour")
+    query = (
+        select(table.c.waitlist, hour, table.c.referral_source, func.count().label("signups"))
+        .where(active(table))
+        .group_by(table.c.waitlist, hour, table.c.referral_source)
+    )
+    if waitlist is not None:
+        query = query.where(table.c.waitlist == waitlist)
+    counts: "Counter[RollupKey]" = Counter()
+    for row in await database.fetch_all(query):
+        bucket = row["hour"]
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        source = row["referral_source"] or ""
+        for granularity, key in _buckets(bucket):
+            counts[(row["waitlist"], granularity, key, source)] += row["signups"]
+    return counts
+
+
+async def stored_counts(database: Database, table: Table = rollup_table) -> "Counter[RollupKey]":
+    counts: "Counter[RollupKey]" = Counter()
+    for row in await database.fetch_all(select(table)):
+        counts[(row["waitlist"], row["granularity"], row["bucket"], row["referral_source"])] += row["count"]
+    return counts
+
+
+async def rebuild(database: Database, table: Table = rollup_table) -> int:
+    """Recompute every counter from the waitlist table; returns the number of counters.
+
+    On PostgreSQL the rollup table is locked against writers first, so
+    signups committing during the rebuild are counted exactly once.
+    """
+    async with database.transaction():
+        if database.url.dialect == "postgresql":
+            await database.execute(f"LOCK TABLE {table.name} IN EXCLUSIVE MODE")
+        await database.execute(table.delete())
+        counts = await live_counts(database)
+        rows = [_row(key, count) for key, count in counts.items()]
+        if rows:
+            await database.execute(table.insert().values(rows))
+    logger.info(f"Signup stats rebuilt: {len(rows)} counters")
+    return len(rows)
+
+
+async def check(database: Database) -> Dict[str, Any]:
+    """Compare the stored counters with a live GROUP BY over the waitlist table."""
+    async with database.transaction():
+        stored = await stored_counts(database)
+        live = await live_counts(database)
+    mismatches = []
+    for key in sorted(set(stored) | set(live)):
+        if stored[key] != live[key]:
+            waitlist, granularity, bucket, source = key
+            mismatches.append({
+                "waitlist": waitlist,
+                "granularity": granularity,
+                "bucket": bucket,
+                "referral_source": source or None,
+                "stored": stored[key],
+                "live": live[key],
+            })
+    return {
+        "consistent": not mismatches,
+        "counters": sum(1 for count in live.values() if count),
+        "mismatches": mismatches[:MAX_MISMATCHES],
+        "mismatch_count": len(mismatches),
+    }
+
+
+def summarize(counts: "Counter[RollupKey]") -> Dict[str, Any]:
+    """Total signups and signups per referral source, over every list in ``counts``."""
+    by_source: "Counter[str]" = Counter()
+    for (_, granularity, _, source), count in counts.items():
+        if granularity == "total":
+            by_source[source] += count
+    rows = [{"referral_source": source or None, "count": count} for source, count in sorted(by_source.items()) if count]
+    return {"total": sum(row["count"] for row in rows), "by_source": rows}
+
+
+async def totals(database: Database, waitlist: str = DEFAULT_WAITLIST, table: Table = rollup_table) -> Dict[str, Any]:
+    """Total signups of ``waitlist`` and its signups per referral source, read from the ``total`` counters."""
+    query = select(table).where(table.c.waitlist == waitlist, table.c.granularity == "total")
+    counts: "Counter[RollupKey]" = Counter()
+    for row in await database.fetch_all(query):
+        counts[(waitlist, "total", EPOCH, row["referral_source"])] += row["count"]
+    return summarize(counts)
+
+
+def to_series(
+    counts: "Counter[RollupKey]",
+    granularity: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    referral_source: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Counters of one granularity in ``[start, end)`` as ``{bucket, referral_source, count}`` rows, oldest first.
+
+    Counters of every list in ``counts`` are added together.
+    """
+    merged: "Counter[Tuple[datetime, str]]" = Counter()
+    for (_, key_granularity, bucket, source), count in counts.items():
+        if (
+            key_granularity == granularity
+            and (start is None or bucket >= start)
+            and (end is None or bucket < end)
+            and (referral_source is None or source == referral_source)
+        ):
+            merged[(bucket, source)] += count
+    return [
+        {"bucket": bucket, "referral_source": source or None, "count": count}
+        for (bucket, source), count in sorted(merged.items())
+        if count
+    ]
+
+
+async def series(
+    database: Database,
+    granularity: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    referral_source: Optional[str] = None,
+    waitlist: str = DEFAULT_WAITLIST,
+    table: Table = rollup_table,
+) -> List[Dict[str, Any]]:
+    """Stored hourly or daily counters of ``waitlist`` in ``[start, end)``, optionally for one source."""
+    query = select(table).where(table.c.waitlist == waitlist, table.c.granularity == granularity)
+    if start is not None:
+        query = query.where(table.c.bucket >= start)
+    if end is not None:
+        query = query.where(table.c.bucket < end)
+    if referral_source is not None:
+        query = query.where(table.c.referral_source == referral_source)
+    counts: "Counter[RollupKey]" = Counter()
+    for row in await database.fetch_all(query):
+        counts[(waitlist, granularity, row["bucket"], row["referral_source"])] += row["count"]
+    return to_series(counts, granularity)
+
+
+async def main(args):
+    async with Database(args.database_url) as database:
+        if args.rebuild:
+            print(f"{'counters':<16}{await rebuild(database)}")
+        report = await check(database)
+    for key, value in report.items():
+        if key != "mismatches":
+            print(f"{key:<16}{value}")
+    for mismatch in report["mismatches"]:
+        print(mismatch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the stored signup counters against the waitlist table, optionally rebuilding them first"
+    )
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    asyncio.run(main(parser.parse_args()))
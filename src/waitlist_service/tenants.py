@@ -0,0 +1,155 @@
+"""
+Many waitlists in one service: list names and per-list concurrency budgets
+"""
+import asyncio
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Path, Request
+from .models import DEFAULT_WAITLIST
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Budget configuration: requests each list may have in flight (0 = unlimited) and how
+# long a request over the budget waits for a slot before it is turned away
+WAITLIST_MAX_CONCURRENCY = int(os.getenv("WAITLIST_MAX_CONCURRENCY", "0"))
+WAITLIST_QUEUE_TIMEOUT_MS = float(os.getenv("WAITLIST_QUEUE_TIMEOUT_MS", "1000"))
+
+# Every route is also served under /lists/{waitlist} for the named list
+LIST_PREFIX = "/lists/"
+
+# List names as they appear in URLs
+WAITLIST_NAME_PATTERN = r"^[a-z0-9][a-z0-9_-]{0,63}$"
+_WAITLIST_NAME = re.compile(WAITLIST_NAME_PATTERN)
+
+
+def waitlist_path(
+    waitlist: str = Path(..., pattern=WAITLIST_NAME_PATTERN, description="Name of the waitlist"),
+) -> str:
+    """Validate the list named in a ``/lists/{waitlist}/...`` URL."""
+    return waitlist
+
+
+def current_waitlist(request: Request) -> str:
+    """The list a request is for: ``{waitlist}`` under ``/lists/``, otherwise the default list."""
+    return request.path_params.get("waitlist", DEFAULT_WAITLIST)
+
+
+def split_list_path(path: str) -> Tuple[Optional[str], str]:
+    """The list a request path addresses and the path under it.
+
+    ``/lists/beta/waitlist/waitlist/`` is ``("beta", "/waitlist/waitlist/")``
+    and any path outside ``/lists/`` is on the default list. The name is
+    None when it is not a valid list name.
+    """
+    if not path.startswith(LIST_PREFIX):
+        return DEFAULT_WAITLIST, path
+    name, _, rest = path[len(LIST_PREFIX):].partition("/")
+    return (name if _WAITLIST_NAME.fullmatch(name) else None), "/" + rest
+
+
+class ListBudgets:
+    """Caps the requests each list has in flight, so one busy list cannot take the whole pool.
+
+    The lists share one connection pool and event loop; a list at
+    ``max_concurrency`` requests makes further ones wait up to
+    ``queue_timeout`` seconds for a slot, then turns them away while the
+    other lists carry on. Lists with nothing in flight hold no state.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = WAITLIST_MAX_CONCURRENCY,
+        queue_timeout: float = WAITLIST_QUEUE_TIMEOUT_MS / 1000,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        # Requests holding or waiting for a slot, per list
+        self._users: Dict[str, int] = {}
+        self.rejected = 0
+
+    async def acquire(self, waitlist: str) -> bool:
+        """Take a slot of ``waitlist``; False when none came free in time."""
+        slots = self._slots.get(waitlist)
+        if slots is None:
+            slots = self._slots[waitlist] = asyncio.Semaphore(self.max_concurrency)
+        self._users[waitlist] = self._users.get(waitlist, 0) + 1
+        try:
+            if slots.locked():
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            else:
+                await slots.acquire()
+        except asyncio.TimeoutError:
+            self._leave(waitlist)
+            self.rejected += 1
+            return False
+        except BaseException:
+            self._leave(waitlist)
+            raise
+        return True
+
+    def release(self, waitlist: str) -> None:
+        self._slots[waitlist].release()
+        self._leave(waitlist)
+
+    def _leave(self, waitlist: str) -> None:
+        self._users[waitlist] -= 1
+        if not self._users[waitlist]:
+            del self._users[waitlist]
+            del self._slots[waitlist]
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests in flight or queued per list, and how many were turned away."""
+        return {"lists": dict(self._users), "rejected": self.rejected}
+
+
+class WaitlistBudgetMiddleware:
+    """ASGI middleware holding each waitlist request to its list's budget.
+
+    Requests to paths under ``path_prefix`` (on the default list or under
+    ``/lists/{waitlist}``) take a slot of their list for as long as they
+    run; one that gets none answers 503 with ``Retry-After``.
+    """
+
+    def __init__(self, app: Callable, budgets: ListBudgets, path_prefix: str = "/waitlist/"):
+        self.app = app
+        self.budgets = budgets
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        waitlist, path = split_list_path(scope["path"])
+        if waitlist is None or not path.startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.budgets.acquire(waitlist):
+            logger.warning(
+                "Waitlist %s is over its concurrency budget; rejected %s %s", waitlist, scope["method"], scope["path"]
+            )
+            await _service_unavailable(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.budgets.release(waitlist)
+
+
+async def _service_unavailable(send: Callable) -> None:
+    body = b'{"detail":"This waitlist is busy; try again shortly."}'
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", b"1"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,33 @@
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from waitlist_service import Base
+
+@pytest.fixture
+def database_url(tmp_path):
+    """Create a file-backed SQLite database with the waitlist tables."""
+    path = tmp_path / "waitlist.db"
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+@pytest.fixture
+def client():
+    """A TestClient for the app, on freshly created tables in the database it is bound to (DATABASE_URL)."""
+    from fastapi.testclient import TestClient
+    from waitlist_service.main import app
+    from waitlist_service.state import DATABASE_URL
+
+    url = make_url(DATABASE_URL)
+    url = url.set(drivername=url.drivername.split("+")[0])
+    if url.drivername == "sqlite" and url.database and os.path.dirname(url.database):
+        os.makedirs(os.path.dirname(url.database), exist_ok=True)
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    with TestClient(app) as client:
+        yield client
+
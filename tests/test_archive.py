@@ -0,0 +1,119 @@
+import pytest
+from datetime import datetime, timedelta
+from databases import Database
+from waitlist_service import stats
+from waitlist_service.archive import archive_entries, archive_table, restore_entry
+from waitlist_service.queries import INTEGRITY_ERRORS, fetch_entry, fetch_entry_by_email, fetch_page, insert_returning, update_returning
+from waitlist_service.stats import record_removals, record_signups
+
+async def signup(database, email, **values):
+    entry = await insert_returning(database, {"name": "User", "email": email, **values})
+    await record_signups(database, [entry])
+    return entry
+
+async def soft_delete(database, entry, deleted_at):
+    deleted = await update_returning(
+        database, entry["id"], {"is_active": False, "deleted_at": deleted_at}, is_active=True
+    )
+    await record_removals(database, [deleted])
+    return deleted
+
+@pytest.mark.asyncio
+async def test_deleted_entries_leave_reads_and_free_their_email(database_url):
+    """Test that a soft-deleted entry is hidden from reads, its email can sign up again, and restore needs it free"""
+    async with Database(database_url) as database:
+        first = await signup(database, "a@example.com")
+        other = await signup(database, "b@example.com")
+        await soft_delete(database, first, datetime.utcnow())
+        # Deleting twice finds nothing to delete
+        assert await update_returning(database, first["id"], {"is_active": False}, is_active=True) is None
+
+        assert await fetch_entry_by_email(database, "a@example.com") is None
+        rows, _ = await fetch_page(database, 10)
+        assert [row["id"] for row in rows] == [other["id"]]
+        assert (await stats.totals(database))["total"] == 1
+
+        again = await signup(database, "A+new@example.com")
+        with pytest.raises(INTEGRITY_ERRORS):
+            await restore_entry(database, first["id"], stats=True)
+        assert (await fetch_entry(database, first["id"]))["is_active"] is False
+
+        await soft_delete(database, again, datetime.utcnow())
+        restored = await restore_entry(database, first["id"], stats=True)
+        assert (restored["id"], restored["is_active"], restored["deleted_at"]) == (first["id"], True, None)
+        assert restored["created_at"] == first["created_at"]
+        assert await restore_entry(database, other["id"]) is None
+        assert (await stats.check(database))["consistent"]
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_entries_in_batches_and_restores_them(database_url):
+    """Test that archiving moves deleted-long-ago and old entries out in batches and restore moves them back"""
+    async with Database(database_url) as database:
+        now = datetime.utcnow()
+        old = await signup(database, "old@example.com", created_at=now - timedelta(days=400))
+        stale = [await signup(database, f"stale{i}@example.com") for i in range(5)]
+        for entry in stale:
+            await soft_delete(database, entry, now - timedelta(days=60))
+        recent = await signup(database, "recent@example.com")
+        await soft_delete(database, recent, now - timedelta(days=1))
+        kept = await signup(database, "kept@example.com")
+        elsewhere = await signup(database, "stale@example.com", waitlist="beta")
+        await soft_delete(database, elsewhere, now - timedelta(days=60))
+
+        batches = []
+
+        async def archived(rows):
+            batches.append([row["id"] for row in rows])
+
+        report = await archive_entries(
+            database,
+            deleted_before=now - timedelta(days=30),
+            created_before=now - timedelta(days=365),
+            waitlist="default",
+            batch_size=2,
+            stats=True,
+            on_archived=archived,
+        )
+        assert (report.archived, report.active, report.batches) == (6, 1, 3)
+        assert sorted(sum(batches, [])) == sorted([old["id"]] + [entry["id"] for entry in stale])
+        assert await fetch_entry(database, old["id"]) is None
+        assert await fetch_entry(database, recent["id"]) is not None
+        assert await fetch_entry(database, elsewhere["id"]) is not None
+        assert len(await database.fetch_all(archive_table.select())) == 6
+        assert (await stats.totals(database))["total"] == 1
+        assert (await stats.check(database))["consistent"]
+
+        # Another list cannot restore it; its own list gets it back with its place in line
+        assert await restore_entry(database, stale[0]["id"], "beta") is None
+        restored = await restore_entry(database, stale[0]["id"], stats=True)
+        assert (restored["id"], restored["email"], restored["is_active"]) == (stale[0]["id"], "stale0@example.com", True)
+        assert restored["created_at"] == stale[0]["created_at"]
+        assert len(await database.fetch_all(archive_table.select())) == 5
+        rows, _ = await fetch_page(database, 10)
+        assert {row["id"] for row in rows} == {kept["id"], restored["id"]}
+        assert (await stats.check(database))["consistent"]
+
+def test_http_delete_restore_and_archive(client):
+    """Test that a deleted entry is not found over HTTP until restored, and restore answers 409 once its email is taken"""
+    entry = client.post("/waitlist/waitlist/", json={"name": "User", "email": "a@example.com"}).json()
+    path = f"/waitlist/waitlist/{entry['id']}"
+    assert client.delete(path).status_code == 200
+    assert client.get(path).status_code == 404
+    assert client.get(f"{path}/position").status_code == 404
+    assert client.delete(path).status_code == 404
+
+    restored = client.post(f"{path}/restore")
+    assert restored.status_code == 200
+    assert restored.json()["id"] == entry["id"]
+    assert client.get(path).json()["email"] == "a@example.com"
+    assert client.post("/waitlist/waitlist/999/restore").status_code == 404
+
+    # Archived, and its email signed up again meanwhile
+    client.delete(path)
+    report = client.post("/waitlist/waitlist/archive", params={"deleted_days": 0}).json()
+    assert report["archived"] == 1
+    again = client.post("/waitlist/waitlist/", json={"name": "User", "email": "a@example.com"})
+    assert again.status_code == 201
+    assert client.post(f"{path}/restore").status_code == 409
+    client.delete(f"/waitlist/waitlist/{again.json()['id']}")
+    assert client.post(f"{path}/restore").json()["id"] == entry["id"]
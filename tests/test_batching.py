@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from databases import Database
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.queries import insert_returning, DuplicateEmailError
+
+def signup(email):
+    return {"name": "Test User", "email": email, "referral_source": "test"}
+
+@pytest.mark.asyncio
+async def test_batch_resolves_each_caller(database_url):
+    """Test that each caller gets its own row or a duplicate-email error"""
+    async with Database(database_url) as database:
+        await insert_returning(database, signup("existing@example.com"))
+        batcher = SignupBatcher(database, window_ms=50, max_rows=10)
+
+        results = await asyncio.gather(
+            batcher.submit(signup("a@example.com")),
+            batcher.submit(signup("existing@example.com")),
+            batcher.submit(signup("b@example.com")),
+            batcher.submit(signup("a@example.com")),
+            return_exceptions=True,
+        )
+        await batcher.close()
+
+    first, existing, second, repeated = results
+    assert first["email"] == "a@example.com"
+    assert second["email"] == "b@example.com"
+    assert first["id"] != second["id"]
+    assert first["created_at"] is not None
+    assert isinstance(existing, DuplicateEmailError)
+    assert isinstance(repeated, DuplicateEmailError)
+
+@pytest.mark.asyncio
+async def test_batches_split_at_max_rows(database_url):
+    """Test that more signups than max_rows are written across several batches"""
+    async with Database(database_url) as database:
+        batcher = SignupBatcher(database, window_ms=50, max_rows=3)
+        calls = []
+        fetch_all = database.fetch_all
+
+        async def counting_fetch_all(query):
+            calls.append(query)
+            return await fetch_all(query)
+
+        database.fetch_all = counting_fetch_all
+        rows = await asyncio.gather(*(batcher.submit(signup(f"user{i}@example.com")) for i in range(7)))
+        await batcher.close()
+
+    assert len({row["id"] for row in rows}) == 7
+    assert len(calls) == 3
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending(database_url):
+    """Test that close() writes signups still waiting for the window"""
+    async with Database(database_url) as database:
+        batcher = SignupBatcher(database, window_ms=10_000, max_rows=100)
+        pending = asyncio.ensure_future(batcher.submit(signup("late@example.com")))
+        await asyncio.sleep(0.01)
+        await batcher.close()
+        row = await pending
+
+    assert row["email"] == "late@example.com"
@@ -0,0 +1,127 @@
+import asyncio
+import time
+import pytest
+from databases import Database
+from waitlist_service import cache as cache_module
+from waitlist_service.cache import EntryCache, MemoryCache, RedisCache, MISS
+from waitlist_service.metrics import Registry, register_entry_cache
+from waitlist_service.queries import insert_returning, update_returning
+
+class FakeRedis:
+    """Local stand-in for redis.asyncio.Redis covering get/set(px=)/delete."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def set(self, key, value, px=None):
+        self.data[key] = (value.encode(), time.monotonic() + px / 1000 if px else None)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return MemoryCache() if request.param == "memory" else RedisCache(FakeRedis())
+
+@pytest.mark.asyncio
+async def test_read_through_and_write_through(database_url, backend):
+    """Test that lookups hit the cache after the first read and see updates"""
+    cache = EntryCache(backend)
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+
+        first = await cache.get_entry(database, row["id"])
+        second = await cache.get_entry(database, row["id"])
+        updated = await update_returning(database, row["id"], {"comment": "updated"})
+        await cache.put(updated)
+        third = await cache.get_entry(database, row["id"])
+
+    assert first["email"] == second["email"] == "test@example.com"
+    assert third["comment"] == "updated"
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_negative_cache_and_invalidate(database_url, backend):
+    """Test that 404s are cached and invalidate() forces a reload"""
+    cache = EntryCache(backend)
+    async with Database(database_url) as database:
+        assert await cache.get_entry(database, 1) is None
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+        assert await cache.get_entry(database, row["id"]) is None
+
+        await cache.invalidate(row["id"])
+        entry = await cache.get_entry(database, row["id"])
+
+    assert entry["email"] == "test@example.com"
+    assert cache.stats()["negative_hits"] == 1
+    assert cache.stats()["misses"] == 2
+    registry = Registry()
+    register_entry_cache(cache, registry)
+    assert 'waitlist_entry_cache_total{outcome="negative_hits"} 1' in registry.render()
+
+@pytest.mark.asyncio
+async def test_miss_racing_a_write_is_not_cached(database_url, backend, monkeypatch):
+    """Test that a row read before a racing invalidate or put is returned but never cached over it"""
+    cache = EntryCache(backend)
+    read = asyncio.Event()
+    release = asyncio.Event()
+    fetch_entry = cache_module.fetch_entry
+
+    async def slow_fetch_entry(*args, **kwargs):
+        row = await fetch_entry(*args, **kwargs)
+        read.set()
+        await release.wait()
+        return row
+
+    monkeypatch.setattr(cache_module, "fetch_entry", slow_fetch_entry)
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+
+        # A soft delete lands between the miss's read and its cache write
+        loading = asyncio.create_task(cache.get_entry(database, row["id"]))
+        await read.wait()
+        await update_returning(database, row["id"], {"is_active": False})
+        await cache.invalidate(row["id"])
+        release.set()
+        assert (await loading)["is_active"] is True
+        assert await backend.get(f"waitlist:entry:{row['id']}") is MISS
+
+        # An update written through meanwhile is kept, not the older row
+        read.clear()
+        release.clear()
+        loading = asyncio.create_task(cache.get_entry(database, row["id"]))
+        await read.wait()
+        await cache.put(await update_returning(database, row["id"], {"comment": "updated"}))
+        release.set()
+        await loading
+        monkeypatch.setattr(cache_module, "fetch_entry", fetch_entry)
+        entry = await cache.get_entry(database, row["id"])
+
+    assert entry["comment"] == "updated"
+    assert entry["is_active"] is False
+    assert cache.stats()["stale_loads"] == 2
+    assert cache._generations == {}
+
+@pytest.mark.asyncio
+async def test_memory_cache_lru_and_ttl():
+    """Test that the in-process cache evicts least recently used keys and expires old ones"""
+    cache = MemoryCache(max_size=2)
+    await cache.set("a", 1, ttl=60)
+    await cache.set("b", 2, ttl=60)
+    await cache.get("a")
+    await cache.set("c", 3, ttl=60)
+
+    assert await cache.get("a") == 1
+    assert await cache.get("b") is MISS
+    assert cache.evictions == 1
+
+    await cache.set("c", 3, ttl=0)
+    assert await cache.get("c") is MISS
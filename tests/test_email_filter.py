@@ -0,0 +1,73 @@
+import pytest
+from databases import Database
+from waitlist_service.email_filter import BloomFilter, EmailFilter
+from waitlist_service.metrics import Registry, register_email_filter
+from waitlist_service.queries import insert_returning
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test that every added key is found and the error rate stays near its target"""
+    bloom = BloomFilter(capacity=10_000, error_rate=0.01)
+    for i in range(10_000):
+        bloom.add(f"user{i}@example.com")
+
+    assert all(f"user{i}@example.com" in bloom for i in range(10_000))
+    false_positives = sum(f"other{i}@example.com" in bloom for i in range(10_000))
+    assert false_positives / 10_000 < 0.02
+    assert len(bloom.bits) < 12_000 * 2
+
+@pytest.mark.asyncio
+async def test_email_filter_warm_up_and_updates(database_url):
+    """Test that the filter is warmed from the table and learns new emails"""
+    async with Database(database_url) as database:
+        await insert_returning(database, {"name": "Test User", "email": "Existing@Example.com"})
+        email_filter = EmailFilter(database, capacity=1000)
+
+        # Everything is a "maybe" until the first rebuild
+        assert email_filter.might_contain("new@example.com")
+        await email_filter.rebuild()
+
+    assert email_filter.might_contain(" existing@example.com ")
+    assert not email_filter.might_contain("new@example.com")
+    email_filter.add("new@example.com")
+    assert email_filter.might_contain("new@example.com")
+
+def test_email_filter_false_positive_rate():
+    """Test the observed false-positive rate only counts emails that were new"""
+    email_filter = EmailFilter(database=None, capacity=1000)
+    email_filter._bloom = BloomFilter(1000, 0.01)
+    email_filter.add("a@example.com")
+
+    email_filter.might_contain("a@example.com")  # maybe, and it exists
+    email_filter.might_contain("b@example.com")  # definitely new
+    email_filter.might_contain("c@example.com")  # definitely new
+    email_filter.record_false_positive()  # pretend one "maybe" was new
+
+    stats = email_filter.stats()
+    assert stats["checks"] == 3
+    assert stats["false_positive_rate"] == pytest.approx(1 / 3)
+    assert stats["emails"] == 1
+
+@pytest.mark.asyncio
+async def test_email_filter_rebuilds_once_stale_and_exports_metrics(database_url):
+    """Test that enough deletions rebuild the filter on their own and its stats are exported as metrics"""
+    async with Database(database_url) as database:
+        await insert_returning(database, {"name": "Test User", "email": "kept@example.com"})
+        email_filter = EmailFilter(database, capacity=1000, rebuild_stale=2)
+        await email_filter.start()
+        email_filter.add("gone@example.com")
+        email_filter.discard("gone@example.com")
+        assert email_filter.stats()["stale"] == 1
+
+        email_filter.discard("gone-too@example.com")
+        rebuild = email_filter._warmup
+        assert not rebuild.done()
+        await rebuild
+        assert email_filter.stats()["stale"] == 0
+        assert not email_filter.might_contain("gone@example.com")
+
+    registry = Registry()
+    register_email_filter(email_filter, registry)
+    text = registry.render()
+    assert 'waitlist_email_filter{stat="emails"} 1' in text
+    assert 'waitlist_email_filter_checks_total{outcome="new"} 1' in text
+
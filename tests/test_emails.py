@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from databases import Database
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.email_backfill import backfill_email_keys
+from waitlist_service.emails import email_key, email_keys
+from waitlist_service.importer import import_entries
+from waitlist_service.queries import DuplicateEmailError, INTEGRITY_ERRORS, fetch_entry, fetch_entry_by_email, insert_returning
+
+async def records(*emails):
+    for row, email in enumerate(emails, start=1):
+        yield row, {"name": "Imported", "email": email}
+
+def test_email_key_folds_case_tags_dots_and_aliases():
+    """Test that addresses delivering to the same mailbox share a key and others do not"""
+    assert email_keys(["Foo@Gmail.com", "foo+x@gmail.com", "f.oo@gmail.com", " F.oo+a+b@googlemail.com. "]) == [
+        "foo@gmail.com"
+    ] * 4
+    assert email_key("f.oo+news@example.com") == "f.oo@example.com"
+    assert email_key("+only@example.com") == "+only@example.com"
+    assert email_key("not-an-email") == "not-an-email"
+
+@pytest.mark.asyncio
+async def test_signups_are_unique_on_the_email_key(database_url):
+    """Test that every write path treats variants of a stored email as duplicates"""
+    async with Database(database_url) as database:
+        first = await insert_returning(database, {"name": "User", "email": "Foo@Gmail.com"})
+        assert first["email"] == "Foo@Gmail.com" and first["email_key"] == "foo@gmail.com"
+        assert (await fetch_entry_by_email(database, "f.oo+x@gmail.com"))["id"] == first["id"]
+        with pytest.raises(INTEGRITY_ERRORS):
+            await insert_returning(database, {"name": "User", "email": "foo+x@gmail.com"})
+
+        batcher = SignupBatcher(database)
+        results = await asyncio.gather(
+            batcher.submit({"name": "User", "email": "f.oo@gmail.com"}),
+            batcher.submit({"name": "User", "email": "bar@example.com"}),
+            batcher.submit({"name": "User", "email": "Bar+y@example.com"}),
+            return_exceptions=True,
+        )
+        await batcher.close()
+        assert isinstance(results[0], DuplicateEmailError)
+        assert results[1]["email_key"] == "bar@example.com"
+        assert isinstance(results[2], DuplicateEmailError)
+
+        report = await import_entries(database, records("FOO@gmail.com", "new@example.com", "New+1@example.com"))
+        assert (report.inserted, report.skipped) == (1, 2)
+
+@pytest.mark.asyncio
+async def test_backfill_fills_keys_and_reports_merge_candidates(database_url):
+    """Test that the backfill keys old rows chunk by chunk and leaves colliding ones for review"""
+    async with Database(database_url) as database:
+        emails = ["Foo@gmail.com", "a@example.com", "f.oo+x@gmail.com", "b@example.com", "A+1@example.com"]
+        ids = [
+            (await insert_returning(database, {"name": "Old", "email": email, "email_key": None}))["id"]
+            for email in emails
+        ]
+        # A signup since the key column was added keeps its key
+        late = await insert_returning(database, {"name": "New", "email": "b+news@example.com", "waitlist": "beta"})
+
+        report = await backfill_email_keys(database, chunk_size=2)
+        assert (report.scanned, report.updated, report.unchanged, report.chunks) == (6, 3, 1, 3)
+        assert [(c.entry_id, c.duplicate_of, c.email_key) for c in report.candidates] == [
+            (ids[2], ids[0], "foo@gmail.com"),
+            (ids[4], ids[1], "a@example.com"),
+        ]
+        assert (await fetch_entry(database, ids[3]))["email_key"] == "b@example.com"
+        assert (await fetch_entry(database, ids[2]))["email_key"] is None
+        assert (await fetch_entry(database, late["id"]))["email_key"] == "b@example.com"
+
+        # Re-running changes nothing and reports the same candidates
+        again = await backfill_email_keys(database, chunk_size=100)
+        assert (again.updated, len(again.candidates)) == (0, 2)
+
+@pytest.mark.asyncio
+async def test_backfill_ignores_keys_held_by_deleted_entries(database_url):
+    """Test that a deleted entry holding a key does not keep an active re-signup from taking it"""
+    async with Database(database_url) as database:
+        deleted = await insert_returning(database, {"name": "Gone", "email": "a@example.com", "is_active": False})
+        active = await insert_returning(database, {"name": "Back", "email": "A@example.com", "email_key": None})
+
+        report = await backfill_email_keys(database)
+        assert (report.updated, report.candidates) == (1, [])
+        assert (await fetch_entry(database, deleted["id"]))["email_key"] == "a@example.com"
+        assert (await fetch_entry_by_email(database, "a+1@example.com"))["id"] == active["id"]
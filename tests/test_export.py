@@ -0,0 +1,34 @@
+import csv
+import io
+import json
+import pytest
+from databases import Database
+from waitlist_service.export import iter_ndjson, iter_csv
+from waitlist_service.queries import insert_returning, select_entries
+
+async def collect(lines):
+    return "".join([line async for line in lines])
+
+@pytest.mark.asyncio
+async def test_export_ndjson(database_url):
+    """Test that each entry is streamed as one JSON line"""
+    async with Database(database_url) as database:
+        for i in range(3):
+            await insert_returning(database, {"name": f"User {i}", "email": f"user{i}@example.com"})
+        body = await collect(iter_ndjson(database, select_entries()))
+
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert [row["email"] for row in rows] == ["user2@example.com", "user1@example.com", "user0@example.com"]
+    assert rows[0]["created_at"] is not None
+
+@pytest.mark.asyncio
+async def test_export_csv(database_url):
+    """Test that the CSV export has a header and one line per entry"""
+    async with Database(database_url) as database:
+        await insert_returning(database, {"name": "Test User", "email": "test@example.com", "referral_source": "test"})
+        body = await collect(iter_csv(database, select_entries(referral_source="test")))
+
+    rows = list(csv.DictReader(io.StringIO(body)))
+    assert len(rows) == 1
+    assert rows[0]["email"] == "test@example.com"
+    assert rows[0]["referral_source"] == "test"
@@ -0,0 +1,70 @@
+import csv
+import gzip
+import pytest
+from databases import Database
+from waitlist_service.exporter import ExportJobs, export_table
+from waitlist_service.queries import insert_returning
+
+async def insert_users(database, start, count):
+    for i in range(start, start + count):
+        await insert_returning(database, {"name": f"User {i}", "email": f"user{i}@example.com"})
+
+def read_csv(path):
+    with gzip.open(path, "rt", newline="") as source:
+        return list(csv.DictReader(source))
+
+@pytest.mark.asyncio
+async def test_export_gzip_csv_in_chunks(database_url, tmp_path):
+    """Test that the whole table is written to a gzip CSV oldest first"""
+    path = str(tmp_path / "waitlist.csv.gz")
+    async with Database(database_url) as database:
+        await insert_users(database, 0, 5)
+        result = await export_table(database, path, chunk_size=2)
+
+    rows = read_csv(path)
+    assert result.rows == 5
+    assert [row["email"] for row in rows] == [f"user{i}@example.com" for i in range(5)]
+    assert not (tmp_path / "waitlist.csv.gz.partial").exists()
+
+@pytest.mark.asyncio
+async def test_incremental_export_since_watermark(database_url, tmp_path):
+    """Test that an export since a watermark only contains newer rows"""
+    async with Database(database_url) as database:
+        await insert_users(database, 0, 3)
+        first = await export_table(database, str(tmp_path / "first.csv.gz"))
+        await insert_users(database, 3, 2)
+        second = await export_table(database, str(tmp_path / "second.csv.gz"), since=first.watermark)
+        third = await export_table(database, str(tmp_path / "third.csv.gz"), since=second.watermark)
+
+    assert [row["email"] for row in read_csv(second.path)] == ["user3@example.com", "user4@example.com"]
+    assert third.rows == 0
+    assert third.watermark == second.watermark
+
+@pytest.mark.asyncio
+async def test_export_parquet(database_url, tmp_path):
+    """Test that Parquet exports keep column types"""
+    parquet = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "waitlist.parquet")
+    async with Database(database_url) as database:
+        await insert_users(database, 0, 3)
+        await export_table(database, path, format="parquet", compression="zstd", chunk_size=2)
+
+    table = parquet.read_table(path)
+    assert table.num_rows == 3
+    assert str(table.schema.field("created_at").type).startswith("timestamp")
+
+@pytest.mark.asyncio
+async def test_export_job_runs_in_child_process(database_url, tmp_path):
+    """Test that an export job runs the CLI in a child process and reports its result"""
+    async with Database(database_url) as database:
+        await insert_users(database, 0, 2)
+
+    jobs = ExportJobs(database_url, export_dir=str(tmp_path))
+    job = await jobs.start("csv", "gzip")
+    with pytest.raises(RuntimeError):
+        await jobs.start("csv", "gzip")
+    await jobs.wait(job.id)
+
+    assert job.status == "succeeded", job.error
+    assert job.result["rows"] == 2
+    assert len(read_csv(job.result["path"])) == 2
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import pytest
+from databases import Database
+from waitlist_service.idempotency import (
+    Claim,
+    DatabaseStore,
+    IdempotencyKeyInProgress,
+    IdempotencyKeyMismatch,
+    IdempotencyKeys,
+    MemoryStore,
+    StoredResponse,
+    fingerprint,
+)
+from waitlist_service.schemas.waitlist import WaitlistCreate
+
+class Handler:
+    """Counts its calls and answers each with the next status, after an optional delay."""
+
+    def __init__(self, *statuses, delay=0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        status = self.statuses.pop(0)
+        if status is None:
+            raise RuntimeError("handler failed")
+        return StoredResponse(status, f'{{"call":{self.calls}}}'.encode())
+
+@pytest.mark.asyncio
+async def test_retries_replay_the_stored_response():
+    """Test that a retried key replays the first response and a different request with it is rejected"""
+    keys = IdempotencyKeys(MemoryStore())
+    handler = Handler(201)
+    first = await keys.run("default", "k1", "fp", handler)
+    again = await keys.run("default", "k1", "fp", handler)
+    assert first == (StoredResponse(201, b'{"call":1}'), False)
+    assert again == (StoredResponse(201, b'{"call":1}'), True)
+    # Keys are per list
+    assert (await keys.run("beta", "k1", "fp", Handler(201)))[1] is False
+    with pytest.raises(IdempotencyKeyMismatch):
+        await keys.run("default", "k1", "other", handler)
+    assert handler.calls == 1
+    assert keys.stats() == {"stored": 2, "replayed": 1, "coalesced": 0, "mismatched": 1, "evictions": 0}
+
+@pytest.mark.asyncio
+async def test_concurrent_duplicates_share_one_run_and_errors_free_the_key():
+    """Test that concurrent requests with one key run once, and a 5xx, error or cancellation lets the next run"""
+    keys = IdempotencyKeys(MemoryStore(max_keys=10))
+    handler = Handler(201, delay=0.01)
+    results = await asyncio.gather(*(keys.run("default", "k", "fp", handler) for _ in range(10)))
+    assert handler.calls == 1
+    assert {response for response, _ in results} == {StoredResponse(201, b'{"call":1}')}
+    assert [replayed for _, replayed in results].count(False) == 1
+    assert keys.stats()["coalesced"] == 9
+
+    failing = Handler(500, None, 400, 201)
+    assert (await keys.run("default", "f", "fp", failing))[0].status_code == 500
+    with pytest.raises(RuntimeError):
+        await keys.run("default", "f", "fp", failing)
+    # Client errors are answers too and are replayed
+    assert (await keys.run("default", "f", "fp", failing))[0].status_code == 400
+    assert (await keys.run("default", "f", "fp", failing)) == (StoredResponse(400, b'{"call":3}'), True)
+
+    # A cancelled first request hands the key to the one waiting on it
+    slow = Handler(201, 201, delay=0.05)
+    leader = asyncio.create_task(keys.run("default", "c", "fp", slow))
+    await asyncio.sleep(0.01)
+    follower = asyncio.create_task(keys.run("default", "c", "fp", slow))
+    await asyncio.sleep(0.01)
+    leader.cancel()
+    assert await follower == (StoredResponse(201, b'{"call":2}'), False)
+    assert leader.cancelled()
+
+@pytest.mark.asyncio
+async def test_database_store_is_shared_by_replicas(database_url):
+    """Test that a replica waits for another's in-flight key and replays it from the table"""
+    async with Database(database_url) as database:
+        first = IdempotencyKeys(DatabaseStore(database))
+        second = IdempotencyKeys(DatabaseStore(database), wait_seconds=5)
+        handler = Handler(201, delay=0.2)
+        running = asyncio.create_task(first.run("default", "k", "fp", handler))
+        await asyncio.sleep(0.05)
+        assert await second.run("default", "k", "fp", handler) == (StoredResponse(201, b'{"call":1}'), True)
+        assert await running == (StoredResponse(201, b'{"call":1}'), False)
+        assert handler.calls == 1
+        with pytest.raises(IdempotencyKeyMismatch):
+            await second.run("default", "k", "other", handler)
+
+        impatient = IdempotencyKeys(DatabaseStore(database), wait_seconds=0.05)
+        running = asyncio.create_task(first.run("default", "slow", "fp", Handler(201, delay=0.3)))
+        await asyncio.sleep(0.05)
+        with pytest.raises(IdempotencyKeyInProgress):
+            await impatient.run("default", "slow", "fp", handler)
+        await running
+
+        # Expired keys are free again
+        expiring = IdempotencyKeys(DatabaseStore(database), ttl=0)
+        await expiring.run("default", "once", "fp", Handler(201))
+        assert (await expiring.run("default", "once", "other", Handler(201)))[1] is False
+
+def test_http_signup_replays_retries_and_rejects_reused_keys(client, monkeypatch):
+    """Test that a retried signup gets the first response back, and a reused or running key is refused"""
+    routes = importlib.import_module("waitlist_service.router")
+    monkeypatch.setattr(routes, "idempotency_keys", IdempotencyKeys(MemoryStore()))
+    body = {"name": "User", "email": "a@example.com"}
+    headers = {"Idempotency-Key": "signup-1"}
+
+    first = client.post("/waitlist/waitlist/", json=body, headers=headers)
+    retry = client.post("/waitlist/waitlist/", json=body, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert "Idempotent-Replayed" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    # Without the key the same body is a duplicate
+    assert client.post("/waitlist/waitlist/", json=body).status_code == 400
+
+    other = {"name": "User", "email": "b@example.com"}
+    assert client.post("/waitlist/waitlist/", json=other, headers=headers).status_code == 422
+    assert client.post("/waitlist/waitlist/", json=body, headers={"Idempotency-Key": "k" * 256}).status_code == 400
+    # Keys are per list
+    assert client.post("/lists/beta/waitlist/waitlist/", json=body, headers=headers).status_code == 201
+
+    # Another replica still running the key
+    store = routes.idempotency_keys.store
+    store._set("default:signup-2", Claim(fingerprint(WaitlistCreate(**body).model_dump())), 60)
+    monkeypatch.setattr(routes.idempotency_keys, "wait_seconds", 0.05)
+    assert client.post("/waitlist/waitlist/", json=body, headers={"Idempotency-Key": "signup-2"}).status_code == 409
@@ -0,0 +1,110 @@
+import json
+import pytest
+from databases import Database
+from waitlist_service.importer import import_entries, iter_csv_records, iter_ndjson_records
+from waitlist_service import stats
+from waitlist_service.queries import fetch_entry_by_email, insert_returning, waitlist_table
+
+async def stream(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+async def collect(records):
+    return [item async for item in records]
+
+@pytest.mark.asyncio
+async def test_csv_records_span_chunks_and_lines():
+    """Test that CSV rows are parsed across chunk boundaries and quoted newlines"""
+    data = b'name,email,comment\nAda,ada@example.com,"line one\nline two"\n\nBob,bob@example.com,\n'
+    records = await collect(iter_csv_records(stream(data)))
+    assert records == [
+        (1, {"name": "Ada", "email": "ada@example.com", "comment": "line one\nline two"}),
+        (2, {"name": "Bob", "email": "bob@example.com", "comment": None}),
+    ]
+
+@pytest.mark.asyncio
+async def test_ndjson_records_report_bad_lines():
+    """Test that unparseable NDJSON lines become row errors"""
+    data = b'{"name": "Ada", "email": "ada@example.com"}\nnot json\n[1]\n'
+    records = await collect(iter_ndjson_records(stream(data)))
+    assert records[0] == (1, {"name": "Ada", "email": "ada@example.com"})
+    assert isinstance(records[1][1], ValueError)
+    assert isinstance(records[2][1], ValueError)
+
+@pytest.mark.asyncio
+async def test_import_inserts_in_chunks_and_reports_errors(database_url):
+    """Test that valid rows are loaded chunk by chunk and invalid rows are reported"""
+    lines = [json.dumps({"name": f"User {i}", "email": f"user{i}@example.com"}) for i in range(25)]
+    lines.insert(3, json.dumps({"name": "No Email"}))
+    lines.insert(10, json.dumps({"name": "Bad", "email": "not-an-email"}))
+    data = ("\n".join(lines) + "\n").encode()
+    progress, errors = [], []
+
+    async with Database(database_url) as database:
+        report = await import_entries(
+            database,
+            iter_ndjson_records(stream(data, 64)),
+            chunk_size=10,
+            progress=lambda report: progress.append(report.processed),
+            on_error=errors.append,
+        )
+        assert await fetch_entry_by_email(database, "user24@example.com") is not None
+
+    assert (report.processed, report.inserted, report.failed) == (27, 25, 2)
+    assert progress == [10, 20, 27]
+    assert [error.row for error in errors] == [4, 11]
+    assert "email" in errors[0].error
+
+@pytest.mark.asyncio
+async def test_import_skip_policy_keeps_existing_entries(database_url):
+    """Test that the skip policy leaves existing and repeated emails untouched"""
+    data = b"name,email\nNew Name,old@example.com\nFresh,fresh@example.com\nAgain,fresh@example.com\n"
+    async with Database(database_url) as database:
+        await insert_returning(database, {"name": "Old Name", "email": "old@example.com"})
+        report = await import_entries(database, iter_csv_records(stream(data)))
+        existing = await fetch_entry_by_email(database, "old@example.com")
+        fresh = await fetch_entry_by_email(database, "fresh@example.com")
+
+    assert (report.inserted, report.skipped, report.updated) == (1, 2, 0)
+    assert existing["name"] == "Old Name"
+    assert fresh["name"] == "Fresh"
+
+@pytest.mark.asyncio
+async def test_import_update_policy_overwrites_existing_entries(database_url):
+    """Test that the update policy overwrites name and comment but keeps the signup time"""
+    data = b"name,email,comment,created_at\nNew Name,old@example.com,imported,2020-01-01T00:00:00\n"
+    async with Database(database_url) as database:
+        original = await insert_returning(database, {"name": "Old Name", "email": "old@example.com"})
+        report = await import_entries(database, iter_csv_records(stream(data)), on_conflict="update")
+        updated = await fetch_entry_by_email(database, "old@example.com")
+
+    assert (report.inserted, report.updated) == (0, 1)
+    assert updated["name"] == "New Name"
+    assert updated["comment"] == "imported"
+    assert updated["created_at"] == original["created_at"]
+
+@pytest.mark.asyncio
+async def test_import_matches_entries_without_an_email_key(database_url):
+    """Test that rows matching an entry not yet given an email key are skipped or update it, and counted as such"""
+    data = b"name,email\nNew Name,legacy@example.com\nFresh,fresh@example.com\n"
+    async with Database(database_url) as database:
+        # Written before email keys existed, not yet backfilled
+        await database.execute(
+            waitlist_table.insert().values(
+                waitlist="default", name="Old Name", email="legacy@example.com", is_active=True, referral_count=0
+            )
+        )
+        skipped = await import_entries(database, iter_csv_records(stream(data)), stats=True)
+        legacy = waitlist_table.select().where(waitlist_table.c.email == "legacy@example.com")
+        kept = await database.fetch_one(legacy)
+        updated = await import_entries(database, iter_csv_records(stream(data)), on_conflict="update", stats=True)
+        overwritten = await database.fetch_one(legacy)
+        totals = await stats.totals(database)
+
+    assert (skipped.inserted, skipped.skipped, skipped.updated) == (1, 1, 0)
+    assert kept["name"] == "Old Name"
+    assert (updated.inserted, updated.skipped, updated.updated) == (0, 0, 2)
+    assert overwritten["name"] == "New Name"
+    # Only the fresh email was a new signup
+    assert totals["total"] == 1
+
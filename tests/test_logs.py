@@ -0,0 +1,91 @@
+import io
+import json
+import logging
+import threading
+import pytest
+from waitlist_service import logs
+from waitlist_service.logs import SAMPLED, RequestContextFilter, RequestIdMiddleware
+
+@pytest.fixture
+def restore_root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield
+    logs.stop_listener()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+def test_json_lines_carry_request_id_and_extra_fields(restore_root_logger):
+    """Test that JSON output includes the request ID and extra fields"""
+    stream = io.StringIO()
+    logs.configure_logging(level="INFO", format="json", use_queue=False, sample_rate=1, stream=stream)
+    token = logs.request_id.set("abc-123")
+    try:
+        logging.getLogger("test").info("Inserted entry with ID: %s", 7, extra={**SAMPLED, "entry_id": 7})
+    finally:
+        logs.request_id.reset(token)
+
+    line = json.loads(stream.getvalue())
+    assert line["message"] == "Inserted entry with ID: 7"
+    assert line["request_id"] == "abc-123"
+    assert line["entry_id"] == 7
+    assert line["level"] == "INFO"
+    assert "sampled" not in line
+
+def test_sampling_drops_only_sampled_records():
+    """Test that sampling applies to records marked as sampled and nothing else"""
+    rolls = iter([0.5, 0.05])
+    sampler = RequestContextFilter(sample_rate=0.1, rng=lambda: next(rolls))
+
+    def record(extra):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+        record.__dict__.update(extra)
+        return record
+
+    assert not sampler.filter(record(SAMPLED))
+    assert sampler.filter(record(SAMPLED))
+    assert sampler.filter(record({}))
+
+def test_queue_handler_formats_on_listener(restore_root_logger):
+    """Test that queued records are formatted and written by the listener thread"""
+    class Payload:
+        formatted_on = None
+
+        def __str__(self):
+            Payload.formatted_on = threading.current_thread()
+            return "payload"
+
+    stream = io.StringIO()
+    logs.configure_logging(level="INFO", format="text", use_queue=True, sample_rate=1, stream=stream)
+    logging.getLogger("test").info("Creating entry: %s", Payload())
+    logs.stop_listener()
+
+    assert stream.getvalue() == "INFO:test:Creating entry: payload\n"
+    assert Payload.formatted_on is not threading.current_thread()
+
+@pytest.mark.asyncio
+async def test_request_id_middleware_echoes_or_replaces_id():
+    """Test that a valid X-Request-ID is echoed and an invalid one is replaced"""
+    seen = []
+
+    async def app(scope, receive, send):
+        seen.append(logs.request_id.get())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    sent = []
+
+    async def send(message):
+        sent.append(dict(message["headers"]))
+
+    middleware = RequestIdMiddleware(app)
+    for value in (b"req-1.a_B", b"bad id\nforged"):
+        await middleware({"type": "http", "headers": [(b"x-request-id", value)]}, None, send)
+
+    assert seen[0] == "req-1.a_B"
+    assert sent[0][b"x-request-id"] == b"req-1.a_B"
+    assert len(seen[1]) == 32 and seen[1] != "bad id\nforged"
+    assert sent[1][b"x-request-id"] == seen[1].encode()
+    assert logs.request_id.get() is None
@@ -0,0 +1,68 @@
+import pytest
+from waitlist_service import metrics, pool, prepared
+from waitlist_service.metrics import Counter, Histogram, MetricsMiddleware, Registry, query_name
+from waitlist_service.queries import insert_returning, waitlist_table
+
+def test_render_prometheus_and_openmetrics():
+    """Test that counters and histograms render cumulative buckets in both text formats"""
+    registry = Registry()
+    requests = registry.register(Counter("requests", "Requests", ("route",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0)))
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a\\"b"} 3' in text
+    assert 'latency_seconds_bucket{le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{le="1"} 3' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in text
+    assert "latency_seconds_count 4" in text
+    assert "latency_seconds_sum 3.65" in text
+
+    openmetrics = registry.render(openmetrics=True)
+    assert "# TYPE requests counter" in openmetrics
+    assert openmetrics.endswith("# EOF\n")
+
+@pytest.mark.asyncio
+async def test_middleware_labels_by_route_template():
+    """Test that requests are labelled by route template and unmatched paths share one label"""
+    class Route:
+        path_format = "/waitlist/{entry_id}"
+
+    async def app(scope, receive, send):
+        if scope["path"] != "/nope":
+            scope["route"] = Route()
+        await send({"type": "http.response.start", "status": 404 if scope["path"] == "/nope" else 200})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(app)
+    for path in ("/waitlist/1", "/waitlist/2", "/nope"):
+        await middleware({"type": "http", "method": "GET", "path": path}, None, send)
+
+    assert metrics.HTTP_REQUESTS.values[("GET", "/waitlist/{entry_id}", "200")] >= 2
+    assert metrics.HTTP_REQUESTS.values[("GET", "unmatched", "404")] >= 1
+    assert metrics.HTTP_REQUEST_DURATION.count("GET", "/waitlist/{entry_id}") >= 2
+
+@pytest.mark.asyncio
+async def test_queries_are_timed_by_name(database_url, monkeypatch):
+    """Test that prepared and unprepared queries land in the query histogram under their names"""
+    monkeypatch.setattr(pool, "METRICS", True)
+    monkeypatch.setattr(prepared, "METRICS", True)
+    inserts = metrics.DB_QUERY_DURATION.count("insert:waitlist_entries")
+    selects = metrics.DB_QUERY_DURATION.count("select:waitlist_entries")
+
+    database = pool.create_database(database_url)
+    async with database:
+        await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+        await database.fetch_all(waitlist_table.select())
+
+    assert metrics.DB_QUERY_DURATION.count("insert:waitlist_entries") == inserts + 1
+    assert metrics.DB_QUERY_DURATION.count("select:waitlist_entries") == selects + 1
+    assert query_name("LOCK TABLE signup_rollups IN EXCLUSIVE MODE") == "lock"
+    assert query_name(waitlist_table.delete()) == "delete:waitlist_entries"
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from waitlist_service.notifications import TelegramNotifier, TokenBucket
+
+class FakeSession:
+    async def close(self):
+        pass
+
+class FakeBot:
+    """Records messages instead of calling the Telegram API."""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.messages = []
+        self.session = FakeSession()
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        await asyncio.sleep(self.delay)
+        self.messages.append(text)
+
+def make_notifier(bot, **kwargs):
+    notifier = TelegramNotifier(**kwargs)
+    notifier.enabled = True
+    notifier.bot = bot
+    notifier.TELEGRAM_CHAT_ID = "chat"
+    return notifier
+
+@pytest.mark.asyncio
+async def test_notify_returns_before_send():
+    """Test that notify_new_signup only enqueues, even when Telegram is slow"""
+    bot = FakeBot(delay=0.5)
+    notifier = make_notifier(bot)
+
+    started = asyncio.get_running_loop().time()
+    await notifier.notify_new_signup(email="test@example.com", name="Test User")
+    assert asyncio.get_running_loop().time() - started < 0.1
+    assert bot.messages == []
+
+    await notifier.close()
+    assert len(bot.messages) == 1
+    assert "test@example.com" in bot.messages[0]
+
+@pytest.mark.asyncio
+async def test_burst_is_coalesced():
+    """Test that signups queued while rate limited become one summary message"""
+    bot = FakeBot()
+    notifier = make_notifier(bot, rate_per_second=5, burst=1)
+
+    await notifier.notify_new_signup(email="first@example.com")
+    await asyncio.sleep(0.01)
+    for i in range(30):
+        await notifier.notify_new_signup(
+            email=f"user{i}@example.com",
+            referral_source="twitter" if i % 3 else "newsletter",
+        )
+    await notifier.close()
+
+    assert len(bot.messages) == 2
+    assert "first@example.com" in bot.messages[0]
+    assert "+30 signups" in bot.messages[1]
+    assert "twitter (20), newsletter (10)" in bot.messages[1]
+
+@pytest.mark.asyncio
+async def test_full_queue_counts_dropped_signups():
+    """Test that signups beyond the queue size still show up in the summary count"""
+    bot = FakeBot()
+    notifier = make_notifier(bot, queue_size=5, rate_per_second=100, burst=1)
+
+    for i in range(8):
+        await notifier.notify_new_signup(email=f"user{i}@example.com")
+    await notifier.close()
+
+    assert len(bot.messages) == 1
+    assert "+8 signups" in bot.messages[0]
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_after_burst():
+    """Test that the bucket allows a burst, then waits for refills"""
+    bucket = TokenBucket(rate=20, capacity=2)
+    loop = asyncio.get_running_loop()
+
+    started = loop.time()
+    for _ in range(4):
+        await bucket.acquire()
+
+    assert loop.time() - started >= 0.09
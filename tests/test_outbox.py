@@ -0,0 +1,128 @@
+import asyncio
+import pytest
+from databases import Database
+from waitlist_service import outbox
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.notifications import TelegramNotifier
+from waitlist_service.outbox import OutboxDispatcher, enqueue_signups, outbox_table
+from waitlist_service.queries import insert_returning
+
+class FakeNotifier:
+    """Records announced signups, failing the first ``failures`` sends."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    async def send_signups(self, signups):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("Telegram unavailable")
+        self.sent.append([signup.email for signup in signups])
+
+async def add_signup(database, email):
+    async with database.transaction():
+        entry = await insert_returning(database, {"name": "Test User", "email": email})
+        await enqueue_signups(database, [entry])
+    return entry
+
+@pytest.mark.asyncio
+async def test_outbox_row_rolls_back_with_insert(database_url):
+    """Test that a failed signup transaction leaves no outbox row behind"""
+    async with Database(database_url) as database:
+        await add_signup(database, "test@example.com")
+        with pytest.raises(Exception):
+            await add_signup(database, "test@example.com")
+        rows = await database.fetch_all(outbox_table.select())
+
+    assert len(rows) == 1
+    assert rows[0]["delivered_at"] is None
+
+@pytest.fixture(params=[True, False], ids=["returning", "fallback"])
+def returning(request, monkeypatch):
+    """Claim rows with and without RETURNING support."""
+    monkeypatch.setattr(outbox, "supports_returning", lambda database: request.param)
+    return request.param
+
+@pytest.mark.asyncio
+async def test_dispatch_delivers_in_batches(database_url, returning):
+    """Test that pending rows are claimed in batches and marked delivered"""
+    notifier = FakeNotifier()
+    async with Database(database_url) as database:
+        for i in range(5):
+            await add_signup(database, f"user{i}@example.com")
+        dispatcher = OutboxDispatcher(database, notifier, batch_size=3)
+
+        delivered = [await dispatcher.dispatch_once() for _ in range(3)]
+        pending = await database.fetch_all(
+            outbox_table.select().where(outbox_table.c.delivered_at.is_(None))
+        )
+
+    assert delivered == [3, 2, 0]
+    assert notifier.sent == [
+        ["user0@example.com", "user1@example.com", "user2@example.com"],
+        ["user3@example.com", "user4@example.com"],
+    ]
+    assert pending == []
+
+@pytest.mark.asyncio
+async def test_failed_send_is_retried_with_backoff(database_url):
+    """Test that a failed send is released with a later available_at, then retried"""
+    notifier = FakeNotifier(failures=1)
+    async with Database(database_url) as database:
+        await add_signup(database, "test@example.com")
+        dispatcher = OutboxDispatcher(database, notifier, backoff_seconds=0.05)
+
+        assert await dispatcher.dispatch_once() == 0
+        row = await database.fetch_one(outbox_table.select())
+        assert row["attempts"] == 1
+        assert row["last_error"] == "Telegram unavailable"
+        assert await dispatcher.dispatch_once() == 0
+
+        await asyncio.sleep(0.1)
+        assert await dispatcher.dispatch_once() == 1
+
+    assert notifier.sent == [["test@example.com"]]
+
+@pytest.mark.asyncio
+async def test_claimed_rows_are_not_claimed_twice(database_url):
+    """Test that two dispatchers never send the same row"""
+    notifiers = [FakeNotifier(), FakeNotifier()]
+    async with Database(database_url) as database:
+        for i in range(4):
+            await add_signup(database, f"user{i}@example.com")
+        dispatchers = [OutboxDispatcher(database, notifier, batch_size=2) for notifier in notifiers]
+        await asyncio.gather(*(dispatcher.dispatch_once() for dispatcher in dispatchers))
+
+    sent = [email for notifier in notifiers for batch in notifier.sent for email in batch]
+    assert sorted(sent) == [f"user{i}@example.com" for i in range(4)]
+
+@pytest.mark.asyncio
+async def test_dispatcher_loop_wakes_on_signup(database_url):
+    """Test that the running dispatcher sends a batched signup without waiting for the poll"""
+    notifier = FakeNotifier()
+    async with Database(database_url) as database:
+        dispatcher = OutboxDispatcher(database, notifier, poll_seconds=10)
+        batcher = SignupBatcher(database, window_ms=5, outbox=True)
+        dispatcher.start()
+
+        await batcher.submit({"name": "Test User", "email": "test@example.com"})
+        dispatcher.wake()
+        for _ in range(50):
+            if notifier.sent:
+                break
+            await asyncio.sleep(0.01)
+
+        await batcher.close()
+        await dispatcher.close()
+
+    assert notifier.sent == [["test@example.com"]]
+
+@pytest.mark.asyncio
+async def test_disabled_notifier_marks_delivered(database_url):
+    """Test that rows are drained (and logged) when Telegram is not configured"""
+    notifier = TelegramNotifier()
+    notifier.enabled = False
+    async with Database(database_url) as database:
+        await add_signup(database, "test@example.com")
+        assert await OutboxDispatcher(database, notifier).dispatch_once() == 1
@@ -0,0 +1,88 @@
+import random
+import pytest
+from datetime import datetime, timedelta
+from databases import Database
+from waitlist_service.positions import PositionIndex, RankedSet, create_position_index, sql_position, sql_top
+from waitlist_service.queries import insert_returning, update_returning
+
+def test_ranked_set_matches_sorted_list():
+    """Test that ranks stay correct through adds, discards and block splits"""
+    rng = random.Random(7)
+    keys = rng.sample(range(100000), 3000)
+    ranked = RankedSet(keys[:1000], load=16)
+    expected = sorted(keys[:1000])
+    for key in keys[1000:]:
+        ranked.add(key)
+        expected.append(key)
+    for key in keys[:1500:3]:
+        ranked.discard(key)
+        expected.remove(key)
+    expected.sort()
+
+    assert len(ranked) == len(expected)
+    for probe in rng.sample(range(100000), 500):
+        assert ranked.rank(probe) == sum(1 for key in expected if key < probe)
+    assert ranked.first(20) == expected[:20]
+
+async def insert_users(database, count, start=datetime(2024, 1, 1), prefix="user"):
+    return [
+        await insert_returning(
+            database,
+            {"name": f"User {i}", "email": f"{prefix}{i}@example.com", "created_at": start + timedelta(minutes=i)},
+        )
+        for i in range(count)
+    ]
+
+@pytest.mark.asyncio
+async def test_index_positions_match_sql(database_url):
+    """Test that the index and the COUNT(*) fallback agree on positions and the front of the line"""
+    async with Database(database_url) as database:
+        entries = await insert_users(database, 20)
+        # Deactivated entries leave the line; queue_at moves an entry ahead
+        await update_returning(database, entries[2]["id"], {"is_active": False})
+        moved = await update_returning(database, entries[15]["id"], {"queue_at": datetime(2023, 12, 31)})
+
+        index = PositionIndex(database)
+        await index.rebuild()
+
+        assert index.position(moved) == (1, 19)
+        assert index.position(entries[0]) == (2, 19)
+        assert index.position(entries[3]) == (4, 19)
+        for entry in entries[3:]:
+            row = moved if entry["id"] == moved["id"] else entry
+            assert index.position(row) == await sql_position(database, row)
+        assert index.top(5) == await sql_top(database, 5)
+
+@pytest.mark.asyncio
+async def test_index_follows_local_writes_and_syncs_new_rows(database_url):
+    """Test that local adds and discards apply at once and other writers' rows arrive on sync"""
+    async with Database(database_url) as database:
+        entries = await insert_users(database, 5)
+        index = PositionIndex(database)
+        await index.rebuild()
+
+        index.discard(entries[0])
+        assert index.position(entries[1]) == (1, 4)
+
+        later = await insert_users(database, 3, start=datetime(2024, 2, 1), prefix="later")
+        assert len(index) == 4
+        assert await index.sync() == 3
+        assert index.position(later[-1]) == (7, 7)
+
+@pytest.mark.asyncio
+async def test_index_is_only_used_by_a_single_replica(database_url):
+    """Test that changes made elsewhere wait for a rebuild, so several replicas answer positions with SQL"""
+    async with Database(database_url) as database:
+        entries = await insert_users(database, 3)
+        index = create_position_index(database, enabled=True, replicas=1)
+        await index.rebuild()
+
+        # A delete by another replica is invisible to sync, which reads new IDs only
+        await update_returning(database, entries[0]["id"], {"is_active": False})
+        assert await index.sync() == 0
+        assert index.position(entries[1]) == (2, 3)
+        await index.rebuild()
+        assert index.position(entries[1]) == (1, 2)
+
+        assert create_position_index(database, enabled=True, replicas=2) is None
+        assert create_position_index(database, enabled=False, replicas=1) is None
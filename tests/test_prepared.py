@@ -0,0 +1,35 @@
+import pytest
+from datetime import datetime
+from databases import Database
+from waitlist_service.prepared import statements
+from waitlist_service.queries import insert_returning, fetch_entry, fetch_entry_by_email, delete_entry
+
+@pytest.mark.asyncio
+async def test_prepared_queries_convert_types(database_url):
+    """Test that rows read through the driver get the same Python types as Core queries"""
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+        entry = await fetch_entry(database, row["id"])
+        by_email = await fetch_entry_by_email(database, "test@example.com")
+        await delete_entry(database, row["id"])
+        missing = await fetch_entry(database, row["id"])
+
+    assert isinstance(entry["created_at"], datetime)
+    assert entry["is_active"] is True
+    assert by_email["id"] == row["id"]
+    assert missing is None
+
+@pytest.mark.asyncio
+async def test_statements_compile_once(database_url):
+    """Test that repeated calls reuse the cached statement and its compiled SQL"""
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "a@example.com"})
+        await fetch_entry(database, row["id"])
+        cached = len(statements)
+        compiled = statements.get(("get", "waitlist_entries"), None).compiled("sqlite")
+
+        await insert_returning(database, {"name": "Test User", "email": "b@example.com"})
+        await fetch_entry(database, row["id"])
+
+    assert len(statements) == cached
+    assert statements.get(("get", "waitlist_entries"), None).compiled("sqlite") is compiled
@@ -0,0 +1,86 @@
+import pytest
+from databases import Database
+from waitlist_service import prepared, profiling
+from waitlist_service.profiling import ProfileBuffer, ProfilingMiddleware, Trace, profiled, span
+from waitlist_service.queries import fetch_entry, insert_returning
+
+async def run(middleware, headers=()):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": "POST", "path": "/waitlist/", "headers": list(headers)}
+    await middleware(scope, receive, send)
+
+@pytest.mark.asyncio
+async def test_slow_requests_keep_phase_timings(monkeypatch):
+    """Test that a request over the threshold is buffered with its phases in order"""
+    monkeypatch.setattr(profiling, "PROFILING", True)
+
+    @profiled
+    async def endpoint():
+        with span("execute", "insert:waitlist_entries"):
+            pass
+        with span("notify"):
+            pass
+
+    async def app(scope, receive, send):
+        await endpoint()
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    buffer = ProfileBuffer(size=2)
+    await run(ProfilingMiddleware(app, buffer=buffer, slow_ms=0))
+
+    [record] = buffer.records
+    assert record["reason"] == "slow"
+    assert record["status"] == 201
+    assert record["profile"] is None
+    assert [s["phase"] for s in record["spans"]] == ["validate", "execute", "notify", "serialize"]
+    assert record["spans"][1]["detail"] == "insert:waitlist_entries"
+
+    # Fast requests are not kept, and the buffer holds only the latest records
+    await run(ProfilingMiddleware(app, buffer=buffer, slow_ms=10_000))
+    assert len(buffer.records) == 1
+    for _ in range(3):
+        await run(ProfilingMiddleware(app, buffer=buffer, slow_ms=0))
+    assert [r["id"] for r in buffer.records] == [3, 4]
+
+@pytest.mark.asyncio
+async def test_profile_header_requires_token():
+    """Test that only the configured X-Profile token captures a cProfile report"""
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    buffer = ProfileBuffer()
+    middleware = ProfilingMiddleware(app, buffer=buffer, slow_ms=10_000, token="s3cret")
+    await run(middleware, [(b"x-profile", b"wrong")])
+    assert not buffer.records
+
+    await run(middleware, [(b"x-profile", b"s3cret")])
+    [record] = buffer.records
+    assert record["reason"] == "header"
+    assert "function calls" in record["profile"]
+    assert not middleware.active
+    assert "profile" not in buffer.summaries()[0]
+
+@pytest.mark.asyncio
+async def test_prepared_queries_record_build_execute_fetch(database_url, monkeypatch):
+    """Test that prepared queries add their phases to the current trace"""
+    monkeypatch.setattr(prepared, "PROFILING", True)
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+        trace = Trace()
+        token = profiling._trace.set(trace)
+        try:
+            assert (await fetch_entry(database, row["id"]))["email"] == "test@example.com"
+        finally:
+            profiling._trace.reset(token)
+
+    assert [(s["phase"], s["detail"]) for s in trace.spans] == [
+        ("build", "get:waitlist_entries"),
+        ("execute", "get:waitlist_entries"),
+        ("fetch", "get:waitlist_entries"),
+    ]
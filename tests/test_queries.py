@@ -0,0 +1,102 @@
+import pytest
+from datetime import datetime, timedelta
+from databases import Database
+from waitlist_service import queries
+from waitlist_service.queries import (
+    insert_returning,
+    update_returning,
+    fetch_page,
+    InvalidCursorError,
+    INTEGRITY_ERRORS,
+)
+
+@pytest.fixture(params=[True, False], ids=["returning", "fallback"])
+def returning(request, monkeypatch):
+    """Run each test with and without RETURNING support."""
+    monkeypatch.setattr(queries, "supports_returning", lambda database: request.param)
+    return request.param
+
+@pytest.mark.asyncio
+async def test_insert_returning(database_url, returning):
+    """Test that the inserted row comes back with server defaults"""
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+
+    assert row["id"] is not None
+    assert row["email"] == "test@example.com"
+    assert row["created_at"] is not None
+    assert row["is_active"] is True
+
+@pytest.mark.asyncio
+async def test_insert_returning_duplicate_email(database_url, returning):
+    """Test that duplicate emails raise one of the integrity errors"""
+    async with Database(database_url) as database:
+        await insert_returning(database, {"name": "First User", "email": "dup@example.com"})
+        with pytest.raises(INTEGRITY_ERRORS):
+            await insert_returning(database, {"name": "Second User", "email": "dup@example.com"})
+
+@pytest.mark.asyncio
+async def test_update_returning(database_url, returning):
+    """Test that updates return the updated row, or None for unknown IDs"""
+    async with Database(database_url) as database:
+        row = await insert_returning(database, {"name": "Test User", "email": "test@example.com"})
+        updated = await update_returning(database, row["id"], {"comment": "updated"})
+        missing = await update_returning(database, row["id"] + 1, {"comment": "updated"})
+
+    assert updated["id"] == row["id"]
+    assert updated["comment"] == "updated"
+    assert missing is None
+
+@pytest.mark.asyncio
+async def test_fetch_page_walks_all_entries(database_url):
+    """Test that following cursors returns every entry once, newest first"""
+    start = datetime(2024, 1, 1)
+    async with Database(database_url) as database:
+        for i in range(7):
+            # Entries 2-4 share a timestamp so the id tiebreaker is exercised
+            created_at = start + timedelta(minutes=3 if 2 <= i <= 4 else i)
+            await insert_returning(
+                database,
+                {"name": f"User {i}", "email": f"user{i}@example.com", "created_at": created_at},
+            )
+
+        pages, cursor = [], None
+        while True:
+            rows, cursor = await fetch_page(database, 3, cursor=cursor)
+            pages.append([row["email"] for row in rows])
+            if cursor is None:
+                break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    emails = [email for page in pages for email in page]
+    assert emails == [f"user{i}@example.com" for i in (6, 5, 4, 3, 2, 1, 0)]
+
+@pytest.mark.asyncio
+async def test_fetch_page_filters(database_url):
+    """Test filtering by referral source and creation date range"""
+    start = datetime(2024, 1, 1)
+    async with Database(database_url) as database:
+        for i in range(6):
+            await insert_returning(database, {
+                "name": f"User {i}",
+                "email": f"user{i}@example.com",
+                "referral_source": "twitter" if i % 2 else "email",
+                "created_at": start + timedelta(days=i),
+            })
+
+        by_source, _ = await fetch_page(database, 10, referral_source="twitter")
+        by_date, _ = await fetch_page(
+            database, 10,
+            created_after=start + timedelta(days=2),
+            created_before=start + timedelta(days=4),
+        )
+
+    assert [row["email"] for row in by_source] == ["user5@example.com", "user3@example.com", "user1@example.com"]
+    assert [row["email"] for row in by_date] == ["user3@example.com", "user2@example.com"]
+
+@pytest.mark.asyncio
+async def test_fetch_page_invalid_cursor(database_url):
+    """Test that a malformed cursor raises InvalidCursorError"""
+    async with Database(database_url) as database:
+        with pytest.raises(InvalidCursorError):
+            await fetch_page(database, 10, cursor="not-a-cursor")
@@ -0,0 +1,150 @@
+import importlib
+import json
+import pytest
+from waitlist_service.ratelimit import (
+    Limit,
+    MemoryLimitStore,
+    RateLimiter,
+    RateLimitMiddleware,
+    client_ip,
+)
+
+def limiter(**kwargs):
+    options = dict(
+        ip_limit=Limit(60, 3),
+        domain_limit=Limit(60, 2),
+        allowlist="10.0.0.0/8",
+        domain_allowlist="gmail.com",
+    )
+    options.update(kwargs)
+    return RateLimiter(MemoryLimitStore(), **options)
+
+async def call(app, method="POST", path="/waitlist/waitlist/", body=b"", peer="203.0.113.7", headers=()):
+    """Run one request through an ASGI app and return its status, headers and the body the app saw."""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "client": (peer, 50000),
+    }
+    chunks = [body[:5], body[5:]]
+    received = []
+    sent = []
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    async def send(message):
+        sent.append(message)
+
+    async def app_under_test(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    await app(app_under_test)(scope, receive, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(received)
+
+def signup(email):
+    return json.dumps({"name": "Test User", "email": email}).encode()
+
+@pytest.mark.asyncio
+async def test_burst_then_retry_after(caplog):
+    """Test that a client gets its burst, then 429 with Retry-After, and reads are never limited"""
+    rate_limiter = limiter()
+    middleware = lambda app: RateLimitMiddleware(app, rate_limiter, "/waitlist/waitlist/")
+
+    statuses = []
+    for i in range(4):
+        status, headers, seen = await call(middleware, body=signup(f"user{i}@example{i}.com"))
+        statuses.append(status)
+    assert statuses == [201, 201, 201, 429]
+    assert headers[b"retry-after"] == b"1"
+    # Floods of 429s are logged lazily and can be sampled away
+    limited = [record for record in caplog.records if record.msg.startswith("Rate limited")]
+    assert limited[0].args == ("POST", "/waitlist/waitlist/", "203.0.113.7", "example3.com")
+    assert limited[0].sampled is True
+    assert (await call(middleware, method="GET", path="/waitlist/waitlist/1"))[0] == 201
+
+    # The signup body read for its domain still reaches the route intact
+    status, _, seen = await call(middleware, body=signup("user@other.com"), peer="203.0.113.8")
+    assert status == 201
+    assert seen == signup("user@other.com")
+
+@pytest.mark.asyncio
+async def test_domain_limit_and_allowlists():
+    """Test that signups are limited per email domain except allowlisted domains and IPs"""
+    rate_limiter = limiter()
+    middleware = lambda app: RateLimitMiddleware(app, rate_limiter, "/waitlist/waitlist/")
+
+    statuses = [
+        (await call(middleware, body=signup(f"bot{i}@spam.example"), peer=f"203.0.113.{i}"))[0]
+        for i in range(3)
+    ]
+    assert statuses == [201, 201, 429]
+    for i in range(5):
+        assert (await call(middleware, body=signup(f"user{i}@gmail.com"), peer=f"198.51.100.{i}"))[0] == 201
+        assert (await call(middleware, body=signup(f"x{i}@spam.example"), peer="10.1.2.3"))[0] == 201
+    assert rate_limiter.rejected == 1
+
+@pytest.mark.asyncio
+async def test_memory_store_forgets_idle_clients():
+    """Test that buckets refill over time and refilled keys are dropped"""
+    store = MemoryLimitStore()
+    assert await store.take("ip:a", interval=0.01, tolerance=0.0) == 0
+    assert await store.take("ip:a", interval=0.01, tolerance=0.0) > 0
+    assert len(store) == 1
+    store._prune(now=float("inf"))
+    assert len(store) == 0
+
+def test_client_ip_trusts_only_the_configured_proxies():
+    """Test that forged X-Forwarded-For entries left of the trusted proxies are ignored"""
+    headers = [(b"x-forwarded-for", b"1.2.3.4, 198.51.100.9")]
+    assert client_ip(headers, ("10.0.0.1", 1), 1) == "198.51.100.9"
+    assert client_ip(headers, ("10.0.0.1", 1), 2) == "1.2.3.4"
+    assert client_ip(headers, ("10.0.0.1", 1), 0) == "10.0.0.1"
+    assert client_ip([], ("10.0.0.1", 1), 1) == "10.0.0.1"
+
+@pytest.mark.asyncio
+async def test_direct_clients_cannot_forge_their_way_onto_the_allowlist():
+    """Test that without trusted proxies X-Forwarded-For is ignored, so a forged loopback address is still limited"""
+    rate_limiter = limiter(allowlist="127.0.0.1,::1")
+    middleware = lambda app: RateLimitMiddleware(app, rate_limiter, "/waitlist/waitlist/", trusted_proxies=0)
+    assert client_ip([(b"x-forwarded-for", b"127.0.0.1")], ("203.0.113.9", 5555), 0) == "203.0.113.9"
+
+    statuses = [
+        (await call(
+            middleware,
+            body=signup(f"user{i}@example{i}.com"),
+            peer="203.0.113.9",
+            headers=[(b"x-forwarded-for", f"127.0.0.{i + 1}".encode())],
+        ))[0]
+        for i in range(4)
+    ]
+    assert statuses == [201, 201, 201, 429]
+
+def test_signup_stores_the_rate_limited_client_ip(client, monkeypatch):
+    """Test that a signup stores the X-Forwarded-For hop the limiter keys on, not the forgeable leftmost one"""
+    monkeypatch.setattr(importlib.import_module("waitlist_service.router"), "RATE_LIMIT_TRUSTED_PROXIES", 1)
+    response = client.post(
+        "/waitlist/waitlist/",
+        json={"name": "User", "email": "a@example.com"},
+        headers={"X-Forwarded-For": "6.6.6.6, 203.0.113.7"},
+    )
+    assert response.json()["ip_address"] == "203.0.113.7"
+
+    # Without a trusted proxy the header is ignored and the socket peer is stored
+    monkeypatch.setattr(importlib.import_module("waitlist_service.router"), "RATE_LIMIT_TRUSTED_PROXIES", 0)
+    response = client.post(
+        "/waitlist/waitlist/",
+        json={"name": "User", "email": "b@example.com"},
+        headers={"X-Forwarded-For": "127.0.0.1"},
+    )
+    assert response.json()["ip_address"] == "testclient"
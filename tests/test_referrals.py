@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from datetime import datetime
+from databases import Database
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.queries import insert_returning, fetch_entry
+from waitlist_service.referrals import (
+    credit_referrals,
+    decode_referral_code,
+    encode_referral_code,
+    fetch_leaderboard,
+)
+
+def signup(email, referred_by=None):
+    values = {"name": "Test User", "email": email, "created_at": datetime(2024, 1, 1)}
+    if referred_by is not None:
+        values["referred_by"] = referred_by
+    return values
+
+def test_referral_codes_round_trip_and_reject_typos():
+    """Test that every code decodes to its own ID and altered codes are rejected"""
+    codes = {encode_referral_code(entry_id) for entry_id in range(5000)}
+    assert len(codes) == 5000
+    for entry_id in (0, 1, 12345, 2**32 - 1):
+        code = encode_referral_code(entry_id)
+        assert decode_referral_code(code) == entry_id
+        assert decode_referral_code(code.lower()) == entry_id
+    code = encode_referral_code(42)
+    assert decode_referral_code(code[:-1] + ("0" if code[-1] != "0" else "1")) is None
+    assert decode_referral_code("not-a-code") is None
+    assert encode_referral_code(42, secret="other") != code
+
+@pytest.mark.asyncio
+async def test_concurrent_batched_signups_credit_every_referral(database_url):
+    """Test that referred signups written in batches credit the referrer once each"""
+    async with Database(database_url) as database:
+        referrer = await insert_returning(database, signup("referrer@example.com"))
+        credited = []
+
+        async def on_credited(pairs):
+            credited.extend(pairs)
+
+        batcher = SignupBatcher(database, window_ms=20, max_rows=8, on_credited=on_credited)
+        await asyncio.gather(
+            *(batcher.submit(signup(f"friend{i}@example.com", referrer["id"])) for i in range(20))
+        )
+        await batcher.close()
+
+        assert (await fetch_entry(database, referrer["id"]))["referral_count"] == 20
+        assert sum(after["referral_count"] - before["referral_count"] for before, after in credited) == 20
+
+@pytest.mark.asyncio
+async def test_boost_and_leaderboard(database_url):
+    """Test that a credited referral moves the referrer ahead and ranks the leaderboard by count"""
+    async with Database(database_url) as database:
+        first = await insert_returning(database, signup("first@example.com"))
+        second = await insert_returning(database, signup("second@example.com"))
+        async with database.transaction():
+            new_entries = [
+                await insert_returning(database, signup(f"friend{i}@example.com", second["id"]))
+                for i in range(3)
+            ]
+            new_entries.append(await insert_returning(database, signup("friend@example.com", first["id"])))
+            credited = await credit_referrals(database, new_entries, boost_seconds=60)
+
+        before, after = credited[1]
+        assert after["id"] == second["id"]
+        assert (before["referral_count"], after["referral_count"]) == (0, 3)
+        assert after["queue_at"] == datetime(2023, 12, 31, 23, 57)
+
+        board = await fetch_leaderboard(database, 10)
+        assert [(row["entry_id"], row["referral_count"]) for row in board] == [(second["id"], 3), (first["id"], 1)]
+        assert board[0]["referral_code"] == encode_referral_code(second["id"])
@@ -0,0 +1,64 @@
+import json
+from datetime import datetime, timezone
+from typing import List
+import pytest
+from pydantic import TypeAdapter
+from waitlist_service import serialization
+from waitlist_service.schemas.waitlist import WaitlistEntry
+from waitlist_service.serialization import entries_response, entry_response
+
+ROWS = [
+    {
+        "id": 1,
+        "waitlist": "default",
+        "name": "Test Üser",
+        "email": "test@example.com",
+        "ip_address": "127.0.0.1",
+        "comment": None,
+        "referral_source": "newsletter",
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, 678901),
+        "is_active": True,
+        "queue_at": None,
+        "referred_by": None,
+        "referral_count": 3,
+    },
+    {
+        "id": 2,
+        "waitlist": "launch",
+        "name": "Other User",
+        "email": "other@example.com",
+        "ip_address": None,
+        "comment": "hi",
+        "referral_source": None,
+        "created_at": datetime(2026, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+        "is_active": False,
+        "queue_at": None,
+        "referred_by": 1,
+        "referral_count": 0,
+    },
+]
+
+def pydantic_json(rows):
+    """The response body FastAPI writes after validating against the response model."""
+    return TypeAdapter(List[WaitlistEntry]).dump_json(
+        TypeAdapter(List[WaitlistEntry]).validate_python(rows, from_attributes=True)
+    )
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_fast_responses_match_response_model(monkeypatch, use_orjson):
+    """Test that rows written directly serialize exactly as the validated response model does"""
+    if not use_orjson:
+        monkeypatch.setattr(serialization, "orjson", None)
+    elif serialization.orjson is None:
+        pytest.skip("orjson is not installed")
+
+    expected = json.loads(pydantic_json(ROWS))
+    response = entries_response(ROWS, headers={"X-Next-Cursor": "abc"})
+    assert json.loads(response.body) == expected
+    assert response.headers["x-next-cursor"] == "abc"
+    assert response.headers["content-type"] == "application/json"
+
+    single = entry_response(ROWS[0], status_code=201)
+    assert single.status_code == 201
+    assert json.loads(single.body) == expected[0]
+    assert "is_active" not in expected[0] and "is_active" not in json.loads(single.body)
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from waitlist_service.singleflight import SingleFlight
+
+class Loader:
+    """Counts its calls and returns the call number, or raises, after a delay."""
+
+    def __init__(self, delay=0.01, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RuntimeError("query failed")
+        return self.calls
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_one_call():
+    """Test that concurrent reads of a key share one call and its result or error, and later reads run again"""
+    flights = SingleFlight()
+    loader = Loader()
+    other = Loader()
+    results = await asyncio.gather(*(flights.do("a", loader) for _ in range(10)), flights.do("b", other))
+    assert results == [1] * 10 + [1]
+    assert (loader.calls, other.calls) == (1, 1)
+    assert flights.stats() == {"led": 2, "shared": 9, "overflowed": 0}
+    assert flights.in_flight == 0
+
+    # Results are not kept once the call is over
+    assert await flights.do("a", loader) == 2
+
+    failing = Loader(fail=True)
+    results = await asyncio.gather(*(flights.do("f", failing) for _ in range(3)), return_exceptions=True)
+    assert failing.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_reads_and_bounds():
+    """Test that a cancelled read leaves the call to the others, the last one cancels it, and the table is bounded"""
+    flights = SingleFlight(max_keys=1)
+    loader = Loader(delay=0.05)
+    first = asyncio.create_task(flights.do("a", loader))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(flights.do("a", loader))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await second == 1
+    assert first.cancelled()
+    assert (loader.calls, loader.cancelled) == (1, 0)
+
+    # Nobody left waiting: the call is cancelled and the key freed at once
+    alone = asyncio.create_task(flights.do("a", loader))
+    await asyncio.sleep(0.01)
+    alone.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await alone
+    await asyncio.sleep(0)
+    assert loader.cancelled == 1
+    assert flights.in_flight == 0
+
+    # With every slot taken, other keys run on their own
+    held = asyncio.create_task(flights.do("a", loader))
+    await asyncio.sleep(0)
+    other = Loader()
+    await asyncio.gather(flights.do("b", other), flights.do("b", other))
+    assert other.calls == 2
+    assert flights.stats()["overflowed"] == 2
+
+    # A read after forget starts its own call while the earlier one finishes
+    flights.forget("a")
+    await asyncio.gather(held, flights.do("a", loader))
+    assert loader.calls == 4
@@ -0,0 +1,77 @@
+import pytest
+from datetime import datetime
+from databases import Database
+from waitlist_service import stats
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.importer import import_entries, iter_ndjson_records
+from waitlist_service.queries import insert_returning, delete_entry
+
+async def signup(database, email, source, created_at):
+    async with database.transaction():
+        row = await insert_returning(
+            database, {"name": "User", "email": email, "referral_source": source, "created_at": created_at}
+        )
+        await stats.record_signups(database, [row])
+    return row
+
+@pytest.mark.asyncio
+async def test_counters_follow_inserts_and_deletes(database_url):
+    """Test that the counters track inserts and deletes by hour, day and source"""
+    async with Database(database_url) as database:
+        first = await signup(database, "a@example.com", "twitter", datetime(2024, 5, 1, 9, 15))
+        await signup(database, "b@example.com", "twitter", datetime(2024, 5, 1, 17, 40))
+        await signup(database, "c@example.com", None, datetime(2024, 5, 2, 8, 0))
+        async with database.transaction():
+            await delete_entry(database, first["id"])
+            await stats.record_removals(database, [first])
+
+        totals = await stats.totals(database)
+        daily = await stats.series(database, "day")
+        hourly = await stats.series(database, "hour", referral_source="twitter")
+        report = await stats.check(database)
+
+    assert totals == {
+        "total": 2,
+        "by_source": [{"referral_source": None, "count": 1}, {"referral_source": "twitter", "count": 1}],
+    }
+    assert daily == [
+        {"bucket": datetime(2024, 5, 1), "referral_source": "twitter", "count": 1},
+        {"bucket": datetime(2024, 5, 2), "referral_source": None, "count": 1},
+    ]
+    assert hourly == [{"bucket": datetime(2024, 5, 1, 17), "referral_source": "twitter", "count": 1}]
+    assert report["consistent"], report
+
+@pytest.mark.asyncio
+async def test_check_finds_drift_and_rebuild_fixes_it(database_url):
+    """Test that the consistency check reports rows written without counters until a rebuild"""
+    async with Database(database_url) as database:
+        await signup(database, "a@example.com", "ads", datetime(2024, 5, 1, 9))
+        await insert_returning(database, {"name": "User", "email": "b@example.com", "referral_source": "ads"})
+        before = await stats.check(database)
+        await stats.rebuild(database)
+        after = await stats.check(database)
+        totals = await stats.totals(database)
+
+    assert not before["consistent"]
+    assert before["mismatch_count"] == 3
+    assert after["consistent"]
+    assert totals["total"] == 2
+
+@pytest.mark.asyncio
+async def test_batched_signups_and_imports_are_counted(database_url):
+    """Test that batched signups and bulk imports update the counters in their transactions"""
+    async with Database(database_url) as database:
+        batcher = SignupBatcher(database, stats=True)
+        await batcher.submit({"name": "User", "email": "a@example.com", "referral_source": "ads"})
+        await batcher.close()
+
+        async def lines():
+            yield b'{"name": "B", "email": "b@example.com", "referral_source": "import"}\n'
+            yield b'{"name": "A", "email": "a@example.com", "referral_source": "import"}\n'
+
+        await import_entries(database, iter_ndjson_records(lines()), on_conflict="update", stats=True)
+        totals = await stats.totals(database)
+        report = await stats.check(database)
+
+    assert totals == {"total": 2, "by_source": [{"referral_source": "import", "count": 2}]}
+    assert report["consistent"], report
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+from datetime import datetime
+from databases import Database
+from waitlist_service import stats
+from waitlist_service.batching import SignupBatcher
+from waitlist_service.positions import PositionIndex, sql_top
+from waitlist_service.queries import DuplicateEmailError, fetch_entry_by_email, fetch_page, update_returning
+from waitlist_service.ratelimit import Limit, MemoryLimitStore, RateLimiter
+from waitlist_service.referrals import fetch_leaderboard
+from waitlist_service.tenants import ListBudgets, WaitlistBudgetMiddleware, split_list_path
+
+def signup(waitlist, email, **values):
+    return {"waitlist": waitlist, "name": "User", "email": email, "created_at": datetime(2024, 1, 1), **values}
+
+@pytest.mark.asyncio
+async def test_lists_keep_their_own_emails_pages_stats_and_lines(database_url):
+    """Test that an email may join several lists once each and every read sees only its list"""
+    async with Database(database_url) as database:
+        batcher = SignupBatcher(database, stats=True)
+        launch, beta, *_ = await asyncio.gather(
+            batcher.submit(signup("launch", "a@example.com", referral_source="ads")),
+            batcher.submit(signup("beta", "a@example.com")),
+            batcher.submit(signup("beta", "b@example.com")),
+        )
+        with pytest.raises(DuplicateEmailError):
+            await batcher.submit(signup("beta", "a@example.com"))
+        await batcher.close()
+
+        assert (await fetch_entry_by_email(database, "a@example.com", "launch"))["id"] == launch["id"]
+        assert await fetch_entry_by_email(database, "b@example.com", "launch") is None
+        rows, _ = await fetch_page(database, 10, waitlist="beta")
+        assert {row["email"] for row in rows} == {"a@example.com", "b@example.com"}
+        assert await update_returning(database, launch["id"], {"name": "Moved"}, waitlist="beta") is None
+
+        assert await stats.totals(database, "launch") == {
+            "total": 1, "by_source": [{"referral_source": "ads", "count": 1}]
+        }
+        assert (await stats.totals(database, "beta"))["total"] == 2
+        assert (await stats.check(database))["consistent"]
+
+        index = PositionIndex(database)
+        await index.rebuild()
+        assert index.position(launch) == (1, 1)
+        assert index.position(beta) == (1, 2)
+        assert index.top(5, "beta") == await sql_top(database, 5, "beta")
+        assert index.top(5, "missing") == []
+        assert await fetch_leaderboard(database, 10, "launch") == []
+
+@pytest.mark.asyncio
+async def test_busy_list_is_turned_away_while_others_proceed():
+    """Test that a list at its concurrency budget rejects after the queue timeout without blocking other lists"""
+    release = asyncio.Event()
+    statuses = []
+
+    async def app(scope, receive, send):
+        if scope["path"].startswith("/lists/hot/"):
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    budgets = ListBudgets(max_concurrency=2, queue_timeout=0.05)
+    middleware = WaitlistBudgetMiddleware(app, budgets)
+
+    async def request(path):
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append((path, message["status"]))
+        await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, None, send)
+
+    hot = [asyncio.create_task(request("/lists/hot/waitlist/waitlist/")) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    await request("/waitlist/waitlist/")
+    await request("/lists/cold/waitlist/waitlist/1")
+    assert statuses == [
+        ("/lists/hot/waitlist/waitlist/", 503),
+        ("/waitlist/waitlist/", 200),
+        ("/lists/cold/waitlist/waitlist/1", 200),
+    ]
+    assert budgets.stats() == {"lists": {"hot": 2}, "rejected": 1}
+
+    release.set()
+    await asyncio.gather(*hot)
+    assert budgets.stats() == {"lists": {}, "rejected": 1}
+
+def test_split_list_path():
+    """Test that request paths map to their list and invalid list names to None"""
+    assert split_list_path("/waitlist/waitlist/") == ("default", "/waitlist/waitlist/")
+    assert split_list_path("/lists/beta-2/waitlist/waitlist/7") == ("beta-2", "/waitlist/waitlist/7")
+    assert split_list_path("/lists/Not Valid/waitlist/")[0] is None
+
+@pytest.mark.asyncio
+async def test_list_limit_is_shared_by_every_client_of_a_list():
+    """Test that one list's signup budget runs out across clients while other lists keep theirs"""
+    limiter = RateLimiter(
+        MemoryLimitStore(), ip_limit=Limit(0, 1), domain_limit=Limit(0, 1), list_limit=Limit(60, 2), allowlist=""
+    )
+    assert await limiter.check("203.0.113.1", "example.com", "launch") == 0
+    assert await limiter.check("203.0.113.2", "example.com", "launch") == 0
+    assert await limiter.check("203.0.113.3", "example.com", "launch") > 0
+    assert await limiter.check("203.0.113.3", "example.com", "beta") == 0
+    assert await limiter.check("203.0.113.3", "example.com") == 0
+
+def test_http_lists_are_isolated(client):
+    """Test that each /lists/{waitlist} path sees only its own list's entries, duplicates and stats"""
+    body = {"name": "User", "email": "a@example.com"}
+    default = client.post("/waitlist/waitlist/", json=body).json()
+    beta = client.post("/lists/beta/waitlist/waitlist/", json=body)
+    assert beta.status_code == 201
+    beta = beta.json()
+    assert beta["waitlist"] == "beta" and beta["id"] != default["id"]
+    assert client.post("/lists/beta/waitlist/waitlist/", json=body).status_code == 400
+
+    assert client.get(f"/lists/beta/waitlist/waitlist/{beta['id']}").status_code == 200
+    assert client.get(f"/waitlist/waitlist/{beta['id']}").status_code == 404
+    assert client.get(f"/lists/beta/waitlist/waitlist/{default['id']}").status_code == 404
+    assert client.delete(f"/waitlist/waitlist/{beta['id']}").status_code == 404
+    assert client.get(f"/lists/beta/waitlist/waitlist/{beta['id']}/position").json()["position"] == 1
+
+    client.post("/lists/beta/waitlist/waitlist/", json={"name": "User", "email": "b@example.com"})
+    assert [entry["id"] for entry in client.get("/waitlist/waitlist/").json()] == [default["id"]]
+    assert client.get("/waitlist/waitlist/stats").json()["total"] == 1
+    assert client.get("/lists/beta/waitlist/waitlist/stats").json()["total"] == 2